@@ -3,15 +3,48 @@ const params = new URLSearchParams(window.location.search);
 const room = (params.get("room") || "lobby").trim();
 
 // Socket.IO connection
+// Có thư viện MessagePack thì xin server gửi payload nhị phân (nhỏ hơn, parse nhanh hơn JSON)
 const socket = io("http://localhost:5000", {
   reconnection: true,
   reconnectionAttempts: Infinity,
   reconnectionDelay: 500,
+  auth: { wire: window.MessagePack ? "msgpack" : "json" },
+});
+
+// Payload nhị phân (msgpack) được giải mã trước khi tới handler; payload JSON giữ nguyên
+function decodeWire(data) {
+  if (data instanceof ArrayBuffer || ArrayBuffer.isView(data)) {
+    return MessagePack.decode(data);
+  }
+  return data;
+}
+
+const socketOn = socket.on.bind(socket);
+socket.on = (event, handler) => socketOn(event, (data, ...rest) => handler(decodeWire(data), ...rest));
+
+// Server chạy profile websocket-only từ chối long-polling: kết nối lại thẳng bằng WebSocket
+socket.on("connect_error", () => {
+  const transports = socket.io.opts.transports || ["polling", "websocket"];
+  if (transports[0] === "polling") {
+    socket.io.opts.transports = ["websocket"];
+  }
+});
+
+// Báo server khi đã nâng cấp từ long-polling lên WebSocket (server đo độ trễ nâng cấp)
+socket.io.on("open", () => {
+  socket.io.engine.once("upgrade", () => socket.emit("transport_upgraded"));
 });
 
 let username;
 let currentRoom = room;
 let isAdmin = false;
+// Version danh sách phòng đang hiển thị: server trả "not_modified" nếu không đổi
+let roomsListVersion = null;
+// create_room/join_room đang chờ trả lời (gửi lại sau khi chuyển worker)
+let pendingRoomRequest = null;
+// Bảng điểm/người chơi dựng từ snapshot room_info rồi cập nhật bằng các delta có seq
+let roomState = null;
+let roomSyncPending = false;
 
 // Save game state to localStorage
 function saveGameState() {
@@ -88,10 +121,10 @@ function showStatus(message, type = "info", target = "both") {
 // Show available rooms
 function showAvailableRooms() {
   if (socket.connected) {
-    socket.emit("get_available_rooms");
+    socket.emit("get_available_rooms", { version: roomsListVersion });
   } else {
     socket.on("connect", () => {
-      socket.emit("get_available_rooms");
+      socket.emit("get_available_rooms", { version: roomsListVersion });
     });
   }
 }
@@ -190,7 +223,7 @@ function createRoom() {
     password: password || null
   };
   
-  socket.emit("create_room", roomData);
+  emitRoomRequest("create_room", roomData);
   
   closeModal(createRoomModal);
 }
@@ -208,13 +241,19 @@ function joinRoom() {
   
   const password = roomPasswordInput ? roomPasswordInput.value : null;
   
-  socket.emit("join_room", {
+  emitRoomRequest("join_room", {
     room_id: roomId,
     player_name: playerName,
     password: password
   });
 }
 
+// Gửi create_room/join_room và nhớ lại để gửi lại nếu server trả room_redirect
+function emitRoomRequest(event, payload) {
+  pendingRoomRequest = { event, payload };
+  socket.emit(event, payload);
+}
+
 // Leave room
 function leaveRoom() {
   
@@ -233,6 +272,7 @@ function switchToJoinScreen() {
   username = "";
   currentRoom = "";
   isAdmin = false;
+  roomState = null;
   
   // Clear inputs
   document.getElementById("username").value = "";
@@ -329,16 +369,18 @@ function resetRoom() {
 }
 
 // Update leaderboard
-function updateLeaderboard(scores) {
+// Server gửi sẵn top-N đã xếp hạng (leaderboard) và hạng của người chơi (player_rank)
+function updateLeaderboard(data) {
   if (!leaderboardList) return;
   
   leaderboardList.innerHTML = '';
   
-  const sortedPlayers = Object.entries(scores)
+  // Server cũ chỉ gửi scores {tên: điểm}: tự sắp xếp
+  const topPlayers = data.leaderboard || Object.entries(data.scores || {})
     .sort(([,a], [,b]) => b - a)
     .map(([name, score], index) => ({ name, score, rank: index + 1 }));
   
-  sortedPlayers.forEach((player, index) => {
+  topPlayers.forEach((player) => {
     const li = document.createElement('li');
     li.innerHTML = `
       <span class="player-name">${player.name}</span>
@@ -347,6 +389,69 @@ function updateLeaderboard(scores) {
     `;
     leaderboardList.appendChild(li);
   });
+  
+  // Hạng của mình khi nằm ngoài top-N
+  const mine = data.player_rank;
+  if (mine && mine.name === username && !topPlayers.some(p => p.name === mine.name)) {
+    const li = document.createElement('li');
+    li.innerHTML = `
+      <span class="player-name">${mine.name}</span>
+      <span class="score">${mine.score}</span>
+      <span class="streak">#${mine.rank}</span>
+    `;
+    leaderboardList.appendChild(li);
+  }
+}
+
+// Snapshot đầy đủ (room_joined/room_info): bắt đầu lại trạng thái phòng
+function resetRoomState(info) {
+  roomState = {
+    epoch: info.epoch,
+    seq: info.seq,
+    scores: Object.assign({}, info.scores),
+    players: new Set((info.players || []).map((p) => p.name))
+  };
+}
+
+// Xin server các delta còn thiếu (hoặc snapshot đầy đủ nếu đã tụt quá xa)
+function requestRoomSync() {
+  if (!currentRoom || roomSyncPending) return;
+  roomSyncPending = true;
+  const payload = { room_id: currentRoom };
+  if (roomState) {
+    payload.since_seq = roomState.seq;
+    payload.epoch = roomState.epoch;
+  }
+  socket.emit("get_room_info", payload);
+}
+
+// Áp các delta theo thứ tự seq; delta đã áp thì bỏ qua, thiếu delta thì xin bù
+function applyRoomChanges(data) {
+  if (!roomState || !data.changes) return;
+  if (data.epoch !== roomState.epoch) {
+    roomState = null;
+    requestRoomSync();
+    return;
+  }
+  const changes = data.changes.slice().sort((a, b) => a.seq - b.seq);
+  let changed = false;
+  for (const change of changes) {
+    if (change.seq <= roomState.seq) continue;
+    if (change.seq !== roomState.seq + 1 || change.reset) {
+      // Thiếu delta ở giữa, hoặc phòng bị reset: cần đồng bộ lại
+      if (change.reset) roomState = null;
+      requestRoomSync();
+      break;
+    }
+    (change.joined || []).forEach((name) => roomState.players.add(name));
+    (change.left || []).forEach((name) => roomState.players.delete(name));
+    Object.assign(roomState.scores, change.scores || {});
+    roomState.seq = change.seq;
+    changed = changed || Boolean(change.scores);
+  }
+  if (changed && roomState) {
+    updateLeaderboard({ scores: roomState.scores });
+  }
 }
 
 // Update round info
@@ -504,6 +609,8 @@ socket.on("room_joined", (data) => {
   }
   
   if (data.room_info) {
+    resetRoomState(data.room_info);
+
     if (data.room_info.round_number) {
       document.getElementById("round-number").textContent = data.room_info.round_number;
     }
@@ -523,7 +630,7 @@ socket.on("room_joined", (data) => {
     
     // Update leaderboard
     if (data.room_info.scores) {
-      updateLeaderboard(data.room_info.scores);
+      updateLeaderboard(data.room_info);
     }
     
     // Update online count
@@ -541,11 +648,66 @@ socket.on("room_joined", (data) => {
   saveGameState();
 });
 
+// Chạy nhiều worker: phòng nằm ở worker khác -> chuyển socket sang đó rồi gửi lại yêu cầu
+socket.on("room_redirect", (data) => {
+  const request = pendingRoomRequest;
+  pendingRoomRequest = null;
+  if (!request || socket.io.uri === data.url) {
+    return;
+  }
+  socket.io.uri = data.url;
+  socket.once("connect", () => emitRoomRequest(request.event, request.payload));
+  socket.disconnect();
+  socket.connect();
+});
+
 socket.on("join_error", (data) => {
   showStatus(data.error, "error", "join");
 });
 
-socket.on("player_joined", (data) => {
+// Sự kiện của phòng: nhận riêng lẻ hoặc nằm trong "room_batch" khi server gom theo tick
+const roomEventHandlers = {};
+
+function onRoomEvent(event, handler) {
+  roomEventHandlers[event] = handler;
+  socket.on(event, handler);
+}
+
+socket.on("room_batch", (batch) => {
+  // Các mục trong lô có thể không theo thứ tự seq (presence được gộp): áp delta của cả lô trước
+  const withState = batch.events.map(([, data]) => data).filter((data) => data && data.changes);
+  if (withState.length) {
+    applyRoomChanges({
+      epoch: withState[0].epoch,
+      changes: [].concat(...withState.map((data) => data.changes))
+    });
+  }
+  batch.events.forEach(([event, data]) => {
+    const handler = roomEventHandlers[event];
+    if (handler) {
+      handler(data);
+    }
+  });
+});
+
+// Vào/rời phòng trong cùng một tick được server gộp lại
+roomEventHandlers.presence = (data) => {
+  data.joined.forEach((name) => addChatMessage({
+    player_name: "Hệ thống",
+    message: `${name} đã tham gia phòng`
+  }));
+  data.left.forEach((name) => addChatMessage({
+    player_name: "Hệ thống",
+    message: `${name} đã rời phòng`
+  }));
+  if (typeof data.current_players === "number") {
+    updateOnlineCount(data.current_players);
+  }
+  applyRoomChanges(data);
+};
+
+onRoomEvent("player_joined", (data) => {
+  applyRoomChanges(data);
   addChatMessage({
     player_name: "Hệ thống",
     message: `${data.player_name} đã tham gia phòng`
@@ -559,7 +721,8 @@ socket.on("player_joined", (data) => {
   }
 });
 
-socket.on("player_left", (data) => {
+onRoomEvent("player_left", (data) => {
+  applyRoomChanges(data);
   addChatMessage({
     player_name: "Hệ thống",
     message: `${data.player_name} đã rời phòng`
@@ -574,7 +737,8 @@ socket.on("player_left", (data) => {
 });
 
 socket.on("new_round", (data) => {
-  
+  applyRoomChanges(data);
+
   updateRoundInfo(data);
   
   addChatMessage({
@@ -607,7 +771,7 @@ socket.on("guess_error", (data) => {
   showStatus(data.error, "error", "game");
 });
 
-socket.on("chat_message", (data) => {
+onRoomEvent("chat_message", (data) => {
   addChatMessage(data);
 });
 
@@ -615,11 +779,39 @@ socket.on("chat_error", (data) => {
   showStatus(data.error, "error", "game");
 });
 
-socket.on("scoreboard_updated", (data) => {
-  updateLeaderboard(data.scores);
+onRoomEvent("scoreboard_updated", (data) => {
+  // Server chỉ gửi delta điểm, bảng điểm được gộp trong roomState
+  applyRoomChanges(data);
 });
 
-socket.on("room_reset", (data) => {
+// Trả lời get_room_info: các delta còn thiếu hoặc snapshot đầy đủ
+socket.on("room_info", (data) => {
+  roomSyncPending = false;
+  if (data.changes) {
+    applyRoomChanges(data);
+    return;
+  }
+  resetRoomState(data);
+  updateLeaderboard(data);
+  if (data.current_players !== undefined) {
+    updateOnlineCount(data.current_players);
+  }
+  if (data.current_round) {
+    updateRoundInfo({
+      round_number: data.round_number,
+      range: data.current_round.range,
+      end_time: data.current_round.end_time
+    });
+    document.getElementById("total-guesses").textContent = data.current_round.total_guesses;
+  }
+});
+
+socket.on("room_info_error", (data) => {
+  roomSyncPending = false;
+  showStatus(data.error, "error", "game");
+});
+
+onRoomEvent("room_reset", (data) => {
   showStatus(data.message, "info", "game");
   
   // Reset UI
@@ -637,6 +829,9 @@ socket.on("room_reset", (data) => {
 });
 
 socket.on("available_rooms", (data) => {
+  // Danh sách đang hiển thị vẫn là bản mới nhất
+  if (data.not_modified) return;
+  roomsListVersion = data.version;
   updateRoomsList(data.rooms);
 });
 
@@ -726,9 +921,8 @@ document.addEventListener("DOMContentLoaded", () => {
   
   if (refreshScoresBtn) {
     refreshScoresBtn.addEventListener("click", () => {
-      if (currentRoom) {
-        socket.emit("get_room_info", { room_id: currentRoom });
-      }
+      // Chỉ nhận các thay đổi kể từ lần đồng bộ trước
+      requestRoomSync();
     });
   }
   
@@ -0,0 +1,373 @@
+"""
+Chế độ phục vụ asyncio: python-socketio AsyncServer trên ASGI (chạy bằng uvicorn)
+Cùng giao thức sự kiện (kể cả các event cũ) và các REST route như server.py, nhưng
+mỗi kết nối chỉ là một coroutine thay vì một thread nên giữ được hàng chục nghìn socket.
+- Socket handler của server.py được dùng lại nguyên vẹn: chạy trong executor riêng
+  (GameManager là code đồng bộ) để không chặn event loop.
+- AsyncTransport thay cho SocketTransport: emit/enter_room được đẩy về event loop
+  một cách thread-safe nên round scheduler và cleanup thread vẫn broadcast được.
+Chạy: python start_server.py --async-mode asyncio (cần: pip install uvicorn)
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+import socketio
+
+import server
+from bus import create_bus_manager
+from server import GAME_CONFIG
+
+try:
+    import uvicorn
+except ImportError:  # uvicorn chỉ cần khi chạy --async-mode asyncio
+    uvicorn = None
+
+logger = logging.getLogger(__name__)
+
+# Event -> tên handler trong server.py (lấy lúc gọi để patch/thay handler vẫn có hiệu lực)
+SOCKET_EVENTS = {
+    'create_room': 'on_create_room',
+    'join_room': 'on_join_room',
+    'join': 'on_join_legacy',
+    'leave_room': 'on_leave_room',
+    'make_guess': 'on_make_guess',
+    'guess': 'on_guess_legacy',
+    'chat_message': 'on_chat_message',
+    'chat': 'on_chat_legacy',
+    'reset_room': 'on_reset_room',
+    'get_room_info': 'on_get_room_info',
+    'get_global_leaderboard': 'on_get_global_leaderboard',
+    'get_available_rooms': 'on_get_available_rooms',
+    'transport_upgraded': 'on_transport_upgraded',
+}
+
+
+class AsyncTransport(server.SocketTransport):
+    """SocketTransport cho AsyncServer: gọi được từ bất kỳ thread nào.
+    sid của client đang được xử lý gắn theo thread (executor gắn trước khi gọi handler)."""
+
+    def __init__(self, sio: socketio.AsyncServer):
+        self.sio = sio
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._local = threading.local()
+
+    def bind(self, sid: Optional[str]):
+        self._local.sid = sid
+
+    def current_sid(self) -> str:
+        sid = getattr(self._local, 'sid', None)
+        if sid is None:
+            raise RuntimeError("No socket client bound to this thread")
+        return sid
+
+    def _submit(self, coro):
+        if self.loop is None or self.loop.is_closed():
+            coro.close()
+            logger.warning("Async transport is not running, dropping socket event")
+            return
+        # Các coroutine được xếp lên loop theo đúng thứ tự gọi
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Async socket send failed: {future.exception()}")
+
+    def emit_to(self, event, data, to=None, **kwargs):
+        self._submit(self.sio.emit(event, data, to=to, **kwargs))
+
+    def _reply(self, event, data):
+        self.emit_to(event, data, to=self.current_sid())
+
+    def _join(self, room_id):
+        self._submit(self.sio.enter_room(self.current_sid(), room_id))
+
+    def sio_server(self):
+        return self.sio
+
+    def disconnect_client(self, sid: str):
+        self._submit(self.sio.disconnect(sid, ignore_queue=True))
+
+
+def _json_response(payload, status: int = 200, headers: Optional[Dict[str, str]] = None):
+    body = payload if isinstance(payload, (bytes, str)) else json.dumps(payload, ensure_ascii=False)
+    return status, body.encode('utf-8') if isinstance(body, str) else body, headers or {}
+
+
+def _int_arg(query: Dict[str, list], name: str, default: int, low: int, high: int) -> int:
+    """Như request.args.get(name, default, type=int) của Flask, rồi kẹp vào [low, high]"""
+    try:
+        value = int(query[name][0]) if name in query else default
+    except ValueError:
+        value = default
+    return min(max(value, low), high)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate.strip('"') == etag:
+            return True
+    return False
+
+
+class RestApp:
+    """Các REST route của server.py viết thẳng trên ASGI (không cần thêm framework).
+    Mọi lệnh gọi GameManager đi qua run() để chạy trong executor của game."""
+
+    ROUTES = [
+        ('GET', re.compile(r'^/$'), 'home'),
+        ('GET', re.compile(r'^/api/route$'), 'route'),
+        ('GET', re.compile(r'^/api/rooms$'), 'rooms'),
+        ('POST', re.compile(r'^/api/rooms$'), 'create_room'),
+        ('GET', re.compile(r'^/api/rooms/([^/]+)$'), 'room_info'),
+        ('GET', re.compile(r'^/api/rooms/([^/]+)/history$'), 'room_history'),
+        ('GET', re.compile(r'^/api/rooms/([^/]+)/leaderboard$'), 'room_leaderboard'),
+        ('GET', re.compile(r'^/api/leaderboard$'), 'global_leaderboard'),
+        ('GET', re.compile(r'^/api/leaderboard/scores$'), 'global_scores'),
+        ('GET', re.compile(r'^/api/stats$'), 'stats'),
+    ]
+
+    CORS_HEADERS = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+    def __init__(self, run: Callable):
+        self.run = run
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        method = scope['method']
+        path = scope['path']
+        raw_query = scope.get('query_string', b'').decode('latin-1')
+        query = parse_qs(raw_query)
+        # Đường dẫn gốc (chưa giải mã) để redirect tới worker khác giữ nguyên URL
+        target = scope.get('raw_path', path.encode('utf-8')).decode('latin-1') + (f"?{raw_query}" if raw_query else '')
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope.get('headers', [])}
+
+        if method == 'OPTIONS':
+            response = (204, b'', {})
+        else:
+            response = None
+            for route_method, pattern, name in self.ROUTES:
+                match = pattern.match(path)
+                if match and route_method == method:
+                    body = await self._read_body(receive) if method == 'POST' else b''
+                    try:
+                        response = await getattr(self, name)(*match.groups(), query=query, headers=headers,
+                                                              body=body, target=target)
+                    except Exception as e:
+                        logger.error(f"Internal server error: {e}")
+                        response = _json_response({'error': 'Internal server error'}, 500)
+                    break
+            if response is None:
+                response = _json_response({'error': 'Not found'}, 404)
+
+        status, body, extra_headers = response
+        response_headers = dict(self.CORS_HEADERS)
+        if body:
+            response_headers['Content-Type'] = 'application/json'
+        response_headers.update(extra_headers)
+        response_headers['Content-Length'] = str(len(body))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response_headers.items()]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def home(self, **_):
+        return _json_response(server.server_info())
+
+    async def route(self, query, **_):
+        room_id = query.get('room', [''])[0].strip()
+        if not room_id:
+            return _json_response({"error": "ID phòng không được để trống"}, 400)
+        if server.cluster is None:
+            return _json_response({"room_id": server.normalize_room_id(room_id), "worker": 0, "url": None})
+        return _json_response(server.cluster.route(room_id))
+
+    @staticmethod
+    def _redirect_to_owner(room_id: str, target: str):
+        """Như redirect_to_owner của server.py: 307 tới worker sở hữu phòng, None nếu ở đây"""
+        route = server.room_route(room_id)
+        if route is None:
+            return None
+        return 307, b'', {'Location': route['url'] + target}
+
+    async def rooms(self, headers, query, **_):
+        listing = server.listing_for_scope(query.get('scope', [None])[0])
+        version, body = await self.run(listing.payload)
+        etag = f"rooms-{version}"
+        etag_header = {'ETag': f'"{etag}"'}
+        if _etag_matches(headers.get('if-none-match', ''), etag):
+            return 304, b'', etag_header
+        return _json_response(body, 200, etag_header)
+
+    async def create_room(self, body, **_):
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return _json_response({'error': 'Dữ liệu không hợp lệ'}, 400)
+        payload, status = await self.run(server.create_room_from_api, data)
+        if status == 307:
+            return 307, b'', {'Location': payload['url'] + '/api/rooms'}
+        return _json_response(payload, status)
+
+    async def room_info(self, room_id, target, **_):
+        owner = self._redirect_to_owner(room_id, target)
+        if owner:
+            return owner
+        room_info = await self.run(server.game_manager.get_room_info, room_id)
+        if room_info:
+            return _json_response(room_info)
+        return _json_response({"error": "Phòng không tồn tại"}, 404)
+
+    async def room_history(self, room_id, query, target, **_):
+        owner = self._redirect_to_owner(room_id, target)
+        if owner:
+            return owner
+        limit = _int_arg(query, 'limit', 10, 1, 100)
+        history = await self.run(server.game_manager.get_room_history, room_id, limit)
+        if history is None:
+            return _json_response({"error": "Phòng không tồn tại"}, 404)
+        return _json_response({"room_id": room_id, "history": history})
+
+    async def room_leaderboard(self, room_id, query, target, **_):
+        owner = self._redirect_to_owner(room_id, target)
+        if owner:
+            return owner
+        limit = _int_arg(query, 'limit', GAME_CONFIG['LEADERBOARD_SIZE'], 1, 100)
+        radius = _int_arg(query, 'radius', 2, 0, 10)
+        player = query.get('player', [None])[0]
+        leaderboard = await self.run(server.game_manager.get_leaderboard, room_id, limit, player, radius)
+        if leaderboard is None:
+            return _json_response({"error": "Phòng không tồn tại"}, 404)
+        return _json_response(leaderboard)
+
+    async def global_leaderboard(self, query, **_):
+        limit = _int_arg(query, 'limit', GAME_CONFIG['LEADERBOARD_SIZE'], 1, 100)
+        player = query.get('player', [None])[0]
+        return _json_response(await self.run(server.game_manager.get_global_leaderboard, limit, player,
+                                             server.global_ranking))
+
+    async def global_scores(self, headers, **_):
+        version, body = await self.run(server.global_leaderboard_payload)
+        etag = f"scores-{version}"
+        etag_header = {'ETag': f'"{etag}"'}
+        if _etag_matches(headers.get('if-none-match', ''), etag):
+            return 304, b'', etag_header
+        return _json_response(body, 200, etag_header)
+
+    async def stats(self, **_):
+        return _json_response(await self.run(server.server_stats))
+
+
+class AsyncGameServer:
+    """AsyncServer + REST trên một ASGI app (self.app).
+    GameManager chạy trong một executor riêng: mặc định một thread nên các handler
+    được xử lý tuần tự theo thứ tự tới, event loop chỉ lo I/O của các kết nối."""
+
+    def __init__(self, game_workers: int = 1):
+        # always_connect: gói CONNECT được gửi trước khi chạy on_connect,
+        # nên 'connected' mà handler emit luôn tới sau khi client đã vào namespace
+        bus_manager = create_bus_manager(GAME_CONFIG['BROADCAST_BUS'], GAME_CONFIG['BUS_TICK_MS'], async_mode=True)
+        self.sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', always_connect=True,
+                                        client_manager=bus_manager, **server.engine_config.server_options())
+        if bus_manager is not None:
+            # /api/stats báo số liệu của bus đang thực sự dùng
+            server.broadcast_bus = bus_manager
+        self.executor = ThreadPoolExecutor(max_workers=game_workers, thread_name_prefix='game')
+        self.transport = AsyncTransport(self.sio)
+        self.rest = RestApp(self.run)
+        self.app = socketio.ASGIApp(self.sio, other_asgi_app=self.rest,
+                                    on_startup=self.start, on_shutdown=self.stop)
+        self._register_handlers()
+
+    def start(self):
+        """Gắn transport vào event loop đang chạy (lifespan startup của ASGI)"""
+        self.transport.loop = asyncio.get_running_loop()
+        server.set_transport(self.transport)
+        logger.info("Async transport started")
+
+    def stop(self):
+        if server.transport is self.transport:
+            server.set_transport(server.SocketTransport())
+        self.transport.loop = None
+        self.executor.shutdown(wait=True)
+        logger.info("Async transport stopped")
+
+    async def run(self, func, *args, sid: Optional[str] = None):
+        """Chạy một lệnh gọi đồng bộ (GameManager, socket handler) trong executor của game"""
+        if self.transport.loop is None:
+            # Server ASGI không gửi lifespan: gắn transport ở lần gọi đầu tiên
+            self.start()
+        return await self.transport.loop.run_in_executor(self.executor, self._call, func, args, sid)
+
+    def _call(self, func, args: Tuple, sid: Optional[str]):
+        self.transport.bind(sid)
+        try:
+            return func(*args)
+        finally:
+            self.transport.bind(None)
+
+    async def dispatch(self, handler_name: str, sid: str, *args):
+        """Gọi socket handler handler_name của server.py thay cho client sid"""
+        try:
+            await self.run(getattr(server, handler_name), *args, sid=sid)
+        except Exception as e:
+            logger.error(f"Socket handler {handler_name} failed for {sid}: {e}")
+
+    def _register_handlers(self):
+        async def connect(sid, environ, auth=None):
+            await self.dispatch('on_connect', sid, auth)
+
+        async def disconnect(sid, *reason):
+            await self.dispatch('on_disconnect', sid)
+
+        self.sio.on('connect', connect)
+        self.sio.on('disconnect', disconnect)
+        for event, handler_name in SOCKET_EVENTS.items():
+            self.sio.on(event, self._event_handler(handler_name))
+
+    def _event_handler(self, handler_name: str):
+        async def handle(sid, *args):
+            await self.dispatch(handler_name, sid, *args)
+        return handle
+
+
+def run(host: str = '0.0.0.0', port: int = 5000, log_level: str = 'info'):
+    """Khởi động server ở chế độ asyncio (chặn tới khi dừng)"""
+    if uvicorn is None:
+        raise RuntimeError("Async mode requires uvicorn: pip install uvicorn")
+    game_server = AsyncGameServer()
+    # backlog lớn để chịu được đợt kết nối lại hàng loạt; nhớ tăng `ulimit -n` khi giữ >10k socket
+    # uvicorn tự nén WebSocket (không có ngưỡng theo kích thước); ngưỡng chỉ áp dụng cho long-polling
+    uvicorn.run(game_server.app, host=host, port=port, log_level=log_level,
+                lifespan='on', backlog=4096, ws_per_message_deflate=server.engine_config.deflate)
@@ -0,0 +1,155 @@
+"""
+Phát hiện client chậm (slow consumer) và giảm tải broadcast của phòng cho client đó
+Mỗi `interval` giây đọc độ sâu hàng đợi gửi của từng kết nối (số packet Engine.IO chưa ghi ra socket):
+- độ sâu >= lag_threshold: client bị coi là chậm, các sự kiện chỉ mang trạng thái (bảng điểm, vào/rời,
+  room_batch chỉ gồm các mục đó) không gửi thêm cho nó - snapshot/delta sau chứa đủ phần bị bỏ.
+  Chat và room_reset không có trong snapshot nên vẫn được gửi, kể cả khi nằm trong room_batch
+- hàng đợi rút xuống nửa ngưỡng: hết chậm. Policy 'snapshot' gửi ngay snapshot mới nhất của phòng,
+  policy 'drop' để client tự đồng bộ lại khi thấy thiếu delta (xem get_room_changes)
+- độ sâu >= disconnect_threshold (> 0): ngắt kết nối, client tự kết nối lại và nhận trạng thái mới
+Sự kiện cần cho luật chơi (new_round, guess_result...) không bao giờ bị bỏ.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sự kiện (và mục trong room_batch) mà snapshot phòng / delta sau thay thế hoàn toàn
+SHEDDABLE_EVENTS = frozenset({'player_joined', 'player_left', 'presence', 'scoreboard_updated'})
+POLICIES = ('drop', 'snapshot')
+
+
+class SlowConsumers:
+    """Theo dõi hàng đợi gửi theo kết nối và theo phòng.
+    sample() trả về {sid: độ sâu}, room_of(sid) trả về phòng của client (None nếu chưa vào phòng);
+    recover(sid, room_id) và disconnect(sid) là hành động khi client hết chậm / vượt ngưỡng ngắt."""
+
+    def __init__(self, sample: Callable[[], Dict[str, int]], room_of: Callable[[str], Optional[str]],
+                 recover: Callable[[str, str], None], disconnect: Callable[[str], None],
+                 lag_threshold: int = 64, disconnect_threshold: int = 0, policy: str = 'snapshot',
+                 interval: float = 0.5):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.sample = sample
+        self.room_of = room_of
+        self.recover = recover
+        self.disconnect = disconnect
+        self.lag_threshold = lag_threshold
+        self.disconnect_threshold = disconnect_threshold
+        self.policy = policy
+        self.interval = interval
+        self.lagging: Dict[str, Optional[str]] = {}  # sid -> room_id
+        self.rooms: Dict[str, dict] = {}             # room_id -> hàng đợi của phòng ở lần đo gần nhất
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            'samples': 0,
+            'lagged': 0,
+            'recovered': 0,
+            'dropped_events': 0,
+            'snapshots': 0,
+            'disconnects': 0,
+            'max_depth': 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.lag_threshold > 0
+
+    def start(self):
+        """Khởi động thread đo (gọi nhiều lần không sao)"""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-consumers', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Slow consumer check failed: {e}")
+
+    @staticmethod
+    def sheddable(event: str, data: Optional[dict] = None) -> bool:
+        """room_batch chỉ bỏ được khi mọi mục trong lô đều là trạng thái"""
+        if event == 'room_batch':
+            return all(queued in SHEDDABLE_EVENTS for queued, _ in (data or {}).get('events', []))
+        return event in SHEDDABLE_EVENTS
+
+    def shed(self, event: str, to: Optional[str], data: Optional[dict] = None) -> Set[str]:
+        """Các client chậm không nhận emit này (to = room, sid hoặc None = mọi client)"""
+        if not self.lagging or not self.sheddable(event, data):
+            return set()
+        with self._lock:
+            if to in self.lagging:
+                shed = {to}
+            elif to is None:
+                shed = set(self.lagging)
+            else:
+                shed = {sid for sid, room_id in self.lagging.items() if room_id == to}
+            self.stats['dropped_events'] += len(shed)
+        return shed
+
+    def update(self, depths: Dict[str, int]) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """Cập nhật theo một lần đo; trả về (client hết chậm kèm phòng, client cần ngắt)"""
+        recovered, disconnect = [], []
+        rooms: Dict[str, dict] = {}
+        with self._lock:
+            self.stats['samples'] += 1
+            for sid in [sid for sid in self.lagging if sid not in depths]:
+                del self.lagging[sid]  # đã ngắt kết nối
+            for sid, depth in depths.items():
+                room_id = self.room_of(sid)
+                if depth > self.stats['max_depth']:
+                    self.stats['max_depth'] = depth
+                if 0 < self.disconnect_threshold <= depth:
+                    self.lagging.pop(sid, None)
+                    disconnect.append(sid)
+                elif depth >= self.lag_threshold:
+                    if sid not in self.lagging:
+                        self.stats['lagged'] += 1
+                    self.lagging[sid] = room_id
+                elif sid in self.lagging and depth <= self.lag_threshold // 2:
+                    del self.lagging[sid]
+                    self.stats['recovered'] += 1
+                    if room_id is not None:
+                        recovered.append((sid, room_id))
+                if room_id is not None:
+                    room = rooms.setdefault(room_id, {'clients': 0, 'queued': 0, 'max_depth': 0, 'lagging': 0})
+                    room['clients'] += 1
+                    room['queued'] += depth
+                    room['max_depth'] = max(room['max_depth'], depth)
+                    room['lagging'] += sid in self.lagging
+            self.rooms = rooms
+        return recovered, disconnect
+
+    def check(self):
+        """Đo một lần rồi áp dụng policy"""
+        recovered, disconnect = self.update(self.sample())
+        for sid in disconnect:
+            logger.warning(f"Disconnecting slow client {sid}: send queue over {self.disconnect_threshold} packets")
+            self.stats['disconnects'] += 1
+            self.disconnect(sid)
+        if self.policy == 'snapshot':
+            for sid, room_id in recovered:
+                self.stats['snapshots'] += 1
+                self.recover(sid, room_id)
+
+    def get_stats(self, top: int = 10) -> dict:
+        """Số liệu chung và các phòng có nhiều packet chờ gửi nhất"""
+        with self._lock:
+            rooms = sorted(self.rooms.items(), key=lambda item: item[1]['queued'], reverse=True)[:top]
+            return dict(self.stats, policy=self.policy, lag_threshold=self.lag_threshold,
+                        disconnect_threshold=self.disconnect_threshold, lagging=len(self.lagging),
+                        rooms={room_id: dict(room) for room_id, room in rooms})
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
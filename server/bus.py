@@ -0,0 +1,473 @@
+"""
+Bus phát sự kiện Socket.IO giữa các tiến trình server
+Khi chạy nhiều worker, socketio.emit(..., to=room_id) chỉ tới client của tiến trình hiện tại;
+BusManager (client_manager của python-socketio) chuyển mọi emit tới các tiến trình khác.
+- LocalBroker: broker nhỏ trên Unix socket, đi kèm dự án (Supervisor tự khởi động)
+- RedisBackend: dùng PUBLISH/SUBSCRIBE của Redis (giao thức RESP, không cần thư viện redis)
+- BroadcastBus: gom các publish trong một tick thành một frame, đo độ trễ publish -> nhận
+URL: unix:///tmp/guess-number-bus.sock hoặc redis://host:6379
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('>I')  # độ dài payload, big-endian
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+BYTES_KEY = '__bytes__'             # giá trị bytes trong message (payload msgpack, xem wire.py)
+
+
+class BusError(ConnectionError):
+    """Broker đóng kết nối hoặc trả lỗi"""
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(reader) -> Optional[bytes]:
+    """Đọc một frame từ sock.makefile('rb'), None khi kết nối đã đóng"""
+    header = reader.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise BusError(f"Frame too large: {size} bytes")
+    payload = reader.read(size)
+    if len(payload) < size:
+        return None
+    return payload
+
+
+def _encode_bytes(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return {BYTES_KEY: base64.b64encode(obj).decode('ascii')}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode_bytes(obj: dict):
+    if len(obj) == 1 and BYTES_KEY in obj:
+        return base64.b64decode(obj[BYTES_KEY])
+    return obj
+
+
+class LocalBroker:
+    """Broker trên Unix socket: frame nhận từ một kết nối được chuyển tới mọi kết nối khác"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.stats = {'connections': 0, 'frames': 0, 'bytes': 0}
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # socket còn sót từ lần chạy trước
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(64)
+        threading.Thread(target=self._accept_loop, name='bus-broker', daemon=True).start()
+        logger.info(f"Local broadcast broker listening on {self.path}")
+        return self
+
+    def _accept_loop(self):
+        while not self._stopped:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            with self._lock:
+                self._clients.add(conn)
+                self.stats['connections'] = len(self._clients)
+            threading.Thread(target=self._serve, args=(conn,), name='bus-broker-conn', daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        reader = conn.makefile('rb')
+        try:
+            while True:
+                frame = recv_frame(reader)
+                if frame is None:
+                    break
+                self._fanout(conn, frame)
+        except (OSError, BusError) as e:
+            logger.warning(f"Broker connection failed: {e}")
+        finally:
+            with self._lock:
+                self._clients.discard(conn)
+                self.stats['connections'] = len(self._clients)
+            conn.close()
+
+    def _fanout(self, sender: socket.socket, frame: bytes):
+        data = FRAME_HEADER.pack(len(frame)) + frame
+        # Gửi dưới khóa để frame từ hai kết nối không bị xen byte vào nhau
+        with self._lock:
+            self.stats['frames'] += 1
+            self.stats['bytes'] += len(frame)
+            for client in list(self._clients):
+                if client is sender:
+                    continue
+                try:
+                    client.sendall(data)
+                except OSError:
+                    self._clients.discard(client)
+
+    def stop(self):
+        self._stopped = True
+        if self._server is not None:
+            self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class UnixSocketBackend:
+    """Một kết nối tới LocalBroker dùng cho cả publish lẫn nhận; tự kết nối lại khi broker khởi động lại"""
+
+    RETRY_DELAY = 0.5
+
+    def __init__(self, path: str):
+        self.path = path
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()       # kết nối + gửi
+
+    def _connect(self):
+        # Gọi khi đang giữ self._lock
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._sock, self._reader = sock, sock.makefile('rb')
+        return self._sock
+
+    def _reset(self, sock):
+        with self._lock:
+            if self._sock is sock and sock is not None:
+                self._sock.close()
+                self._sock = self._reader = None
+
+    def publish(self, payload: bytes):
+        sock = None
+        try:
+            with self._lock:
+                sock = self._connect()
+                send_frame(sock, payload)
+        except OSError as e:
+            self._reset(sock)
+            raise BusError(f"Broker connection failed: {e}")
+
+    def receive(self) -> bytes:
+        while True:
+            try:
+                with self._lock:
+                    sock = self._connect()
+                    reader = self._reader
+            except OSError as e:
+                logger.warning(f"Broadcast broker unavailable ({e}), retrying")
+                time.sleep(self.RETRY_DELAY)
+                continue
+            try:
+                frame = recv_frame(reader)
+            except (OSError, ValueError):
+                frame = None
+            if frame is not None:
+                return frame
+            self._reset(sock)
+            time.sleep(self.RETRY_DELAY)
+
+    def close(self):
+        self._reset(self._sock)
+
+
+class RedisError(BusError):
+    pass
+
+
+def encode_command(*parts) -> bytes:
+    """Lệnh Redis dạng mảng RESP"""
+    out = [b'*%d\r\n' % len(parts)]
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        out.append(b'$%d\r\n%s\r\n' % (len(part), part))
+    return b''.join(out)
+
+
+def read_reply(reader):
+    """Đọc một reply RESP từ sock.makefile('rb')"""
+    line = reader.readline()
+    if not line:
+        raise RedisError("Redis connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest.decode('utf-8')
+    if kind == b'-':
+        raise RedisError(rest.decode('utf-8'))
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        size = int(rest)
+        if size < 0:
+            return None
+        return reader.read(size + 2)[:-2]
+    if kind == b'*':
+        size = int(rest)
+        return None if size < 0 else [read_reply(reader) for _ in range(size)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+class RedisBackend:
+    """PUBLISH/SUBSCRIBE trên một channel Redis: hai kết nối (kết nối đã SUBSCRIBE không publish được)"""
+
+    RETRY_DELAY = 0.5
+
+    def __init__(self, url: str, channel: str):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or 'localhost', parsed.port or 6379)
+        self.password = parsed.password
+        self.channel = channel
+        self._pub = None
+        self._pub_lock = threading.Lock()
+        self._sub_reader = None
+
+    def _open(self):
+        sock = socket.create_connection(self.address, timeout=5)
+        sock.settimeout(None)
+        reader = sock.makefile('rb')
+        if self.password:
+            sock.sendall(encode_command('AUTH', self.password))
+            read_reply(reader)
+        return sock, reader
+
+    def publish(self, payload: bytes):
+        with self._pub_lock:
+            try:
+                if self._pub is None:
+                    self._pub = self._open()
+                sock, reader = self._pub
+                sock.sendall(encode_command('PUBLISH', self.channel, payload))
+                read_reply(reader)
+            except (OSError, RedisError) as e:
+                if self._pub is not None:
+                    self._pub[0].close()
+                self._pub = None
+                raise BusError(f"Redis publish failed: {e}")
+
+    def receive(self) -> bytes:
+        while True:
+            try:
+                if self._sub_reader is None:
+                    sock, reader = self._open()
+                    sock.sendall(encode_command('SUBSCRIBE', self.channel))
+                    self._sub_reader = reader
+                reply = read_reply(self._sub_reader)
+                if isinstance(reply, list) and len(reply) == 3 and reply[0] == b'message':
+                    return reply[2]
+            except (OSError, RedisError) as e:
+                logger.warning(f"Redis subscription failed ({e}), retrying")
+                self._sub_reader = None
+                time.sleep(self.RETRY_DELAY)
+
+    def close(self):
+        if self._pub is not None:
+            self._pub[0].close()
+
+
+def create_backend(url: str, channel: str = 'socketio'):
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return UnixSocketBackend(parsed.path)
+    if parsed.scheme == 'redis':
+        return RedisBackend(url, channel)
+    raise ValueError(f"Unsupported broadcast bus URL: {url}")
+
+
+class BroadcastBus:
+    """Gom các message publish trong cùng một tick thành một frame JSON.
+    Mỗi message mang thời điểm publish để bên nhận đo độ trễ."""
+
+    LATENCY_SAMPLES = 1024
+
+    def __init__(self, backend, tick: float = 0.005):
+        self.backend = backend
+        self.tick = tick
+        self._pending: List[dict] = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self.stats = {
+            'published': 0,
+            'batches': 0,
+            'received': 0,
+            'dropped': 0,     # message bị bỏ vì broker không nhận
+            'errors': 0,
+            'latency_ms_avg': 0.0,
+            'latency_ms_max': 0.0
+        }
+
+    def publish(self, message: dict):
+        message['ts'] = time.time()
+        with self._cond:
+            self._pending.append(message)
+            self.stats['published'] += 1
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name='bus-publisher', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+            # Chờ hết tick để các emit tiếp theo đi cùng frame
+            time.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception as e:  # thread publisher chết thì _pending tăng mãi
+                logger.error(f"Broadcast bus flush failed: {e}")
+
+    def flush(self):
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # Mã hóa từng message: message lỗi chỉ làm mất chính nó, không mất cả frame
+        parts = []
+        for message in batch:
+            try:
+                parts.append(json.dumps(message, separators=(',', ':'), default=_encode_bytes))
+            except Exception as e:
+                self.stats['dropped'] += 1
+                self.stats['errors'] += 1
+                logger.error(f"Broadcast bus message for event {message.get('event')} dropped: {e}")
+        if not parts:
+            return
+        try:
+            self.backend.publish(f"[{','.join(parts)}]".encode('utf-8'))
+            self.stats['batches'] += 1
+        except Exception as e:
+            self.stats['dropped'] += len(parts)
+            self.stats['errors'] += 1
+            logger.warning(f"Broadcast bus publish failed, dropped {len(parts)} messages: {e}")
+
+    def receive(self) -> List[dict]:
+        """Chặn tới khi nhận được một frame, trả về các message trong đó"""
+        frame = self.backend.receive()
+        try:
+            batch = json.loads(frame, object_hook=_decode_bytes)
+        except ValueError:
+            self.stats['errors'] += 1
+            return []
+        now = time.time()
+        for message in batch:
+            sent_at = message.pop('ts', None)
+            if sent_at is not None:
+                self._record_latency((now - sent_at) * 1000)
+        self.stats['received'] += len(batch)
+        return batch
+
+    def _record_latency(self, latency_ms: float):
+        self._latencies.append(latency_ms)
+        self._latency_total += latency_ms
+        self._latency_count += 1
+        self.stats['latency_ms_avg'] = round(self._latency_total / self._latency_count, 3)
+        self.stats['latency_ms_max'] = round(max(self.stats['latency_ms_max'], latency_ms), 3)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        samples = sorted(self._latencies)
+        stats['latency_ms_p99'] = round(samples[int(len(samples) * 0.99) - 1], 3) if samples else 0.0
+        stats['pending'] = len(self._pending)
+        return stats
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+class BusManager(socketio.PubSubManager):
+    """client_manager cho Flask-SocketIO: emit được gửi tới client cục bộ ngay,
+    rồi qua BroadcastBus tới các tiến trình khác"""
+
+    name = 'gamebus'
+
+    def __init__(self, url: str, channel: str = 'socketio', tick: float = 0.005, write_only: bool = False):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = BroadcastBus(create_backend(url, channel), tick)
+
+    def _publish(self, data):
+        self.bus.publish(data)
+
+    def _listen(self):
+        while True:
+            yield from self.bus.receive()
+
+
+class AsyncBusManager(AsyncPubSubManager):
+    """Như BusManager, cho AsyncServer (chế độ asyncio); nhận frame trong executor"""
+
+    name = 'gamebus'
+
+    def __init__(self, url: str, channel: str = 'socketio', tick: float = 0.005, write_only: bool = False):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = BroadcastBus(create_backend(url, channel), tick)
+
+    async def _publish(self, data):
+        self.bus.publish(data)
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for message in await loop.run_in_executor(None, self.bus.receive):
+                yield message
+
+
+def create_bus_manager(url: Optional[str], tick_ms: float = 5, async_mode: bool = False):
+    """client_manager cho SocketIO/AsyncServer, None khi không cấu hình bus (một tiến trình)"""
+    if not url:
+        return None
+    manager_class = AsyncBusManager if async_mode else BusManager
+    return manager_class(url, tick=tick_ms / 1000)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local broadcast broker cho nhiều tiến trình server')
+    parser.add_argument('--path', default='/tmp/guess-number-bus.sock', help='Unix socket path')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    broker = LocalBroker(args.path).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,334 @@
+"""
+Chạy nhiều tiến trình worker trên một máy, mỗi phòng thuộc về đúng một worker
+- HashRing: consistent hash của room_id (đã chuẩn hóa) -> worker sở hữu phòng
+- Cluster: cấu hình của một worker (đọc từ biến môi trường do Supervisor đặt)
+- ClusterDirectory: danh sách phòng gộp từ mọi worker, cùng giao diện với RoomDirectory
+- ClusterLeaderboard: bảng xếp hạng chung cộng điểm của mọi worker, cùng giao diện với GlobalLeaderboard
+- Supervisor: tiến trình cha khởi động các worker (mỗi worker một cổng) và khởi động lại khi worker chết;
+  nó cũng chạy LocalBroker để emit của một worker tới được client ở các worker khác
+
+Client kết nối tới cổng công khai (worker 0). Khi tham gia/tạo phòng của worker khác,
+server trả 'room_redirect' kèm URL của worker đó và client chuyển socket sang đó (sticky routing);
+REST route của một phòng trả 307 về worker sở hữu. Không cần dịch vụ bên ngoài.
+Mỗi worker lưu vào file riêng (game_data.worker<N>.json); khi số worker đổi, lúc khởi động mỗi worker
+nhận các phòng nó sở hữu từ file của các worker khác (xem GameManager.rebalance).
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bus import LocalBroker
+from leaderboard import GlobalLeaderboard
+
+logger = logging.getLogger(__name__)
+
+# Biến môi trường Supervisor truyền cho từng worker
+ENV_WORKER_ID = 'GAME_WORKER_ID'
+ENV_WORKER_PORTS = 'GAME_WORKER_PORTS'    # vd. "5000,5001,5002,5003", vị trí = worker id
+ENV_PUBLIC_HOST = 'GAME_PUBLIC_HOST'      # host trong URL trả cho trình duyệt
+ENV_BROADCAST_BUS = 'GAME_BROADCAST_BUS'  # bus phát emit giữa các worker (xem bus.py)
+
+
+def worker_data_file(base: str, worker: int) -> str:
+    """File dữ liệu riêng của một worker: game_data.json -> game_data.worker<N>.json"""
+    root, ext = os.path.splitext(base)
+    return f"{root}.worker{worker}{ext}"
+
+
+def peer_data_files(data_file: Path) -> Dict[int, Path]:
+    """File dữ liệu của các worker khác nằm cạnh data_file, tìm theo mọi file/thư mục mà backend để lại
+    (.json, .journal, _rooms/, .sqlite3) nên có cả worker của lần chạy trước với số worker khác"""
+    data_file = Path(data_file)
+    match = re.fullmatch(r'(.+)\.worker(\d+)', data_file.stem)
+    if not match or not data_file.parent.is_dir():
+        return {}
+    stem, own = match.group(1), int(match.group(2))
+    pattern = re.compile(rf'{re.escape(stem)}\.worker(\d+)(?:[._]|$)')
+    workers = {int(found.group(1)) for found in map(pattern.match, os.listdir(data_file.parent)) if found}
+    workers.discard(own)
+    base = str(data_file.with_name(stem + data_file.suffix))
+    return {worker: Path(worker_data_file(base, worker)) for worker in sorted(workers)}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash: mỗi worker có `replicas` điểm trên vòng, một key thuộc worker
+    có điểm đầu tiên >= hash(key). Đổi số worker chỉ chuyển khoảng 1/N số phòng."""
+
+    def __init__(self, nodes: Iterable[int], replicas: int = 128):
+        points = sorted((_hash(f"worker-{node}#{i}"), node) for node in nodes for i in range(replicas))
+        if not points:
+            raise ValueError("HashRing needs at least one node")
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        pos = bisect.bisect_left(self._hashes, _hash(key))
+        return self._nodes[pos % len(self._nodes)]
+
+
+class Cluster:
+    """Vị trí của tiến trình hiện tại trong cụm worker"""
+
+    def __init__(self, worker_id: int, ports: List[int], public_host: str = 'localhost'):
+        self.worker_id = worker_id
+        self.ports = ports
+        self.public_host = public_host
+        self.ring = HashRing(range(len(ports)))
+
+    @classmethod
+    def from_env(cls) -> Optional['Cluster']:
+        """Cluster của worker này, None khi chạy một tiến trình"""
+        ports = os.environ.get(ENV_WORKER_PORTS)
+        if not ports:
+            return None
+        return cls(int(os.environ.get(ENV_WORKER_ID, '0')),
+                   [int(port) for port in ports.split(',')],
+                   os.environ.get(ENV_PUBLIC_HOST, 'localhost'))
+
+    @property
+    def peers(self) -> List[int]:
+        return [worker for worker in range(len(self.ports)) if worker != self.worker_id]
+
+    def owner(self, room_id: str) -> int:
+        # Chuẩn hóa như normalize_room_id để "Lobby" và "lobby" cùng một worker
+        return self.ring.node_for(room_id.lower().strip())
+
+    def is_local(self, room_id: str) -> bool:
+        return self.owner(room_id) == self.worker_id
+
+    def public_url(self, worker: int) -> str:
+        return f"http://{self.public_host}:{self.ports[worker]}"
+
+    def internal_url(self, worker: int) -> str:
+        return f"http://127.0.0.1:{self.ports[worker]}"
+
+    def route(self, room_id: str) -> dict:
+        worker = self.owner(room_id)
+        return {'room_id': room_id.lower().strip(), 'worker': worker, 'url': self.public_url(worker)}
+
+
+class PeerCache:
+    """Bản cache dữ liệu `path` của các worker khác, hỏi qua HTTP nội bộ.
+    Mỗi worker khác được hỏi tối đa một lần mỗi refresh_interval (có If-None-Match);
+    worker không trả lời thì tạm coi như không có dữ liệu (version 0)."""
+
+    path = ''
+
+    def __init__(self, cluster: Cluster, refresh_interval: float = 1.0, timeout: float = 0.5):
+        self.cluster = cluster
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_refresh = 0.0
+        # worker -> (etag, version, data)
+        self._peers: Dict[int, Tuple[Optional[str], int, dict]] = {}
+
+    def _fetch(self, worker: int):
+        etag, version, data = self._peers.get(worker, (None, 0, {}))
+        request = urllib.request.Request(f"{self.cluster.internal_url(worker)}{self.path}")
+        if etag:
+            request.add_header('If-None-Match', etag)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.loads(response.read().decode('utf-8'))
+                return response.headers.get('ETag'), data['version'], data
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return etag, version, data
+            logger.warning(f"{self.path} from worker {worker} failed: HTTP {e.code}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"{self.path} from worker {worker} failed: {e}")
+        return None, 0, {}
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        # Đang có thread khác hỏi các worker: dùng bản cache hiện có thay vì chờ
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            fetched = {worker: self._fetch(worker) for worker in self.cluster.peers}
+            with self._lock:
+                self._peers = fetched
+            self._last_refresh = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _peer_key(self) -> Tuple[int, ...]:
+        """Version của từng worker khác (gọi khi đang giữ _lock)"""
+        return tuple(self._peers[w][1] for w in sorted(self._peers))
+
+
+class ClusterDirectory(PeerCache):
+    """Danh sách phòng của mọi worker: phòng của worker này + bản cache danh sách của các worker khác.
+    Worker không trả lời thì tạm bỏ các phòng của nó khỏi danh sách."""
+
+    path = '/api/rooms?scope=local'
+
+    def __init__(self, local_directory, cluster: Cluster, refresh_interval: float = 1.0, timeout: float = 0.5):
+        super().__init__(cluster, refresh_interval, timeout)
+        self.local = local_directory
+        self._cache_key = None
+        self._rooms_cache: List[dict] = []
+        self._payload_cache = ''
+
+    def _merged(self) -> Tuple[int, List[dict], str]:
+        self._refresh_if_stale()
+        local_version, local_body = self.local.payload()
+        with self._lock:
+            key = (local_version,) + self._peer_key()
+            if key != self._cache_key:
+                local = json.loads(local_body)
+                rooms = list(local['rooms'])
+                total = local['total']
+                for worker in sorted(self._peers):
+                    peer = self._peers[worker][2]
+                    rooms.extend(peer.get('rooms', []))
+                    total += peer.get('total', 0)
+                # Version mỗi worker chỉ tăng nên tổng cũng chỉ tăng khi có thay đổi
+                version = sum(key)
+                self._cache_key = key
+                self._rooms_cache = rooms
+                self._payload_cache = json.dumps({'rooms': rooms, 'total': total, 'version': version})
+            return sum(self._cache_key), self._rooms_cache, self._payload_cache
+
+    def snapshot(self) -> Tuple[int, List[dict]]:
+        version, rooms, _ = self._merged()
+        return version, rooms
+
+    def payload(self) -> Tuple[int, str]:
+        version, _, body = self._merged()
+        return version, body
+
+
+class ClusterLeaderboard(PeerCache):
+    """Bảng xếp hạng chung của mọi worker: điểm của một tên là tổng điểm nó kiếm được ở mỗi worker.
+    Mỗi worker chỉ cộng điểm của các phòng nó sở hữu, nên phải gộp toàn bộ điểm (không chỉ top-N)
+    rồi xếp hạng lại; bản gộp được dựng lại khi version của worker nào đó đổi."""
+
+    path = '/api/leaderboard/scores'
+
+    def __init__(self, local: GlobalLeaderboard, cluster: Cluster, refresh_interval: float = 1.0,
+                 timeout: float = 0.5):
+        super().__init__(cluster, refresh_interval, timeout)
+        self.local = local
+        self._cache_key = None
+        self._board = GlobalLeaderboard()
+
+    def _merged(self) -> GlobalLeaderboard:
+        self._refresh_if_stale()
+        local_version, local_body = self.local.payload()
+        with self._lock:
+            key = (local_version,) + self._peer_key()
+            if key != self._cache_key:
+                scores = dict(json.loads(local_body)['scores'])
+                for worker in sorted(self._peers):
+                    for name, score in self._peers[worker][2].get('scores', {}).items():
+                        scores[name] = scores.get(name, 0) + score
+                board = GlobalLeaderboard()
+                board.load(scores)
+                self._cache_key = key
+                self._board = board
+            return self._board
+
+    def __len__(self):
+        return len(self._merged())
+
+    @property
+    def version(self) -> int:
+        self._merged()
+        return sum(self._cache_key)
+
+    def top(self, n: int) -> List[dict]:
+        return self._merged().top(n)
+
+    def rank(self, name: str) -> Optional[int]:
+        return self._merged().rank(name)
+
+    def percentile(self, name: str) -> Optional[float]:
+        return self._merged().percentile(name)
+
+    def player(self, name: str) -> Optional[dict]:
+        return self._merged().player(name)
+
+
+class Supervisor:
+    """Khởi động `workers` tiến trình start_server.py (worker i nghe ở port + i) và giữ chúng chạy"""
+
+    RESTART_DELAY = 1.0
+
+    def __init__(self, workers: int, port: int, worker_args: List[str], public_host: str = 'localhost'):
+        self.ports = [port + i for i in range(workers)]
+        self.worker_args = worker_args
+        self.public_host = public_host
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.broker = None
+        self._stopping = False
+
+    def _spawn(self, worker: int) -> subprocess.Popen:
+        env = dict(os.environ)
+        env[ENV_WORKER_ID] = str(worker)
+        env[ENV_WORKER_PORTS] = ','.join(str(port) for port in self.ports)
+        env[ENV_PUBLIC_HOST] = self.public_host
+        # Mỗi worker ghi dữ liệu của các phòng nó sở hữu ra file riêng
+        base = env.get('GAME_DATA_FILE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_data.json')
+        env['GAME_DATA_FILE'] = worker_data_file(base, worker)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'start_server.py')
+        command = [sys.executable, script, '--port', str(self.ports[worker]), '--workers', '1'] + self.worker_args
+        logger.info(f"Starting worker {worker} on port {self.ports[worker]}")
+        return subprocess.Popen(command, env=env)
+
+    def run(self):
+        """Chặn tới khi bị dừng (Ctrl+C / SIGTERM), khởi động lại worker bị chết"""
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, '_stopping', True))
+        if not os.environ.get(ENV_BROADCAST_BUS):
+            # Không cấu hình Redis: dùng broker Unix socket chạy trong tiến trình giám sát
+            path = os.path.join(tempfile.gettempdir(), f"guess-number-bus-{self.ports[0]}.sock")
+            self.broker = LocalBroker(path).start()
+            os.environ[ENV_BROADCAST_BUS] = f"unix://{path}"
+        for worker in range(len(self.ports)):
+            self.processes[worker] = self._spawn(worker)
+        try:
+            while not self._stopping:
+                time.sleep(self.RESTART_DELAY)
+                for worker, process in list(self.processes.items()):
+                    code = process.poll()
+                    if code is not None and not self._stopping:
+                        logger.error(f"Worker {worker} exited with code {code}, restarting")
+                        self.processes[worker] = self._spawn(worker)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopping = True
+        if self.broker is not None:
+            self.broker.stop()
+            self.broker = None
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for worker, process in self.processes.items():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker {worker} did not stop, killing it")
+                process.kill()
@@ -0,0 +1,220 @@
+"""
+Định dạng snapshot nhị phân gọn cho dữ liệu phòng
+Header: MAGIC (4 byte) + flags (1 byte), sau đó là payload msgpack (có thể nén zlib).
+Dùng thư viện msgpack nếu đã cài (nhanh), nếu không thì dùng bộ mã hóa thuần Python
+cùng định dạng nên file ghi ở máy này luôn đọc được ở máy kia.
+"""
+
+import json
+import struct
+import zlib
+from pathlib import Path
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tùy chọn
+    msgpack = None
+
+MAGIC = b'GNS\x01'
+FLAG_ZLIB = 0x01
+HEADER_SIZE = len(MAGIC) + 1
+
+
+class SnapshotFormatError(ValueError):
+    """Dữ liệu snapshot nhị phân không hợp lệ"""
+
+
+def _pack_into(obj, out: bytearray):
+    """Mã hóa msgpack (tập con đủ cho dữ liệu phòng) bằng Python thuần"""
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj <= 0xffffffffffffffff:
+            out += b'\xcf' + struct.pack('>Q', obj)
+        else:
+            out += b'\xd3' + struct.pack('>q', obj)
+    elif isinstance(obj, float):
+        out += b'\xcb' + struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        size = len(data)
+        if size < 32:
+            out.append(0xa0 | size)
+        elif size < 0x100:
+            out += b'\xd9' + struct.pack('>B', size)
+        elif size < 0x10000:
+            out += b'\xda' + struct.pack('>H', size)
+        else:
+            out += b'\xdb' + struct.pack('>I', size)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        size = len(obj)
+        if size < 0x100:
+            out += b'\xc4' + struct.pack('>B', size)
+        elif size < 0x10000:
+            out += b'\xc5' + struct.pack('>H', size)
+        else:
+            out += b'\xc6' + struct.pack('>I', size)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        size = len(obj)
+        if size < 16:
+            out.append(0x90 | size)
+        elif size < 0x10000:
+            out += b'\xdc' + struct.pack('>H', size)
+        else:
+            out += b'\xdd' + struct.pack('>I', size)
+        for item in obj:
+            _pack_into(item, out)
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 16:
+            out.append(0x80 | size)
+        elif size < 0x10000:
+            out += b'\xde' + struct.pack('>H', size)
+        else:
+            out += b'\xdf' + struct.pack('>I', size)
+        for key, value in obj.items():
+            _pack_into(key, out)
+            _pack_into(value, out)
+    else:
+        raise TypeError(f"Cannot encode {type(obj).__name__} in snapshot")
+
+
+# (định dạng struct, kích thước) cho các kiểu số có độ dài cố định
+_FIXED = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+}
+# (định dạng struct của độ dài, kích thước) cho str/bin/array/map
+_SIZED = {
+    0xd9: ('str', '>B', 1), 0xda: ('str', '>H', 2), 0xdb: ('str', '>I', 4),
+    0xc4: ('bin', '>B', 1), 0xc5: ('bin', '>H', 2), 0xc6: ('bin', '>I', 4),
+    0xdc: ('array', '>H', 2), 0xdd: ('array', '>I', 4),
+    0xde: ('map', '>H', 2), 0xdf: ('map', '>I', 4),
+}
+
+
+def _unpack_from(data: bytes, pos: int):
+    """Giải mã một giá trị msgpack tại vị trí pos, trả về (giá trị, vị trí kế tiếp)"""
+    try:
+        code = data[pos]
+    except IndexError:
+        raise SnapshotFormatError("Truncated snapshot payload")
+    pos += 1
+
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if 0xa0 <= code <= 0xbf:
+        kind, size = 'str', code & 0x1f
+    elif 0x90 <= code <= 0x9f:
+        kind, size = 'array', code & 0x0f
+    elif 0x80 <= code <= 0x8f:
+        kind, size = 'map', code & 0x0f
+    elif code == 0xc0:
+        return None, pos
+    elif code == 0xc2:
+        return False, pos
+    elif code == 0xc3:
+        return True, pos
+    elif code in _FIXED:
+        fmt, width = _FIXED[code]
+        if pos + width > len(data):
+            raise SnapshotFormatError("Truncated snapshot payload")
+        return struct.unpack_from(fmt, data, pos)[0], pos + width
+    elif code in _SIZED:
+        kind, fmt, width = _SIZED[code]
+        if pos + width > len(data):
+            raise SnapshotFormatError("Truncated snapshot payload")
+        size = struct.unpack_from(fmt, data, pos)[0]
+        pos += width
+    else:
+        raise SnapshotFormatError(f"Unsupported type code 0x{code:02x}")
+
+    if kind in ('str', 'bin'):
+        end = pos + size
+        if end > len(data):
+            raise SnapshotFormatError("Truncated snapshot payload")
+        chunk = data[pos:end]
+        return (chunk.decode('utf-8') if kind == 'str' else bytes(chunk)), end
+    if kind == 'array':
+        items = []
+        for _ in range(size):
+            item, pos = _unpack_from(data, pos)
+            items.append(item)
+        return items, pos
+
+    result = {}
+    for _ in range(size):
+        key, pos = _unpack_from(data, pos)
+        value, pos = _unpack_from(data, pos)
+        result[key] = value
+    return result, pos
+
+
+def pack(obj) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _pack_into(obj, out)
+    return bytes(out)
+
+
+def unpack(data: bytes):
+    if msgpack is not None:
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise SnapshotFormatError(str(e))
+    value, pos = _unpack_from(data, 0)
+    if pos != len(data):
+        raise SnapshotFormatError("Trailing bytes after snapshot payload")
+    return value
+
+
+def is_binary_snapshot(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode_snapshot(obj, compress: bool = True) -> bytes:
+    """Mã hóa dữ liệu thành snapshot nhị phân (có header)"""
+    payload = pack(obj)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 6)
+        flags |= FLAG_ZLIB
+    return MAGIC + bytes([flags]) + payload
+
+
+def decode_snapshot(data: bytes):
+    """Giải mã snapshot nhị phân (có header)"""
+    if not is_binary_snapshot(data) or len(data) < HEADER_SIZE:
+        raise SnapshotFormatError("Missing snapshot header")
+    flags = data[len(MAGIC)]
+    payload = data[HEADER_SIZE:]
+    if flags & FLAG_ZLIB:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise SnapshotFormatError(f"Corrupt compressed snapshot: {e}")
+    return unpack(payload)
+
+
+def read_snapshot_file(path: Path):
+    """Đọc file snapshot, tự nhận diện định dạng nhị phân hoặc JSON"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_binary_snapshot(data):
+        return decode_snapshot(data)
+    return json.loads(data.decode('utf-8'))
@@ -0,0 +1,176 @@
+"""
+Cấu hình tầng Engine.IO bên dưới Socket.IO: transport, ping, bộ đệm HTTP và nén per-message
+- EngineConfig: đọc từ biến môi trường GAME_TRANSPORT_* (start_server.py --transport-profile ... đặt sẵn)
+- ThresholdDeflate: permessage-deflate cho WebSocket, chỉ nén message từ `threshold` byte trở lên
+- TransportMetrics: số kết nối theo transport ban đầu và độ trễ nâng cấp polling -> websocket
+
+Profile 'websocket' bỏ hẳn long-polling: client mở thẳng WebSocket, không có request HTTP nào
+đi qua Flask cho mỗi lần poll và không có bước nâng cấp.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set
+
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import Opcode
+
+ENV_PROFILE = 'GAME_TRANSPORT_PROFILE'              # default | websocket
+ENV_PING_INTERVAL = 'GAME_PING_INTERVAL'            # giây
+ENV_PING_TIMEOUT = 'GAME_PING_TIMEOUT'              # giây
+ENV_MAX_HTTP_BUFFER = 'GAME_MAX_HTTP_BUFFER_SIZE'   # byte
+ENV_DEFLATE_THRESHOLD = 'GAME_DEFLATE_THRESHOLD'    # byte, -1 = tắt nén
+
+TRANSPORT_PROFILES = {
+    'default': ['polling', 'websocket'],  # bắt đầu bằng long-polling rồi nâng cấp
+    'websocket': ['websocket'],
+}
+
+
+@dataclass
+class EngineConfig:
+    profile: str = 'default'
+    ping_interval: float = 25
+    ping_timeout: float = 20
+    max_http_buffer_size: int = 1_000_000
+    deflate_threshold: int = 1024  # -1 = không nén
+
+    @classmethod
+    def from_env(cls) -> 'EngineConfig':
+        config = cls(os.environ.get(ENV_PROFILE, cls.profile),
+                     float(os.environ.get(ENV_PING_INTERVAL, cls.ping_interval)),
+                     float(os.environ.get(ENV_PING_TIMEOUT, cls.ping_timeout)),
+                     int(os.environ.get(ENV_MAX_HTTP_BUFFER, cls.max_http_buffer_size)),
+                     int(os.environ.get(ENV_DEFLATE_THRESHOLD, cls.deflate_threshold)))
+        if config.profile not in TRANSPORT_PROFILES:
+            raise ValueError(f"Unknown transport profile: {config.profile}")
+        return config
+
+    def to_env(self) -> Dict[str, str]:
+        """Biến môi trường để worker con đọc lại đúng cấu hình này"""
+        return {
+            ENV_PROFILE: self.profile,
+            ENV_PING_INTERVAL: str(self.ping_interval),
+            ENV_PING_TIMEOUT: str(self.ping_timeout),
+            ENV_MAX_HTTP_BUFFER: str(self.max_http_buffer_size),
+            ENV_DEFLATE_THRESHOLD: str(self.deflate_threshold)
+        }
+
+    @property
+    def transports(self) -> List[str]:
+        return TRANSPORT_PROFILES[self.profile]
+
+    @property
+    def deflate(self) -> bool:
+        return self.deflate_threshold >= 0
+
+    def server_options(self) -> dict:
+        """Tham số cho SocketIO(...) / socketio.AsyncServer(...)"""
+        return {
+            'transports': self.transports,
+            'ping_interval': self.ping_interval,
+            'ping_timeout': self.ping_timeout,
+            'max_http_buffer_size': self.max_http_buffer_size,
+            # Nén gzip/deflate của response long-polling dùng chung ngưỡng
+            'http_compression': self.deflate,
+            'compression_threshold': max(self.deflate_threshold, 0)
+        }
+
+    def as_dict(self) -> dict:
+        return dict(asdict(self), transports=self.transports)
+
+
+class ThresholdDeflate(PerMessageDeflate):
+    """permessage-deflate bỏ qua message nhỏ hơn threshold (gửi với RSV1 = 0, RFC 7692 cho phép).
+    Phần lớn sự kiện của game chỉ vài trăm byte: nén chúng tốn CPU mà gần như không giảm byte nào.
+    threshold < 0: từ chối extension, client gửi/nhận không nén."""
+
+    def __init__(self, threshold: int = 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self._skipping = False
+
+    def offer(self):
+        return super().offer() if self.threshold >= 0 else False
+
+    def accept(self, offer):
+        return super().accept(offer) if self.threshold >= 0 else None
+
+    def frame_outbound(self, proto, opcode, rsv, data, fin):
+        if opcode.iscontrol():
+            return super().frame_outbound(proto, opcode, rsv, data, fin)
+        if opcode is not Opcode.CONTINUATION:
+            # Quyết định theo frame đầu tiên; các frame nối tiếp theo cùng quyết định
+            self._skipping = fin and len(data) < self.threshold
+        if self._skipping:
+            return rsv, data
+        return super().frame_outbound(proto, opcode, rsv, data, fin)
+
+
+def install_websocket_deflate(threshold: int):
+    """Cho server WebSocket của chế độ threading (simple-websocket) dùng ThresholdDeflate.
+    simple-websocket luôn chấp nhận PerMessageDeflate() mặc định và không có tham số nào để chỉnh,
+    nên thay tên PerMessageDeflate trong module của nó."""
+    try:
+        import simple_websocket.ws
+    except ImportError:  # không có simple-websocket: chỉ có long-polling
+        return
+
+    def factory(**kwargs):
+        return ThresholdDeflate(threshold, **kwargs)
+
+    simple_websocket.ws.PerMessageDeflate = factory
+
+
+class TransportMetrics:
+    """Kết nối hiện tại/tổng theo transport ban đầu và độ trễ nâng cấp lên websocket"""
+
+    def __init__(self, samples: int = 1000):
+        self._lock = threading.Lock()
+        self._live: Set[str] = set()
+        self._connected_at: Dict[str, float] = {}  # client chưa nâng cấp
+        self._upgrade_ms = deque(maxlen=samples)
+        self.stats = {
+            'connections_total': 0,
+            'initial_transport': {},
+            'upgrades': 0
+        }
+
+    def connected(self, sid: str, transport: Optional[str]):
+        with self._lock:
+            self._live.add(sid)
+            if transport != 'websocket':
+                self._connected_at[sid] = time.monotonic()
+            self.stats['connections_total'] += 1
+            initial = self.stats['initial_transport']
+            initial[transport] = initial.get(transport, 0) + 1
+
+    def upgraded(self, sid: str) -> Optional[float]:
+        """Client báo đã nâng cấp xong; trả về độ trễ (ms) tính từ lúc kết nối"""
+        with self._lock:
+            connected_at = self._connected_at.pop(sid, None)
+            if connected_at is None:
+                return None
+            latency = (time.monotonic() - connected_at) * 1000
+            self._upgrade_ms.append(latency)
+            self.stats['upgrades'] += 1
+            return latency
+
+    def disconnected(self, sid: str):
+        with self._lock:
+            self._live.discard(sid)
+            self._connected_at.pop(sid, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._upgrade_ms)
+            stats = dict(self.stats, connections=len(self._live),
+                         initial_transport=dict(self.stats['initial_transport']))
+        if samples:
+            stats['upgrade_ms_avg'] = round(sum(samples) / len(samples), 1)
+            stats['upgrade_ms_p95'] = round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 1)
+            stats['upgrade_ms_max'] = round(samples[-1], 1)
+        return stats
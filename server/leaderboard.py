@@ -0,0 +1,336 @@
+"""
+Bảng xếp hạng được sắp xếp sẵn: cập nhật một người chơi bằng tìm kiếm nhị phân
+thay vì sắp xếp lại toàn bộ điểm ở mỗi lần hiển thị.
+- SortedBuckets: danh sách sắp xếp chia thành các bucket nhỏ, chèn/xóa không phải dịch cả danh sách
+- Leaderboard: bảng điểm của một phòng (room.scores)
+- GlobalLeaderboard: tổng điểm tích lũy của mỗi người chơi trên mọi phòng
+"""
+
+import json
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class SortedBuckets:
+    """Danh sách sắp xếp dạng các bucket (mỗi bucket tối đa 2 * LOAD phần tử) kèm cây Fenwick
+    đếm số phần tử theo bucket để đổi giữa vị trí toàn cục và (bucket, vị trí trong bucket).
+    add/remove/bisect_left: O(log n) phép so sánh, cộng một lần dịch tối đa 2 * LOAD phần tử
+    trong bucket (memmove, bị chặn bởi hằng số) thay vì dịch cả danh sách như insort trên một list.
+    Tách/gộp bucket đánh dấu cây cần dựng lại (O(số bucket)), trung bình mỗi LOAD lần cập nhật một lần."""
+
+    LOAD = 256
+
+    def __init__(self, items: Iterable = ()):
+        self._build(sorted(items))
+
+    def _build(self, items: list):
+        self._buckets: List[list] = [items[i:i + self.LOAD] for i in range(0, len(items), self.LOAD)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(items)
+        self._tree: Optional[List[int]] = None  # None: cần dựng lại
+
+    def __len__(self):
+        return self._len
+
+    def clear(self):
+        self._build([])
+
+    def add(self, item):
+        if not self._buckets:
+            self._build([item])
+            return
+        i = bisect_left(self._maxes, item)
+        if i == len(self._buckets):
+            i -= 1
+            self._buckets[i].append(item)
+            self._maxes[i] = item
+        else:
+            insort(self._buckets[i], item)
+        self._len += 1
+        bucket = self._buckets[i]
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+            self._tree = None
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, item):
+        """Xóa một phần tử có trong danh sách"""
+        i = bisect_left(self._maxes, item)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, item)]
+        self._len -= 1
+        if len(bucket) < self.LOAD // 2 and len(self._buckets) > 1:
+            # Gộp bucket quá nhỏ với bucket kề để số bucket luôn khoảng n / LOAD
+            j = i - 1 if i > 0 else i
+            merged = self._buckets[j] + self._buckets[j + 1]
+            if len(merged) > 2 * self.LOAD:
+                half = len(merged) // 2
+                self._buckets[j:j + 2] = [merged[:half], merged[half:]]
+                self._maxes[j:j + 2] = [merged[half - 1], merged[-1]]
+            else:
+                self._buckets[j:j + 2] = [merged]
+                self._maxes[j:j + 2] = [merged[-1]]
+            self._tree = None
+        elif not bucket:
+            del self._buckets[i], self._maxes[i]
+            self._tree = None
+        else:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+
+    def bisect_left(self, item) -> int:
+        """Vị trí toàn cục đầu tiên có phần tử >= item"""
+        i = bisect_left(self._maxes, item)
+        if i == len(self._buckets):
+            return self._len
+        return self._prefix(i) + bisect_left(self._buckets[i], item)
+
+    def slice(self, start: int, stop: int) -> list:
+        """Các phần tử ở vị trí [start, stop)"""
+        stop = min(stop, self._len)
+        if start >= stop:
+            return []
+        i, offset = self._locate(start)
+        items = []
+        while len(items) < stop - start:
+            items.extend(self._buckets[i][offset:offset + stop - start - len(items)])
+            i, offset = i + 1, 0
+        return items
+
+    def _index(self) -> List[int]:
+        if self._tree is None:
+            tree = [0] + [len(bucket) for bucket in self._buckets]
+            for i in range(1, len(tree)):
+                parent = i + (i & -i)
+                if parent < len(tree):
+                    tree[parent] += tree[i]
+            self._tree = tree
+        return self._tree
+
+    def _tree_add(self, i: int, delta: int):
+        tree = self._tree
+        if tree is None:
+            return
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """Tổng số phần tử của các bucket đứng trước bucket i"""
+        tree = self._index()
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, pos: int) -> Tuple[int, int]:
+        """Vị trí toàn cục -> (bucket, vị trí trong bucket)"""
+        tree = self._index()
+        i = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            j = i + step
+            if j < len(tree) and tree[j] <= pos:
+                i = j
+                pos -= tree[j]
+            step >>= 1
+        return i, pos
+
+
+class Leaderboard(dict):
+    """Dict tên -> điểm, luôn giữ kèm danh sách (-điểm, tên) đã sắp xếp (SortedBuckets).
+    Sửa trực tiếp như dict (scores[name] = x, clear, pop, ...) vẫn giữ thứ tự đúng.
+    Hạng dùng kiểu thi đấu: cùng điểm thì cùng hạng (1, 2, 2, 4)"""
+
+    def __init__(self, *args, **kwargs):
+        # Nạp một lần rồi sắp xếp: nhanh hơn nhiều so với chèn từng người (vd. 100k tên khi khởi động)
+        super().__init__(*args, **kwargs)
+        self._order = SortedBuckets((-score, name) for name, score in self.items())
+
+    def __missing__(self, name):
+        # Giữ hành vi defaultdict(int) của room.scores trước đây
+        self[name] = 0
+        return 0
+
+    def __setitem__(self, name, score):
+        if name in self:
+            old_score = dict.__getitem__(self, name)
+            if old_score == score:
+                return
+            self._discard(name, old_score)
+        super().__setitem__(name, score)
+        self._order.add((-score, name))
+
+    def __delitem__(self, name):
+        score = dict.__getitem__(self, name)
+        super().__delitem__(name)
+        self._discard(name, score)
+
+    def _discard(self, name, score):
+        self._order.remove((-score, name))
+
+    def pop(self, name, *default):
+        if name not in self:
+            return super().pop(name, *default)
+        score = dict.__getitem__(self, name)
+        del self[name]
+        return score
+
+    def popitem(self):
+        name, score = super().popitem()
+        self._discard(name, score)
+        return name, score
+
+    def setdefault(self, name, default=0):
+        if name not in self:
+            self[name] = default
+        return dict.__getitem__(self, name)
+
+    def update(self, *args, **kwargs):
+        for name, score in dict(*args, **kwargs).items():
+            self[name] = score
+
+    def clear(self):
+        super().clear()
+        self._order.clear()
+
+    def __reduce__(self):
+        # copy/pickle dựng lại qua __init__ để _order khớp với dữ liệu
+        return type(self), (dict(self),)
+
+    def rank(self, name: str) -> Optional[int]:
+        """Hạng của người chơi (bắt đầu từ 1), None nếu chưa có điểm"""
+        if name not in self:
+            return None
+        # Số người có điểm cao hơn hẳn
+        return self._order.bisect_left((-dict.__getitem__(self, name), '')) + 1
+
+    def _entries(self, start: int, stop: int) -> List[dict]:
+        entries = []
+        rank = None
+        previous = None
+        for neg_score, name in self._order.slice(start, stop):
+            if neg_score != previous:
+                rank = self._order.bisect_left((neg_score, '')) + 1
+                previous = neg_score
+            entries.append({'name': name, 'score': -neg_score, 'rank': rank})
+        return entries
+
+    def top(self, n: int) -> List[dict]:
+        """n người chơi đứng đầu: [{'name', 'score', 'rank'}, ...]"""
+        return self._entries(0, min(max(n, 0), len(self._order)))
+
+    def around(self, name: str, radius: int = 2) -> List[dict]:
+        """Người chơi và tối đa radius người đứng trước/sau trong bảng xếp hạng"""
+        if name not in self:
+            return []
+        pos = self._order.bisect_left((-dict.__getitem__(self, name), name))
+        return self._entries(max(pos - radius, 0), min(pos + radius + 1, len(self._order)))
+
+    def entry(self, name: str) -> Optional[dict]:
+        """{'name', 'score', 'rank'} của một người chơi, None nếu chưa có điểm"""
+        if name not in self:
+            return None
+        return {'name': name, 'score': dict.__getitem__(self, name), 'rank': self.rank(name)}
+
+    def as_dict(self, n: int) -> Dict[str, int]:
+        """n người đứng đầu dạng {tên: điểm}, theo thứ tự xếp hạng"""
+        return {name: -neg_score for neg_score, name in self._order.slice(0, max(n, 0))}
+
+
+class GlobalLeaderboard:
+    """Bảng xếp hạng chung: tổng điểm mỗi tên người chơi kiếm được ở mọi phòng.
+    make_guess cộng điểm trực tiếp nên truy vấn không phải duyệt lại các phòng.
+    Điểm tích lũy không bị xóa khi phòng bị reset hoặc bị xóa."""
+
+    def __init__(self):
+        self._board = Leaderboard()
+        self._lock = threading.Lock()
+        # Tên có điểm thay đổi kể từ lần lưu gần nhất
+        self._dirty: Set[str] = set()
+        # Tăng mỗi khi có điểm thay đổi; các worker khác dùng để biết bản cache còn mới không
+        self.version = 0
+        self._payload_cache: Optional[Tuple[int, str]] = None
+
+    def __len__(self):
+        return len(self._board)
+
+    def add(self, name: str, points: int) -> int:
+        """Cộng điểm cho người chơi, trả về tổng điểm mới"""
+        with self._lock:
+            score = self._board.get(name, 0) + points
+            self._board[name] = score
+            self._dirty.add(name)
+            self.version += 1
+            return score
+
+    def load(self, scores: Dict[str, int]):
+        """Nạp điểm đã lưu (không đánh dấu cần ghi lại)"""
+        with self._lock:
+            self._board = Leaderboard(scores)
+            self._dirty.clear()
+            self.version += 1
+
+    def set(self, name: str, score: int):
+        """Đặt tổng điểm tuyệt đối (replay journal)"""
+        with self._lock:
+            self._board[name] = score
+            self._dirty.add(name)
+            self.version += 1
+
+    def take_dirty(self) -> Dict[str, int]:
+        """Lấy các điểm đã thay đổi để ghi xuống backend"""
+        with self._lock:
+            changed = {name: self._board[name] for name in self._dirty if name in self._board}
+            self._dirty.clear()
+            return changed
+
+    def has_dirty(self) -> bool:
+        with self._lock:
+            return bool(self._dirty)
+
+    def mark_dirty(self, names: Iterable[str]):
+        """Lần ghi lỗi: đánh dấu lại để lần sau ghi giá trị mới nhất"""
+        with self._lock:
+            self._dirty.update(names)
+
+    def payload(self) -> Tuple[int, str]:
+        """(version, JSON {'scores', 'version'}) của mọi điểm, cache theo version"""
+        with self._lock:
+            if self._payload_cache is None or self._payload_cache[0] != self.version:
+                body = json.dumps({'scores': dict(self._board), 'version': self.version}, ensure_ascii=False)
+                self._payload_cache = (self.version, body)
+            return self._payload_cache
+
+    def top(self, n: int) -> List[dict]:
+        with self._lock:
+            return self._board.top(n)
+
+    def rank(self, name: str) -> Optional[int]:
+        with self._lock:
+            return self._board.rank(name)
+
+    def percentile(self, name: str) -> Optional[float]:
+        """Phần trăm người chơi có hạng bằng hoặc thấp hơn (người đứng đầu = 100)"""
+        with self._lock:
+            return self._percentile(name)
+
+    def _percentile(self, name: str) -> Optional[float]:
+        rank = self._board.rank(name)
+        if rank is None:
+            return None
+        total = len(self._board)
+        return round(100.0 * (total - rank + 1) / total, 2)
+
+    def player(self, name: str) -> Optional[dict]:
+        """{'name', 'score', 'rank', 'percentile'} của một người chơi"""
+        with self._lock:
+            entry = self._board.entry(name)
+            if entry is not None:
+                entry['percentile'] = self._percentile(name)
+            return entry
@@ -0,0 +1,154 @@
+"""
+Gom các sự kiện phát cho cả phòng trong một tick thành một sự kiện 'room_batch'
+- Vào/rời phòng gộp thành một mục 'presence' (vào rồi rời trong cùng tick thì triệt tiêu)
+- scoreboard_updated chỉ giữ bản mới nhất (các delta 'changes' được nối lại, không mất delta nào)
+- Chat và thông báo hệ thống giữ nguyên thứ tự
+Mỗi client nhận một message mỗi tick thay vì một message cho mỗi thay đổi của phòng.
+Sự kiện cần độ trễ thấp (guess_result, new_round...) không đi qua đây, nhưng được gửi trong
+ordered(room_id): lô đang chờ đi trước và không lô nào của phòng chen vào giữa.
+"""
+
+import logging
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Các sự kiện của phòng được phép gom theo tick
+COALESCED_EVENTS = frozenset({'player_joined', 'player_left', 'scoreboard_updated', 'chat_message', 'room_reset'})
+
+
+class RoomOutbox:
+    """Hàng đợi sự kiện theo phòng, flush mỗi `tick` giây qua send(room_id, batch).
+    tick = 0 thì tắt: post() không được gọi, flush() không làm gì.
+    Lấy lô ra và gửi lô của một phòng diễn ra trong khóa gửi của phòng đó, nên thread tick
+    và flush trực tiếp không gửi lệch thứ tự các sự kiện của cùng một phòng."""
+
+    SEND_LOCKS = 64  # khóa gửi chia theo crc32(room_id): số khóa cố định dù có bao nhiêu phòng
+
+    def __init__(self, send: Callable[[str, dict], None], tick: float = 0.05):
+        self.send = send
+        self.tick = tick
+        self._pending: Dict[str, List[list]] = {}  # room_id -> [[event, data], ...]
+        self._cond = threading.Condition()
+        # RLock: send() có thể gọi lại ordered() của cùng phòng trên cùng thread
+        self._send_locks = [threading.RLock() for _ in range(self.SEND_LOCKS)]
+        self._thread = None
+        self._stopped = False
+        self.stats = {
+            'posted': 0,
+            'merged': 0,    # sự kiện được gộp vào mục có sẵn thay vì gửi riêng
+            'batches': 0,
+            'errors': 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.tick > 0
+
+    def post(self, room_id: str, event: str, data: dict):
+        with self._cond:
+            events = self._pending.setdefault(room_id, [])
+            self.stats['posted'] += 1
+            if not self._merge(room_id, events, event, data):
+                events.append([event, data])
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name='room-outbox', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _merge(self, room_id: str, events: List[list], event: str, data: dict) -> bool:
+        """Gộp sự kiện vào lô đang chờ; False nếu cần thêm thành mục mới"""
+        if event == 'scoreboard_updated':
+            for i, (queued, _) in enumerate(events):
+                if queued == event:
+                    # Bảng điểm mới thay bản cũ, đặt ở vị trí mới để đúng thứ tự với chat
+                    old = events.pop(i)[1]
+                    if 'changes' in data:
+                        data = dict(data, changes=old.get('changes', []) + data['changes'])
+                    events.append([event, data])
+                    self.stats['merged'] += 1
+                    return True
+            return False
+        if event in ('player_joined', 'player_left'):
+            presence = next((queued_data for queued, queued_data in events if queued == 'presence'), None)
+            if presence is None:
+                presence = {'room_id': room_id, 'joined': [], 'left': []}
+                events.append(['presence', presence])
+            else:
+                self.stats['merged'] += 1
+            name = data.get('player_name')
+            same, opposite = ('joined', 'left') if event == 'player_joined' else ('left', 'joined')
+            if name in presence[opposite]:
+                presence[opposite].remove(name)  # vào rồi rời (hoặc ngược lại) trong cùng tick
+            else:
+                presence[same].append(name)
+            presence['current_players'] = data.get('current_players')
+            if 'changes' in data:
+                presence.setdefault('changes', []).extend(data['changes'])
+                presence['epoch'], presence['seq'] = data['epoch'], data['seq']
+            return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+                # Chờ hết tick để các thay đổi tiếp theo của phòng đi cùng lô (stop() thì gửi ngay)
+                self._cond.wait_for(lambda: self._stopped, timeout=self.tick)
+            self.flush()
+
+    def _send_lock(self, room_id: str) -> threading.RLock:
+        return self._send_locks[zlib.crc32(room_id.encode('utf-8')) % self.SEND_LOCKS]
+
+    def flush(self, room_id: str = None):
+        """Gửi các lô đang chờ (của một phòng hoặc mọi phòng)"""
+        if not self._pending:
+            return
+        if room_id is None:
+            with self._cond:
+                targets = list(self._pending)
+        else:
+            targets = [room_id]
+        for target in targets:
+            with self._send_lock(target):
+                self._send_pending(target)
+
+    def _send_pending(self, room_id: str):
+        """Lấy và gửi lô của phòng (gọi khi đang giữ khóa gửi của phòng)"""
+        with self._cond:
+            events = self._pending.pop(room_id, None)
+        if not events:
+            return
+        try:
+            self.send(room_id, {'room_id': room_id, 'events': events})
+            self.stats['batches'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Room batch for {room_id} failed: {e}")
+
+    @contextmanager
+    def ordered(self, room_id: str):
+        """Gửi lô đang chờ của phòng rồi giữ khóa gửi cho sự kiện gửi ngay bên trong khối with"""
+        if not self.enabled:
+            yield
+            return
+        with self._send_lock(room_id):
+            self._send_pending(room_id)
+            yield
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, tick_ms=self.tick * 1000, pending_rooms=len(self._pending))
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
@@ -0,0 +1,405 @@
+"""
+Lớp lưu trữ write-behind cho GameManager
+Gom các phòng bị thay đổi (dirty) và ghi xuống đĩa theo lô
+thay vì ghi lại toàn bộ game_data.json sau mỗi sự kiện.
+Kèm journal append-only để mỗi thay đổi chỉ tốn một dòng ghi
+và thread ghi snapshot riêng để handler không phải chờ I/O.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindSaver:
+    """Theo dõi phòng bị thay đổi và flush theo chu kỳ hoặc theo ngưỡng"""
+
+    def __init__(self, save_func: Callable[[Set[str], Set[str]], None],
+                 interval: float = 2.0, max_dirty: int = 20):
+        # save_func(dirty_ids, deleted_ids) thực hiện ghi thật sự
+        self._save_func = save_func
+        self.interval = interval
+        self.max_dirty = max_dirty
+
+        self._dirty: Set[str] = set()
+        self._deleted: Set[str] = set()
+        self._lock = threading.Lock()        # bảo vệ dirty/deleted
+        self._flush_lock = threading.Lock()  # chỉ một lần flush tại một thời điểm
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+        self.stats: Dict[str, float] = {
+            'marks': 0,
+            'flushes': 0,
+            'rooms_written': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0
+        }
+
+    def mark_dirty(self, room_id: str):
+        """Đánh dấu phòng cần được lưu lại"""
+        with self._lock:
+            self._dirty.add(room_id)
+            self._deleted.discard(room_id)
+            self.stats['marks'] += 1
+            pending = len(self._dirty) + len(self._deleted)
+        self._schedule(pending)
+
+    def mark_deleted(self, room_id: str):
+        """Đánh dấu phòng đã bị xóa"""
+        with self._lock:
+            self._deleted.add(room_id)
+            self._dirty.discard(room_id)
+            self.stats['marks'] += 1
+            pending = len(self._dirty) + len(self._deleted)
+        self._schedule(pending)
+
+    def peek_pending(self) -> Tuple[Set[str], Set[str]]:
+        """Bản sao các phòng đang chờ ghi (không lấy ra khỏi hàng đợi)"""
+        with self._lock:
+            return set(self._dirty), set(self._deleted)
+
+    def pending_count(self) -> int:
+        """Số phòng đang chờ được ghi"""
+        with self._lock:
+            return len(self._dirty) + len(self._deleted)
+
+    def _schedule(self, pending: int):
+        """Khởi động thread flush (nếu cần) và đánh thức khi vượt ngưỡng"""
+        if self.interval <= 0:
+            # Chế độ đồng bộ: ghi ngay sau mỗi thay đổi
+            self.flush()
+            return
+
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='write-behind-saver', daemon=True)
+            self._thread.start()
+
+        if pending >= self.max_dirty:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            self.flush()
+
+    def flush(self) -> bool:
+        """Ghi tất cả thay đổi đang chờ xuống đĩa"""
+        with self._flush_lock:
+            with self._lock:
+                dirty, deleted = self._dirty, self._deleted
+                self._dirty, self._deleted = set(), set()
+
+            if not dirty and not deleted:
+                return True
+
+            start = time.perf_counter()
+            try:
+                self._save_func(dirty, deleted)
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+                self.stats['errors'] += 1
+                # Đưa lại vào hàng đợi để lần sau thử lại
+                with self._lock:
+                    self._dirty |= dirty - self._deleted
+                    self._deleted |= deleted - self._dirty
+                return False
+
+            self.stats['flushes'] += 1
+            self.stats['rooms_written'] += len(dirty)
+            self.stats['last_flush_ms'] = (time.perf_counter() - start) * 1000
+            return True
+
+    def stop(self):
+        """Dừng thread nền và flush lần cuối (dùng khi tắt server)"""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+
+class SnapshotBatch:
+    """Một lô bản sao phòng (đã chụp trên thread game) chờ thread ghi xử lý"""
+
+    def __init__(self, rooms: Dict[str, dict], deleted: Set[str],
+                 history: List[Tuple[str, dict]] = None, journal_seq: int = 0,
+                 global_scores: Dict[str, int] = None):
+        self.rooms = rooms
+        self.deleted = deleted
+        self.history = history or []
+        self.journal_seq = journal_seq
+        self.global_scores = global_scores or {}  # điểm chung đã thay đổi: tên -> tổng điểm
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Chờ lô được ghi xong, trả về True nếu ghi thành công"""
+        return self.done.wait(timeout) and self.error is None
+
+
+class SnapshotWriter:
+    """Thread riêng serialize và ghi các lô snapshot qua hàng đợi giới hạn"""
+
+    def __init__(self, write_func: Callable[[SnapshotBatch], None],
+                 on_error: Callable[[SnapshotBatch], None] = None, max_queue: int = 8):
+        # write_func(batch) ghi xuống backend, on_error(batch) đưa lô lỗi về để thử lại
+        self._write_func = write_func
+        self._on_error = on_error
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopped = False
+
+        self.stats: Dict[str, float] = {
+            'submitted': 0,
+            'written': 0,
+            'errors': 0,
+            'queue_depth': 0,
+            'max_queue_depth': 0,
+            'blocked_submits': 0,   # số lần hàng đợi đầy, bên gửi phải chờ
+            'blocked_ms': 0.0,      # tổng thời gian chờ vì hàng đợi đầy
+            'last_write_ms': 0.0,
+            'max_write_ms': 0.0
+        }
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, batch: SnapshotBatch) -> SnapshotBatch:
+        """Đưa lô vào hàng đợi; chặn bên gửi khi hàng đợi đầy (back-pressure)"""
+        if self._stopped:
+            # Đã dừng thread: ghi trực tiếp trên thread gọi
+            self._process(batch)
+            return batch
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(batch)
+            self.stats['blocked_submits'] += 1
+            self.stats['blocked_ms'] += (time.perf_counter() - start) * 1000
+            logger.warning("Snapshot writer queue full, producer was blocked")
+
+        self.stats['submitted'] += 1
+        depth = self._queue.qsize()
+        self.stats['queue_depth'] = depth
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], depth)
+        return batch
+
+    def _process(self, batch: SnapshotBatch):
+        start = time.perf_counter()
+        try:
+            self._write_func(batch)
+        except Exception as e:
+            logger.error(f"Snapshot write failed: {e}")
+            batch.error = e
+            self.stats['errors'] += 1
+            if self._on_error:
+                self._on_error(batch)
+        else:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stats['written'] += 1
+            self.stats['last_write_ms'] = elapsed
+            self.stats['max_write_ms'] = max(self.stats['max_write_ms'], elapsed)
+        finally:
+            batch.done.set()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    break
+                self._process(batch)
+            finally:
+                self.stats['queue_depth'] = self._queue.qsize()
+                self._queue.task_done()
+
+    def wait_idle(self):
+        """Chờ tới khi mọi lô đã gửi được ghi xong"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        """Ghi nốt các lô còn lại rồi dừng thread"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+
+
+# Số vòng chơi giữ lại trong game_history (khớp với Room.game_history)
+HISTORY_LIMIT = 10
+
+
+class EventJournal:
+    """Journal append-only (mỗi dòng một record JSON) cho các thay đổi của GameManager"""
+
+    def __init__(self, path: Path, fsync: bool = False):
+        self.path = Path(path)
+        # Đoạn log đã tách ra khi compaction, xóa sau khi snapshot ghi xong
+        self.rotated_path = self.path.with_name(self.path.name + '.old')
+        self.fsync = fsync
+
+        self.seq = 0
+        self.records_since_compaction = 0
+        self.last_compaction = time.time()
+
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()       # bảo vệ seq và buffer
+        self._file_lock = threading.Lock()  # bảo vệ file log
+
+    def append(self, record: dict) -> int:
+        """Thêm record vào buffer, trả về số thứ tự (seq) của record"""
+        with self._lock:
+            self.seq += 1
+            record['seq'] = self.seq
+            self._buffer.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            self.records_since_compaction += 1
+            return self.seq
+
+    def _write_lines(self, lines: List[str]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def flush(self) -> int:
+        """Ghi các record đang chờ xuống cuối file log"""
+        with self._file_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if lines:
+                self._write_lines(lines)
+            return len(lines)
+
+    def needs_compaction(self, max_records: int, max_age: float) -> bool:
+        """Kiểm tra đã đến lúc gộp log vào snapshot chưa"""
+        if self.records_since_compaction == 0:
+            return False
+        return (self.records_since_compaction >= max_records or
+                time.time() - self.last_compaction >= max_age)
+
+    def rotate(self) -> int:
+        """Tách log hiện tại sang file .old, trả về seq cuối cùng thuộc đoạn đã tách.
+        Snapshot chụp sau thời điểm này đã bao gồm mọi record có seq <= giá trị trả về."""
+        with self._file_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+                seq = self.seq
+                self.records_since_compaction = 0
+            if lines:
+                self._write_lines(lines)
+
+            if self.path.exists():
+                if self.rotated_path.exists():
+                    # Lần compaction trước thất bại: nối tiếp vào đoạn cũ
+                    with open(self.path, 'r', encoding='utf-8') as src, \
+                         open(self.rotated_path, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    self.path.unlink()
+                else:
+                    os.replace(self.path, self.rotated_path)
+
+            self.last_compaction = time.time()
+            return seq
+
+    def discard_rotated(self):
+        """Xóa đoạn log đã được gộp vào snapshot"""
+        try:
+            self.rotated_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def replay(self, after_seq: int = 0) -> Iterator[dict]:
+        """Đọc lại các record có seq > after_seq theo thứ tự ghi"""
+        for path in (self.rotated_path, self.path):
+            if not path.exists():
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Dòng cuối bị ghi dở khi server crash
+                        logger.warning(f"Skipping corrupt journal line {line_number} in {path.name}")
+                        continue
+                    seq = record.get('seq', 0)
+                    self.seq = max(self.seq, seq)
+                    if seq > after_seq:
+                        self.records_since_compaction += 1
+                        yield record
+
+
+def apply_journal_record(rooms_data: Dict[str, dict], record: dict):
+    """Áp dụng một record journal lên dữ liệu phòng dạng dict.
+    Các record mang giá trị tuyệt đối nên áp dụng lại nhiều lần vẫn cho cùng kết quả."""
+    op = record.get('op')
+    room_id = record.get('room')
+
+    if op == 'room_created':
+        rooms_data[room_id] = record['data']
+        return
+    if op == 'room_deleted':
+        rooms_data.pop(room_id, None)
+        return
+
+    room = rooms_data.get(room_id)
+    if room is None:
+        return
+
+    if record.get('stats') is not None:
+        room.setdefault('player_stats', {})[record['player']] = record['stats']
+
+    if op == 'player_joined':
+        if record.get('score') is not None:
+            room.setdefault('scores', {})[record['player']] = record['score']
+        room['is_active'] = record.get('is_active', room.get('is_active', True))
+
+    elif op == 'player_left':
+        room['is_active'] = record.get('is_active', room.get('is_active', True))
+
+    elif op == 'guess_made':
+        if record.get('score') is not None:
+            room.setdefault('scores', {})[record['player']] = record['score']
+        current_round = room.get('current_round')
+        if current_round:
+            current_round['total_guesses'] = record.get('total_guesses', current_round.get('total_guesses', 0))
+            if record.get('correct'):
+                current_round['winner'] = record['player']
+        history = record.get('history')
+        if history:
+            game_history = room.setdefault('game_history', [])
+            if not game_history or game_history[-1] != history:
+                game_history.append(history)
+                del game_history[:-HISTORY_LIMIT]
+
+    elif op == 'round_started':
+        room['current_round'] = record['round']
+        room['round_number'] = record['round_number']
+
+    elif op == 'room_reset':
+        room['scores'] = {}
+        room['game_history'] = []
+        room['player_stats'] = {}
@@ -0,0 +1,158 @@
+"""
+Bộ hẹn giờ chung cho các vòng chơi và index hết hạn của phòng
+- RoundScheduler: một min-heap theo end_time và một thread duy nhất cho mọi phòng
+  (thay vì mỗi phòng một timer), nên vòng kết thúc đúng hạn kể cả khi không ai đoán.
+- ExpiryIndex: room_id -> thời điểm hết hạn, lấy ra các phòng tới hạn mà không duyệt mọi phòng.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RoundScheduler:
+    """Gọi on_expire(key, deadline) khi tới deadline.
+    Lên lịch lại cùng key không xóa mục cũ khỏi heap: on_expire tự bỏ qua deadline
+    không còn khớp (vòng đã được thay), mục cũ tự rơi ra khi tới hạn."""
+
+    def __init__(self, on_expire: Callable[[str, float], None], clock: Callable[[], float] = time.time):
+        self._on_expire = on_expire
+        self._clock = clock
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()  # phá hòa khi cùng deadline, giữ thứ tự lên lịch
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        self.stats: Dict[str, float] = {
+            'scheduled': 0,
+            'fired': 0,
+            'errors': 0,
+            'pending': 0,
+            'max_lag_ms': 0.0  # trễ lớn nhất giữa deadline và lúc xử lý
+        }
+
+    def _ensure_thread(self):
+        # Gọi khi đang giữ self._cond
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='round-scheduler', daemon=True)
+            self._thread.start()
+
+    def schedule(self, key: str, deadline: float):
+        """Hẹn gọi on_expire(key, deadline) lúc deadline"""
+        with self._cond:
+            is_earliest = not self._heap or deadline < self._heap[0][0]
+            heapq.heappush(self._heap, (deadline, next(self._counter), key))
+            self.stats['scheduled'] += 1
+            self.stats['pending'] = len(self._heap)
+            self._ensure_thread()
+            if is_earliest:
+                # Thread đang ngủ tới deadline muộn hơn: đánh thức để tính lại
+                self._cond.notify()
+
+    def _pop_due(self, now: float) -> List[Tuple[float, int, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+        self.stats['pending'] = len(self._heap)
+        return due
+
+    def _fire(self, due: List[Tuple[float, int, str]], now: float):
+        for deadline, _, key in due:
+            self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], (now - deadline) * 1000)
+            try:
+                self._on_expire(key, deadline)
+                self.stats['fired'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Round expiry for {key} failed: {e}")
+
+    def run_due(self, now: float = None) -> int:
+        """Xử lý ngay các mục đã tới hạn trên thread gọi, trả về số mục đã xử lý"""
+        now = self._clock() if now is None else now
+        with self._cond:
+            due = self._pop_due(now)
+        self._fire(due, now)
+        return len(due)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - self._clock()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+                now = self._clock()
+                due = self._pop_due(now)
+            # Gọi callback ngoài khóa để schedule() trong callback không bị chặn
+            self._fire(due, now)
+
+    def stop(self):
+        """Dừng thread hẹn giờ (các mục chưa tới hạn bị bỏ)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class ExpiryIndex:
+    """Mỗi key có tối đa một deadline; pop_due() trả về các key đã tới hạn theo thứ tự.
+    Đổi/xóa deadline chỉ sửa dict, mục cũ trong heap bị bỏ qua khi lấy ra (lazy deletion)."""
+
+    def __init__(self):
+        self._deadlines: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def set(self, key: str, deadline: float):
+        with self._lock:
+            if self._deadlines.get(key) == deadline:
+                return
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, key))
+            # Quá nhiều mục cũ: dựng lại heap để bộ nhớ không tăng mãi
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._heap = [(d, k) for k, d in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def get(self, key: str) -> Optional[float]:
+        return self._deadlines.get(key)
+
+    def next_deadline(self) -> Optional[float]:
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[str]:
+        """Lấy ra (và xóa khỏi index) các key có deadline <= now"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) == deadline:
+                    del self._deadlines[key]
+                    due.append(key)
+        return due
@@ -4,13 +4,25 @@ import json
 import time
 import random
 import threading
+import atexit
+import uuid
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
-from flask import Flask, request, jsonify
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, asdict, field
+from flask import Flask, request, jsonify, redirect
 from flask_socketio import SocketIO, emit, join_room, leave_room, rooms as socket_rooms
 from flask_cors import CORS
+from persistence import WriteBehindSaver, EventJournal, SnapshotBatch, SnapshotWriter, apply_journal_record
+from storage import PartialWriteError, create_storage_backend
+from leaderboard import Leaderboard, GlobalLeaderboard
+from scheduler import RoundScheduler, ExpiryIndex
+from cluster import Cluster, ClusterDirectory, ClusterLeaderboard, peer_data_files
+from bus import create_bus_manager
+from outbox import RoomOutbox, COALESCED_EVENTS
+from wire import WireClients, wire_group
+from engine import EngineConfig, TransportMetrics, install_websocket_deflate
+from backpressure import SlowConsumers
 # import eventlet  # Commented out for Python 3.13+ compatibility
 
 # Cấu hình logging
@@ -35,7 +47,93 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'guess_number_secret_key_2024')
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+
+
+# Client đã thỏa thuận payload msgpack khi kết nối (xem wire.py)
+wire_clients = WireClients()
+
+
+class SocketTransport:
+    """Lớp gửi/nhận sự kiện mà GameManager và các socket handler dùng.
+    Mặc định đi qua Flask-SocketIO (context request hiện tại); chế độ asyncio
+    (async_server.py) thay bằng bản của nó qua set_transport() để dùng chung handler.
+    Bản thay thế chỉ cần cài lại emit_to, _reply, _join, current_sid, sio_server và disconnect_client."""
+
+    def broadcast(self, event, data, to=None):
+        """Gửi tới một Socket.IO room / sid (to=None: mọi client)"""
+        # Client đang chậm không nhận thêm sự kiện chỉ mang trạng thái (xem backpressure.py)
+        shed = slow_consumers.shed(event, to, data)
+        if to in shed:
+            return
+        binary = wire_clients.members(to) - shed
+        if to not in binary:
+            # Phần còn lại của room nhận JSON như cũ
+            self.emit_to(event, data, to=to, **_skip(binary | shed))
+        if binary:
+            self.emit_to(event, wire_clients.encode(data), to=to if to in binary else wire_group(to),
+                         **_skip(shed))
+
+    def reply(self, event, data):
+        """Trả lời client đang gửi sự kiện"""
+        if wire_clients and wire_clients.is_binary(self.current_sid()):
+            self.emit_to(event, wire_clients.encode(data), to=self.current_sid())
+        else:
+            self._reply(event, data)
+
+    def enter_room(self, room_id):
+        """Cho client đang gửi sự kiện vào Socket.IO room"""
+        self._join(room_id)
+        if wire_clients and wire_clients.enter(self.current_sid(), room_id):
+            self._join(wire_group(room_id))
+
+    def emit_to(self, event, data, to=None, **kwargs):
+        socketio.emit(event, data, to=to, **kwargs)
+
+    def _reply(self, event, data):
+        emit(event, data)
+
+    def _join(self, room_id):
+        join_room(room_id)
+
+    def current_sid(self) -> str:
+        return request.sid
+
+    def sio_server(self):
+        """socketio.Server bên dưới (AsyncServer ở chế độ asyncio)"""
+        return socketio.server
+
+    def disconnect_client(self, sid: str):
+        """Ngắt kết nối ngay, không chờ gửi hết hàng đợi của client"""
+        socketio.server.disconnect(sid, ignore_queue=True)
+
+    def transport_name(self, sid: str) -> Optional[str]:
+        """'polling' hoặc 'websocket'; None nếu phiên Engine.IO không còn"""
+        try:
+            return self.sio_server().transport(sid)
+        except KeyError:
+            return None
+
+    def queue_depths(self) -> Dict[str, int]:
+        """sid -> số packet Engine.IO đang chờ gửi cho client đó"""
+        sio = self.sio_server()
+        depths = {}
+        for eio_sid, eio_socket in list(sio.eio.sockets.items()):
+            sid = sio.manager.sid_from_eio_sid(eio_sid, '/')
+            if sid is not None:
+                depths[sid] = eio_socket.queue.qsize()
+        return depths
+
+
+def _skip(sids: Set[str]) -> dict:
+    return {'skip_sid': list(sids)} if sids else {}
+
+
+transport = SocketTransport()
+
+
+def set_transport(new_transport: SocketTransport):
+    global transport
+    transport = new_transport
 
 # Cấu hình game
 GAME_CONFIG = {
@@ -56,9 +154,54 @@ GAME_CONFIG = {
     'MIN_ROOM_ID_LENGTH': 3,
     'MAX_ROOM_ID_LENGTH': 30,
     'MIN_ROOM_NAME_LENGTH': 3,
-    'MAX_ROOM_NAME_LENGTH': 50
+    'MAX_ROOM_NAME_LENGTH': 50,
+    # Persistence settings
+    'PERSIST_ENABLED': os.environ.get('GAME_PERSISTENCE', '1') != '0',  # 0 = chỉ giữ trong bộ nhớ
+    'DATA_FILE': os.environ.get('GAME_DATA_FILE'),  # None = server/game_data.json
+    'PERSIST_INTERVAL': 2.0,      # giây giữa các lần flush (0 = ghi ngay)
+    'PERSIST_MAX_DIRTY': 20,      # flush sớm khi số phòng thay đổi đạt ngưỡng
+    'PERSIST_JOURNAL': True,      # ghi thay đổi vào journal append-only thay vì ghi lại snapshot
+    'JOURNAL_COMPACT_RECORDS': 1000,  # gộp journal vào snapshot sau số record này
+    'JOURNAL_COMPACT_INTERVAL': 300,  # hoặc sau số giây này
+    # 'sharded' = mỗi phòng một file, 'json' = một game_data.json, 'sqlite' = SQLite (WAL)
+    'STORAGE_BACKEND': os.environ.get('GAME_STORAGE_BACKEND', 'sharded'),
+    # 'json' hoặc 'binary' (msgpack + zlib, nhỏ hơn nhiều); khi đọc tự nhận diện định dạng
+    'SNAPSHOT_FORMAT': os.environ.get('GAME_SNAPSHOT_FORMAT', 'json'),
+    'SNAPSHOT_LOAD_WORKERS': 8,       # số thread đọc shard song song khi khởi động
+    'SNAPSHOT_QUEUE_SIZE': 8,         # số lô snapshot tối đa chờ thread ghi
+    'LAZY_HYDRATION': True,           # khởi động chỉ đọc index, dựng Room khi truy cập lần đầu
+    'LEADERBOARD_SIZE': 10,           # số người đứng đầu gửi cho client
+    'STATE_CHANGE_RING': 256,         # số delta gần nhất mỗi phòng giữ cho client bị tụt lại
+    'ROUND_SCHEDULER': True,          # kết thúc vòng đúng hạn bằng một thread hẹn giờ chung cho mọi phòng
+    # Dọn phòng trống
+    'EMPTY_ROOM_TTL': 300,            # xóa phòng không có người chơi sau số giây này
+    'CLEANUP_INTERVAL': 60,           # giây giữa các lần dọn
+    'PINNED_ROOMS': ('lobby', 'demo'), # phòng mặc định không bao giờ bị dọn
+    # Bus phát emit sang các tiến trình khác: unix:///path.sock hoặc redis://host:port (None = tắt)
+    'BROADCAST_BUS': os.environ.get('GAME_BROADCAST_BUS'),
+    'BUS_TICK_MS': 5,                 # gom các emit trong mỗi tick thành một frame
+    # Gom vào/rời phòng, bảng điểm, chat... của một phòng trong mỗi tick thành một 'room_batch' (0 = tắt)
+    'BROADCAST_TICK_MS': int(os.environ.get('GAME_BROADCAST_TICK_MS', '0')),
+    # Client chậm: số packet chờ gửi của một kết nối để coi là chậm (0 = tắt) / để ngắt kết nối (0 = không ngắt)
+    'SLOW_CONSUMER_QUEUE': int(os.environ.get('GAME_SLOW_CONSUMER_QUEUE', '64')),
+    'SLOW_CONSUMER_DISCONNECT': int(os.environ.get('GAME_SLOW_CONSUMER_DISCONNECT', '1024')),
+    # drop: bỏ sự kiện gom được khi chậm; snapshot: thêm snapshot phòng mới nhất khi client bắt kịp
+    'SLOW_CONSUMER_POLICY': os.environ.get('GAME_SLOW_CONSUMER_POLICY', 'snapshot'),
+    'QUEUE_SAMPLE_MS': 500,           # chu kỳ đo hàng đợi gửi
 }
 
+# Khi có bus, mọi emit tới client cục bộ như cũ rồi được chuyển tới các tiến trình khác
+broadcast_bus = create_bus_manager(GAME_CONFIG['BROADCAST_BUS'], GAME_CONFIG['BUS_TICK_MS'])
+# Transport, ping, bộ đệm HTTP và nén WebSocket (start_server.py --transport-profile ..., xem engine.py)
+engine_config = EngineConfig.from_env()
+install_websocket_deflate(engine_config.deflate_threshold)
+transport_metrics = TransportMetrics()
+socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True,
+                    client_manager=broadcast_bus, **engine_config.server_options())
+
+# Chạy nhiều worker (start_server.py --workers N): phòng thuộc worker nào do consistent hash quyết định
+cluster = Cluster.from_env()
+
 @dataclass
 class Player:
     name: str
@@ -117,7 +260,7 @@ class Room:
     created_at: float
     current_round: GameRound
     players: Dict[str, Player]
-    scores: Dict[str, int]
+    scores: Dict[str, int]  # Leaderboard: tên -> điểm, luôn sắp xếp sẵn
     round_number: int
     is_active: bool
     max_players: int
@@ -125,146 +268,747 @@ class Room:
     is_private: bool = False
     game_history: deque = None
     last_activity: float = 0 # Thêm trường để theo dõi hoạt động gần đây
+    player_sids: Dict[str, str] = None  # tên người chơi -> sid đang kết nối
+    player_stats: Dict[str, dict] = None  # tên người chơi -> thống kê đã lưu (kể cả người đã rời phòng)
+    # Mọi thay đổi trạng thái phòng đi qua khóa này: lượt đoán trong một phòng chạy lần lượt,
+    # các phòng khác nhau vẫn chạy song song
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+    # Mỗi thay đổi gửi cho client (vào/rời, điểm, vòng mới, reset) tăng state_seq và nằm trong
+    # vòng đệm changes; epoch đổi sau mỗi lần dựng phòng nên seq cũ của client không bị hiểu nhầm
+    state_seq: int = 0
+    state_epoch: str = field(default_factory=lambda: uuid.uuid4().hex[:8], repr=False, compare=False)
+    changes: deque = field(default_factory=lambda: deque(maxlen=GAME_CONFIG['STATE_CHANGE_RING']),
+                           repr=False, compare=False)
 
     def __post_init__(self):
+        if not isinstance(self.scores, Leaderboard):
+            self.scores = Leaderboard(self.scores or {})
         if self.game_history is None:
             self.game_history = deque(maxlen=10)
+        if self.player_sids is None:
+            self.player_sids = {}
+        if self.player_stats is None:
+            self.player_stats = {}
         self.last_activity = time.time() # Khởi tạo khi tạo phòng
 
-class GameManager:
+def normalize_room_id(room_id: str) -> str:
+    """Chuẩn hóa room ID (chuyển về chữ thường)"""
+    return room_id.lower().strip()
+
+class RoomIndex(dict):
+    """Dict room_id -> giá trị kèm index ID đã chuẩn hóa -> room_id gốc,
+    để tìm phòng không phân biệt chữ hoa/thường trong O(1)"""
+
+    def __init__(self, *args, on_change=None, **kwargs):
+        super().__init__()
+        self._normalized: Dict[str, str] = {}
+        # on_change(room_id, value) được gọi sau mỗi thay đổi, value=None khi bị xóa
+        self._on_change = on_change
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, room_id, value):
+        super().__setitem__(room_id, value)
+        self._normalized[normalize_room_id(room_id)] = room_id
+        if self._on_change:
+            self._on_change(room_id, value)
+
+    def __delitem__(self, room_id):
+        super().__delitem__(room_id)
+        self._forget(room_id)
+
+    def _forget(self, room_id):
+        normalized_id = normalize_room_id(room_id)
+        if self._normalized.get(normalized_id) == room_id:
+            del self._normalized[normalized_id]
+        if self._on_change:
+            self._on_change(room_id, None)
+
+    def pop(self, room_id, *default):
+        if room_id not in self:
+            return super().pop(room_id, *default)
+        value = super().pop(room_id)
+        self._forget(room_id)
+        return value
+
+    def popitem(self):
+        room_id, value = super().popitem()
+        self._forget(room_id)
+        return room_id, value
+
+    def setdefault(self, room_id, default=None):
+        if room_id not in self:
+            self[room_id] = default
+        return self[room_id]
+
+    def update(self, *args, **kwargs):
+        for room_id, value in dict(*args, **kwargs).items():
+            self[room_id] = value
+
+    def clear(self):
+        room_ids = list(self) if self._on_change else []
+        super().clear()
+        self._normalized.clear()
+        for room_id in room_ids:
+            self._on_change(room_id, None)
+
+    def resolve(self, room_id: str) -> Optional[str]:
+        """Trả về room_id gốc khớp với room_id (không phân biệt chữ hoa/thường)"""
+        if room_id in self:
+            return room_id
+        return self._normalized.get(normalize_room_id(room_id))
+
+class RoomDirectory:
+    """Danh sách phòng công khai được cập nhật dần mỗi khi phòng thay đổi,
+    thay vì duyệt lại mọi phòng ở mỗi lần client hỏi.
+    Mỗi thay đổi tăng version; payload JSON chỉ serialize một lần cho mỗi version"""
+
     def __init__(self):
-        self.rooms: Dict[str, Room] = {}
+        self._lock = threading.Lock()
+        self._members: Set[str] = set()      # mọi phòng (để tính total)
+        self._entries: Dict[str, dict] = {}  # phòng công khai đang hoạt động
+        # Khởi tạo theo thời gian: sau restart không trùng version client đang giữ
+        self.version = int(time.time() * 1000)
+        self._rooms_cache: Optional[List[dict]] = None
+        self._payload_cache: Optional[str] = None
+
+    def put(self, room_id: str, entry: Optional[dict]):
+        """Thêm/cập nhật phòng; entry=None nếu phòng không hiện trong danh sách"""
+        with self._lock:
+            changed = room_id not in self._members
+            self._members.add(room_id)
+            if entry is None:
+                changed |= self._entries.pop(room_id, None) is not None
+            elif self._entries.get(room_id) != entry:
+                self._entries[room_id] = entry
+                changed = True
+            if changed:
+                self._bump()
+
+    def remove(self, room_id: str):
+        with self._lock:
+            if room_id not in self._members:
+                return
+            self._members.discard(room_id)
+            self._entries.pop(room_id, None)
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self._rooms_cache = None
+        self._payload_cache = None
+
+    def snapshot(self) -> Tuple[int, List[dict]]:
+        """(version, danh sách phòng); danh sách được dùng chung, không được sửa"""
+        with self._lock:
+            if self._rooms_cache is None:
+                self._rooms_cache = list(self._entries.values())
+            return self.version, self._rooms_cache
+
+    def payload(self) -> Tuple[int, str]:
+        """(version, body JSON của GET /api/rooms) đã serialize sẵn"""
+        with self._lock:
+            if self._payload_cache is None:
+                self._payload_cache = json.dumps({
+                    'rooms': list(self._entries.values()),
+                    'total': len(self._members),
+                    'version': self.version
+                })
+            return self.version, self._payload_cache
+
+class GameManager:
+    def __init__(self, persistence_file: Optional[Path] = None):
+        # Danh sách phòng công khai, đồng bộ qua on_change của hai RoomIndex bên dưới
+        self.directory = RoomDirectory()
+        self.rooms: Dict[str, Room] = RoomIndex(on_change=self._on_room_changed)
+        # Phòng đã lưu nhưng chưa dựng thành Room: room_id -> room_summary
+        self._cold_index: Dict[str, dict] = RoomIndex(on_change=self._on_cold_room_changed)
+        self._hydrate_lock = threading.Lock()
+        # Bảo vệ việc thêm/xóa trong rooms, _cold_index và player_rooms. Thứ tự khóa luôn là
+        # room.lock -> _registry_lock; giữ _registry_lock thì không được chờ room.lock
+        self._registry_lock = threading.RLock()
         self.player_rooms: Dict[str, str] = {}  # sid -> room_id
+        # Tổng điểm của mỗi người chơi trên mọi phòng, cập nhật trong make_guess
+        self.global_leaderboard = GlobalLeaderboard()
+        # Min-heap theo end_time của vòng hiện tại, một thread cho mọi phòng
+        self.round_scheduler = RoundScheduler(self._expire_round)
+        # Phòng trống -> thời điểm bị dọn; phòng có người chơi không nằm trong index
+        self.room_expiry = ExpiryIndex()
+        self.cleanup_stats: Dict[str, float] = {
+            'runs': 0,
+            'reaped': 0,        # tổng số phòng đã dọn
+            'reaped_cold': 0,   # trong đó số phòng chưa dựng (xóa thẳng từ index)
+            'last_reaped': 0,
+            'last_run_ms': 0.0
+        }
+        self._cleanup_stopped = False
         self.cleanup_thread = None
-        self.persistence_file = Path(__file__).parent / 'game_data.json'
-        self.load_rooms_from_file()  # Load rooms từ file khi khởi động
+        # Truyền persistence_file tường minh thì luôn bật lưu trữ
+        self.persistence_enabled = persistence_file is not None or GAME_CONFIG['PERSIST_ENABLED']
+        self.persistence_file = Path(persistence_file or GAME_CONFIG['DATA_FILE'] or Path(__file__).parent / 'game_data.json')
+        self.storage = None
+        if self.persistence_enabled:
+            self.storage = create_storage_backend(
+                GAME_CONFIG['STORAGE_BACKEND'],
+                self.persistence_file,
+                load_workers=GAME_CONFIG['SNAPSHOT_LOAD_WORKERS'],
+                snapshot_format=GAME_CONFIG['SNAPSHOT_FORMAT']
+            )
+        # Phòng đã thay đổi/bị xóa kể từ snapshot gần nhất
+        self._snapshot_dirty: Set[str] = set()
+        self._snapshot_deleted: Set[str] = set()
+        # Các vòng đã kết thúc chờ ghi vào backend (SQLite giữ toàn bộ lịch sử)
+        self._pending_history: List[Tuple[str, Optional[dict]]] = []  # entry None: phòng reset
+        # Bản sao phòng chụp ngay sau mỗi thay đổi: thread ghi không đọc Room đang bị sửa
+        self._captured: Dict[str, dict] = {}
+        # Journal append-only: mỗi thay đổi là một dòng nhỏ, snapshot chỉ ghi khi compaction.
+        # Backend SQLite đã cập nhật từng dòng trong transaction nên không cần journal
+        self.journal = None
+        if self.storage and self.storage.journaled and GAME_CONFIG['PERSIST_JOURNAL']:
+            self.journal = EventJournal(self.persistence_file.with_suffix('.journal'))
+        self._compact_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()  # bảo vệ _snapshot_dirty/_snapshot_deleted
+        # Ghi theo lô: các thay đổi được gom lại và flush định kỳ
+        self.saver = WriteBehindSaver(
+            self._persist,
+            interval=GAME_CONFIG['PERSIST_INTERVAL'],
+            max_dirty=GAME_CONFIG['PERSIST_MAX_DIRTY']
+        )
+        # Serialize và ghi đĩa trên thread riêng, hàng đợi giới hạn tạo back-pressure
+        self.snapshot_writer = SnapshotWriter(
+            self._write_batch,
+            on_error=self._requeue_batch,
+            max_queue=GAME_CONFIG['SNAPSHOT_QUEUE_SIZE']
+        )
+        if self.persistence_enabled:
+            self.load_rooms_from_file()  # Load rooms từ file khi khởi động
         self.start_cleanup_thread()
 
-    def save_rooms_to_file(self):
-        """Lưu rooms vào file JSON"""
+    def _record(self, room: Room, op: str, **fields):
+        """Ghi một thay đổi nhỏ vào journal và đánh dấu phòng dirty"""
+        room.last_activity = time.time()
+        if not self.persistence_enabled:
+            return
+        # Đánh dấu trước khi ghi journal: record nào nằm trước điểm compaction
+        # thì phòng của nó chắc chắn đã được đánh dấu
+        snapshot = self._room_to_dict(room)
+        with self._snapshot_lock:
+            self._captured[room.id] = snapshot
+            if fields.get('history'):
+                self._pending_history.append((room.id, fields['history']))
+            elif op == 'room_reset':
+                # Lịch sử đã lưu bị xóa trước các vòng mới, kể cả khi chúng nằm cùng một lô ghi
+                self._pending_history.append((room.id, None))
+        self.saver.mark_dirty(room.id)
+        if self.journal:
+            record = {'op': op, 'room': room.id, 'ts': time.time()}
+            record.update(fields)
+            self.journal.append(record)
+
+    def save_rooms_to_file(self) -> bool:
+        """Lưu ngay tất cả thay đổi đang chờ xuống file và chờ ghi xong.
+        Trả về False nếu ghi lỗi (thay đổi được giữ lại để lần ghi sau thử lại).
+        Có journal thì thay đổi đã bền khi nằm trong journal; không có journal thì phải chờ
+        kết quả các lô snapshot mà thread ghi xử lý."""
+        flushed = self.saver.flush()
+        self.snapshot_writer.wait_idle()
+        if self.journal is not None or not flushed:
+            return flushed
+        # Lô lỗi (vừa rồi hoặc từ trước) đã được đưa lại vào hàng chờ: ghi lại ngay và chờ kết quả
+        with self._snapshot_lock:
+            pending = bool(self._snapshot_dirty or self._snapshot_deleted or self._pending_history)
+        if pending or self.global_leaderboard.has_dirty():
+            return self._write_snapshot().wait()
+        return True
+
+    def shutdown(self):
+        """Flush dữ liệu lần cuối khi tắt server"""
+        self._cleanup_stopped = True
+        self.round_scheduler.stop()
+        self.saver.stop()
+        if self.persistence_enabled and self.journal:
+            # Gộp log vào snapshot để lần khởi động sau không phải replay
+            self.compact()
+        self.snapshot_writer.stop()
+        if self.storage:
+            self.storage.close()
+
+    def get_persistence_stats(self) -> dict:
+        """Số liệu của lớp lưu trữ (độ sâu hàng đợi, thời gian chờ, thời gian ghi)"""
+        return {
+            'enabled': self.persistence_enabled,
+            'backend': type(self.storage).__name__ if self.storage else None,
+            'pending_rooms': self.saver.pending_count(),
+            'journal_seq': self.journal.seq if self.journal else None,
+            'saver': dict(self.saver.stats),
+            'writer': dict(self.snapshot_writer.stats)
+        }
+
+    def _persist(self, dirty_ids, deleted_ids):
+        """Callback của write-behind saver"""
+        with self._snapshot_lock:
+            self._snapshot_dirty -= deleted_ids
+            self._snapshot_dirty |= dirty_ids
+            self._snapshot_deleted -= dirty_ids
+            self._snapshot_deleted |= deleted_ids
+
+        if self.journal is None:
+            self._write_snapshot()
+            return
+
+        self.journal.flush()
+        if self.journal.needs_compaction(GAME_CONFIG['JOURNAL_COMPACT_RECORDS'],
+                                         GAME_CONFIG['JOURNAL_COMPACT_INTERVAL']):
+            self.compact()
+
+    def compact(self) -> bool:
+        """Gộp journal vào snapshot mới rồi xóa phần log đã gộp, trả về True nếu thành công"""
+        with self._compact_lock:
+            try:
+                journal_seq = self.journal.rotate()
+                batch = self._write_snapshot(journal_seq=journal_seq)
+                if not batch.wait():
+                    logger.error(f"Journal compaction failed: {batch.error}")
+                    return False
+                self.journal.discard_rotated()
+                logger.info(f"Compacted journal into snapshot at seq {journal_seq}")
+                return True
+            except Exception as e:
+                # Đoạn log đã tách vẫn được giữ lại và sẽ được replay khi khởi động
+                logger.error(f"Journal compaction failed: {e}")
+                return False
+
+    def _room_to_dict(self, room: Room) -> dict:
+        """Chuyển Room thành dict có thể serialize (không lưu players vì sid không còn giá trị sau restart)"""
+        with room.lock:
+            return {
+                'id': room.id,
+                'name': room.name,
+                'created_at': room.created_at,
+                # GameRound chỉ chứa giá trị đơn giản nên sao chép nông là đủ (rẻ hơn asdict)
+                'current_round': dict(vars(room.current_round)) if room.current_round else None,
+                'scores': dict(room.scores),
+                'round_number': room.round_number,
+                'is_active': room.is_active,
+                'max_players': room.max_players,
+                'password': room.password,
+                'is_private': room.is_private,
+                'game_history': list(room.game_history),
+                'player_stats': {name: dict(stats) for name, stats in room.player_stats.items()},
+                'last_activity': room.last_activity
+            }
+
+    def _room_from_dict(self, room_dict: dict) -> Room:
+        """Tạo lại Room object từ dict đã lưu"""
+        round_data = room_dict.get('current_round')
+        current_round = None
+        if round_data:
+            current_round = GameRound(
+                number=round_data['number'],
+                range_low=round_data['range_low'],
+                range_high=round_data['range_high'],
+                start_time=round_data['start_time'],
+                end_time=round_data['end_time'],
+                winner=round_data.get('winner'),
+                total_guesses=round_data.get('total_guesses', 0)
+            )
+
+        room = Room(
+            id=room_dict['id'],
+            name=room_dict['name'],
+            created_at=room_dict['created_at'],
+            current_round=current_round,
+            players={},
+            scores=Leaderboard(room_dict.get('scores', {})),
+            round_number=room_dict.get('round_number', 1),
+            is_active=room_dict.get('is_active', True),
+            max_players=room_dict['max_players'],
+            password=room_dict.get('password'),
+            is_private=room_dict.get('is_private', False),
+            game_history=deque(room_dict.get('game_history', []), maxlen=10),
+            player_stats={name: dict(stats) for name, stats in room_dict.get('player_stats', {}).items()}
+        )
+        # __post_init__ ghi đè last_activity, khôi phục lại giá trị đã lưu
+        room.last_activity = room_dict.get('last_activity', room.created_at)
+        return room
+
+    def _write_snapshot(self, journal_seq: int = 0) -> SnapshotBatch:
+        """Gom bản sao các phòng đã thay đổi thành một lô và gửi cho thread ghi"""
+        with self._snapshot_lock:
+            # Phòng vẫn chờ trong saver cũng phải vào snapshot vì record của chúng đã nằm trong journal
+            pending_dirty, pending_deleted = self.saver.peek_pending()
+            dirty_ids = (self._snapshot_dirty | pending_dirty) - pending_deleted
+            deleted_ids = (self._snapshot_deleted | pending_deleted) - pending_dirty
+            self._snapshot_dirty, self._snapshot_deleted = set(), set()
+            history, self._pending_history = self._pending_history, []
+            captured = {room_id: self._captured.pop(room_id)
+                        for room_id in dirty_ids if room_id in self._captured}
+
+        current_time = time.time()
+        rooms_data = {}
+        for room_id in dirty_ids:
+            room = self.rooms.get(room_id)
+            # Chỉ lưu rooms có người chơi hoặc mới tạo gần đây
+            if room and (len(room.players) > 0 or (current_time - room.created_at) < 3600):  # 1 giờ
+                # Phòng chưa có bản chụp (vd. vừa chuyển đổi định dạng) thì chụp tại đây
+                rooms_data[room_id] = captured.get(room_id) or self._room_to_dict(room)
+            else:
+                deleted_ids.add(room_id)
+
+        history = [(room_id, entry) for room_id, entry in history if room_id in rooms_data]
+        return self.snapshot_writer.submit(SnapshotBatch(rooms_data, deleted_ids, history, journal_seq,
+                                                         self.global_leaderboard.take_dirty()))
+
+    def _write_batch(self, batch: SnapshotBatch):
+        """Chạy trên thread ghi: serialize và ghi lô xuống backend"""
         try:
-            # Chuyển đổi rooms thành dict có thể serialize
-            rooms_data = {}
-            for room_id, room in self.rooms.items():
-                # Chỉ lưu rooms có người chơi hoặc mới tạo gần đây
-                if len(room.players) > 0 or (time.time() - room.created_at) < 3600:  # 1 giờ
-                    room_dict = asdict(room)
-                    # Chuyển đổi datetime objects thành timestamp
-                    room_dict['created_at'] = room.created_at
-                    room_dict['last_activity'] = room.last_activity
-                    if room.current_round:
-                        room_dict['current_round'] = asdict(room.current_round)
-                        room_dict['current_round']['start_time'] = room.current_round.start_time
-                        room_dict['current_round']['end_time'] = room.current_round.end_time
-                    rooms_data[room_id] = room_dict
-            
-            with open(self.persistence_file, 'w', encoding='utf-8') as f:
-                json.dump(rooms_data, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"Saved {len(rooms_data)} rooms to file")
-        except Exception as e:
-            logger.error(f"Error saving rooms to file: {e}")
+            for room_id, entry in batch.history:
+                if entry is None:
+                    self.storage.clear_history(room_id)
+                else:
+                    self.storage.append_history(room_id, entry)
+            self.storage.write(batch.rooms, batch.deleted, batch.journal_seq, batch.global_scores)
+        except Exception:
+            # SQLite: bỏ các dòng đã ghi dở, lô được đưa lại và ghi từ đầu
+            self.storage.rollback()
+            raise
+        logger.info(f"Saved {len(batch.rooms)} rooms to snapshot ({len(batch.deleted)} removed)")
+
+    def _requeue_batch(self, batch: SnapshotBatch):
+        """Lô ghi lỗi: giữ lại để lần ghi sau thử lại"""
+        if isinstance(batch.error, PartialWriteError):
+            # Các phòng khác đã ghi xong, chỉ thử lại phòng lỗi
+            failed = batch.error.failed_rooms
+            batch = SnapshotBatch({room_id: room_dict for room_id, room_dict in batch.rooms.items() if room_id in failed},
+                                  set(), [(room_id, entry) for room_id, entry in batch.history if room_id in failed])
+        with self._snapshot_lock:
+            self._snapshot_dirty |= set(batch.rooms)
+            self._snapshot_deleted |= batch.deleted
+            for room_id, room_dict in batch.rooms.items():
+                # Bản chụp mới hơn (nếu có) được ưu tiên
+                self._captured.setdefault(room_id, room_dict)
+            self._pending_history[:0] = batch.history
+        self.global_leaderboard.mark_dirty(batch.global_scores)
 
     def load_rooms_from_file(self):
-        """Load rooms từ file JSON"""
+        """Load rooms từ snapshot rồi replay phần journal phía sau.
+        Nếu backend có index thì chỉ đọc index, phòng được dựng khi truy cập lần đầu."""
         try:
-            if self.persistence_file.exists():
-                with open(self.persistence_file, 'r', encoding='utf-8') as f:
-                    rooms_data = json.load(f)
-                
-                for room_id, room_dict in rooms_data.items():
-                    try:
-                        # Tạo lại Room object từ data
-                        room = Room(
-                            id=room_dict['id'],
-                            name=room_dict['name'],
-                            max_players=room_dict['max_players'],
-                            password=room_dict.get('password'),
-                            is_private=room_dict.get('is_private', False),
-                            created_at=room_dict['created_at'],
-                            last_activity=room_dict['last_activity']
-                        )
-                        
-                        # Khôi phục current_round nếu có
-                        if 'current_round' in room_dict and room_dict['current_round']:
-                            round_data = room_dict['current_round']
-                            room.current_round = GameRound(
-                                number=round_data['number'],
-                                range_low=round_data['range_low'],
-                                range_high=round_data['range_high'],
-                                start_time=round_data['start_time'],
-                                end_time=round_data['end_time']
-                            )
-                        
-                        # Khôi phục scores
-                        if 'scores' in room_dict:
-                            room.scores = room_dict['scores']
-                        
-                        # Khôi phục round_number
-                        if 'round_number' in room_dict:
-                            room.round_number = room_dict['round_number']
-                        
-                        self.rooms[room_id] = room
-                        logger.info(f"Loaded room: {room_id} - {room.name}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error loading room {room_id}: {e}")
-                        continue
-                
-                logger.info(f"Successfully loaded {len(self.rooms)} rooms from file")
+            indexed = self.storage.load_index() if GAME_CONFIG['LAZY_HYDRATION'] else None
+            if indexed is not None:
+                index, journal_seq = indexed
+                rooms_data = {}
             else:
+                index = {}
+                rooms_data, journal_seq = self.storage.load_all()
+            self.global_leaderboard.load(self.storage.load_global_scores())
+
+            records = list(self.journal.replay(after_seq=journal_seq)) if self.journal else []
+            if records:
+                touched = {record.get('room') for record in records}
+                # Phòng có thay đổi sau snapshot phải được dựng ngay để áp dụng journal
+                for room_id in touched & set(index):
+                    room_dict = self.storage.load_room(room_id)
+                    if room_dict is not None:
+                        rooms_data[room_id] = room_dict
+                known = set(rooms_data) | set(index)
+                for record in records:
+                    apply_journal_record(rooms_data, record)
+                    if record.get('global_score') is not None:
+                        # Đánh dấu lại để snapshot tiếp theo ghi điểm chung vừa replay
+                        self.global_leaderboard.set(record['player'], record['global_score'])
+                logger.info(f"Replayed {len(records)} journal records after snapshot seq {journal_seq}")
+
+                # Snapshot tiếp theo phải chứa các thay đổi vừa replay,
+                # nếu không compaction sẽ xóa journal mà snapshot vẫn là bản cũ
+                with self._snapshot_lock:
+                    self._snapshot_dirty |= touched & set(rooms_data)
+                    self._snapshot_deleted |= (touched & known) - set(rooms_data)
+                for room_id in touched:
+                    index.pop(room_id, None)
+
+            if not rooms_data and not index and not self.storage.exists():
                 logger.info("No persistence file found, starting with empty rooms")
-                
-        except Exception as e:
-            logger.error(f"Error loading rooms from file: {e}")
+                return
 
-    def start_cleanup_thread(self):
-        """Khởi động thread dọn dẹp phòng không hoạt động"""
-        def cleanup_inactive_rooms():
-            while True:
+            with self._hydrate_lock:
+                self._cold_index = RoomIndex(index, on_change=self._on_cold_room_changed)
+
+            for room_id, room_dict in rooms_data.items():
                 try:
-                    current_time = time.time()
-                    inactive_rooms = []
+                    # Tạo lại Room object từ data
+                    room = self._room_from_dict(room_dict)
+                    self.rooms[room_id] = room
+                    logger.info(f"Loaded room: {room_id} - {room.name}")
+
+                except Exception as e:
+                    logger.error(f"Error loading room {room_id}: {e}")
+                    continue
+
+            if self.storage.migrated:
+                # Chuyển từ game_data.json cũ: lần ghi tới ghi đủ mọi phòng
+                for room_id in self.rooms:
+                    self.saver.mark_dirty(room_id)
+
+            logger.info(f"Successfully loaded {len(self.rooms)} rooms from file "
+                        f"({len(self._cold_index)} more indexed for lazy loading)")
 
-                    for room_id, room in self.rooms.items():
-                        # Xóa phòng không có người chơi trong 5 phút
-                        if len(room.players) == 0 and (current_time - room.created_at) > 300:
-                            inactive_rooms.append(room_id)
-                        # Xóa phòng không hoạt động trong 10 phút
-                        elif not room.is_active and (current_time - room.created_at) > 600:
-                            inactive_rooms.append(room_id)
+        except Exception as e:
+            logger.error(f"Error loading rooms from file: {e}")
 
-                    for room_id in inactive_rooms:
-                        self.delete_room(room_id)
-                        logger.info(f"Cleaned up inactive room: {room_id}")
+    def _read_peer_rooms(self, data_file: Path) -> Dict[str, dict]:
+        """Mọi phòng trong file của một worker khác (snapshot + journal phía sau), chỉ đọc"""
+        storage = create_storage_backend(GAME_CONFIG['STORAGE_BACKEND'], data_file,
+                                         load_workers=GAME_CONFIG['SNAPSHOT_LOAD_WORKERS'],
+                                         snapshot_format=GAME_CONFIG['SNAPSHOT_FORMAT'])
+        try:
+            # Worker chưa từng compaction chỉ có journal
+            rooms_data, journal_seq = storage.load_all() if storage.exists() else ({}, 0)
+        finally:
+            storage.close()
+        if storage.journaled:
+            for record in EventJournal(data_file.with_suffix('.journal')).replay(after_seq=journal_seq):
+                apply_journal_record(rooms_data, record)
+        return rooms_data
+
+    def _stored_activity(self, room_id: str) -> Optional[float]:
+        """last_activity của phòng worker này đang giữ (đã dựng hoặc chỉ có trong index)"""
+        room = self.rooms.get(room_id)
+        if room is not None:
+            return room.last_activity
+        summary = self._cold_index.get(room_id)
+        if summary is not None:
+            return summary.get('last_activity') or summary.get('created_at') or 0
+        return None
 
-                    # Lưu rooms vào file sau mỗi lần cleanup
-                    self.save_rooms_to_file()
+    def rebalance(self, cluster: Cluster) -> Tuple[int, int]:
+        """Số worker đổi thì chủ của một phần phòng cũng đổi (consistent hash). Gọi ngay sau khi load:
+        - nhận các phòng worker này sở hữu từ file của các worker khác, nếu bản ở đó mới hơn
+        - bỏ khỏi bộ nhớ các phòng không còn thuộc worker này; chúng chỉ bị xóa khỏi file của worker này
+          khi file của worker sở hữu đã có bản mới bằng hoặc hơn, nếu chưa thì giữ lại để worker đó nhận
+        Trả về (số phòng nhận, số phòng bỏ)"""
+        if not self.persistence_enabled:
+            return 0, 0
+
+        peers: Dict[int, Dict[str, dict]] = {}
+        for worker, data_file in peer_data_files(self.persistence_file).items():
+            try:
+                peers[worker] = self._read_peer_rooms(data_file)
+            except Exception as e:
+                logger.error(f"Error reading rooms of worker {worker} from {data_file}: {e}")
+
+        adopted = {}
+        for worker in sorted(peers):
+            for room_id, room_dict in peers[worker].items():
+                if not cluster.is_local(room_id):
+                    continue
+                existing_id = self.rooms.resolve(room_id) or self._cold_index.resolve(room_id) or room_id
+                current = adopted.get(existing_id, {}).get('last_activity', self._stored_activity(existing_id))
+                if current is None or (room_dict.get('last_activity') or 0) > current:
+                    adopted[existing_id] = room_dict
+
+        for room_id, room_dict in adopted.items():
+            try:
+                room = self._room_from_dict(room_dict)
+            except Exception as e:
+                logger.error(f"Error adopting room {room_id}: {e}")
+                continue
+            with self._hydrate_lock:
+                with self._registry_lock:
+                    self._cold_index.pop(room_id, None)
+                    self.rooms[room_id] = room
+            # Ghi vào journal/snapshot của worker này như một phòng vừa tạo
+            self._record(room, 'room_created', data=self._room_to_dict(room))
+
+        released = [room_id for room_id in list(self.rooms) + list(self._cold_index) if not cluster.is_local(room_id)]
+        if adopted:
+            # Ghi ngay để worker cũ của phòng thấy bản này khi nó khởi động
+            self.save_rooms_to_file()
+        if released:
+            # Ghi hết trạng thái (kể cả phần vừa replay từ journal) của các phòng sắp bỏ trước khi bỏ,
+            # nếu không compaction sau đó sẽ xóa journal mà snapshot vẫn là bản cũ
+            if not self.save_rooms_to_file() or (self.journal and not self.compact()):
+                logger.warning(f"Keeping {len(released)} rooms owned by other workers until the next restart")
+                return len(adopted), 0
+
+            confirmed = set()
+            for room_id in released:
+                owner_copy = peers.get(cluster.owner(room_id), {}).get(room_id)
+                if owner_copy and (owner_copy.get('last_activity') or 0) >= (self._stored_activity(room_id) or 0):
+                    confirmed.add(room_id)
+                with self._hydrate_lock:
+                    with self._registry_lock:
+                        self.rooms.pop(room_id, None)
+                        self._cold_index.pop(room_id, None)
+            with self._snapshot_lock:
+                self._snapshot_dirty -= set(released)
+                self._snapshot_deleted |= confirmed
+                for room_id in released:
+                    self._captured.pop(room_id, None)
+
+        if adopted or released:
+            logger.info(f"Rebalanced worker {cluster.worker_id}: adopted {len(adopted)} rooms, "
+                        f"released {len(released)} rooms")
+        return len(adopted), len(released)
 
+    def start_cleanup_thread(self):
+        """Khởi động tác vụ nền dọn phòng trống (thread hoặc green thread tùy async_mode)"""
+        def cleanup_inactive_rooms():
+            while not self._cleanup_stopped:
+                socketio.sleep(GAME_CONFIG['CLEANUP_INTERVAL'])
+                if self._cleanup_stopped:
+                    break
+                try:
+                    self.reap_expired_rooms()
                 except Exception as e:
                     logger.error(f"Error in cleanup thread: {e}")
 
-                time.sleep(60)  # Chạy mỗi phút
+        self.cleanup_thread = socketio.start_background_task(cleanup_inactive_rooms)
+
+    def _update_expiry(self, room_id: str, last_activity: float, empty: bool):
+        """Phòng trống được hẹn dọn sau EMPTY_ROOM_TTL kể từ hoạt động cuối"""
+        if not empty or normalize_room_id(room_id) in GAME_CONFIG['PINNED_ROOMS']:
+            self.room_expiry.discard(room_id)
+        else:
+            self.room_expiry.set(room_id, last_activity + GAME_CONFIG['EMPTY_ROOM_TTL'])
+
+    def reap_expired_rooms(self, now: float = None) -> int:
+        """Xóa các phòng trống đã quá hạn; chỉ xét phòng tới hạn trong index, không duyệt mọi phòng"""
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        reaped = 0
+        for room_id in self.room_expiry.pop_due(now):
+            if self._reap_room(room_id, now):
+                reaped += 1
+                logger.info(f"Cleaned up inactive room: {room_id}")
+
+        self.cleanup_stats['runs'] += 1
+        self.cleanup_stats['reaped'] += reaped
+        self.cleanup_stats['last_reaped'] = reaped
+        self.cleanup_stats['last_run_ms'] = (time.perf_counter() - start) * 1000
+        return reaped
+
+    def _reap_room(self, room_id: str, now: float) -> bool:
+        room = self.rooms.get(room_id)
+        if room is None:
+            if room_id not in self._cold_index:
+                return False  # đã bị xóa
+            self.cleanup_stats['reaped_cold'] += 1
+            self.delete_room(room_id)
+            return True
+        # Giữ khóa phòng để không ai vào phòng giữa lúc kiểm tra và lúc xóa
+        with room.lock:
+            if room.players:
+                return False  # có người vào lại sau khi index được cập nhật
+            deadline = room.last_activity + GAME_CONFIG['EMPTY_ROOM_TTL']
+            if deadline > now:
+                # Có hoạt động mới (vd. chat) chưa cập nhật index: hẹn lại
+                self.room_expiry.set(room_id, deadline)
+                return False
+            self.delete_room(room_id)
+            return True
+
+    def get_cleanup_stats(self) -> dict:
+        return dict(self.cleanup_stats, tracked=len(self.room_expiry))
 
     def normalize_room_id(self, room_id: str) -> str:
         """Chuẩn hóa room ID (chuyển về chữ thường)"""
-        return room_id.lower().strip()
+        return normalize_room_id(room_id)
 
     def find_room_by_id(self, room_id: str) -> Optional[Room]:
         """Tìm phòng theo ID (không phân biệt chữ hoa/thường)"""
-        normalized_id = self.normalize_room_id(room_id)
-
-        # Tìm chính xác trước
-        if room_id in self.rooms:
-            return self.rooms[room_id]
+        existing_id = self.rooms.resolve(room_id)
+        if existing_id is not None:
+            return self.rooms[existing_id]
 
-        # Tìm theo ID đã chuẩn hóa
-        for existing_id, room in self.rooms.items():
-            if self.normalize_room_id(existing_id) == normalized_id:
-                return room
+        # Phòng đã lưu nhưng chưa được dựng
+        if self._cold_index:
+            return self._hydrate_room(room_id)
 
         return None
 
+    def _hydrate_room(self, room_id: str) -> Optional[Room]:
+        """Đọc phòng từ backend và dựng Room khi được truy cập lần đầu"""
+        with self._hydrate_lock:
+            cold_id = self._cold_index.resolve(room_id)
+            if cold_id is None:
+                # Thread khác vừa dựng xong
+                existing_id = self.rooms.resolve(room_id)
+                return self.rooms[existing_id] if existing_id is not None else None
+            try:
+                room_dict = self.storage.load_room(cold_id)
+                room = self._room_from_dict(room_dict) if room_dict else None
+            except Exception as e:
+                logger.error(f"Error hydrating room {cold_id}: {e}")
+                return None
+            if room is None:
+                with self._registry_lock:
+                    del self._cold_index[cold_id]
+                logger.warning(f"Indexed room {cold_id} has no stored data")
+                return None
+            # Thêm vào rooms trước khi xóa khỏi index để danh sách phòng không nhấp nháy
+            with self._registry_lock:
+                self.rooms[cold_id] = room
+                del self._cold_index[cold_id]
+            logger.info(f"Hydrated room: {cold_id} - {room.name}")
+            return room
+
+    @staticmethod
+    def _directory_entry(room: Room) -> Optional[dict]:
+        """Dòng của phòng trong danh sách công khai (None nếu không hiển thị)"""
+        if room.is_private or not room.is_active:
+            return None
+        return {
+            'id': room.id,
+            'name': room.name,
+            'current_players': len(room.players),
+            'max_players': room.max_players,
+            'round_number': room.round_number
+        }
+
+    def _on_room_changed(self, room_id: str, room: Optional[Room]):
+        if room is not None:
+            self.directory.put(room_id, self._directory_entry(room))
+            # Phòng mới tạo/vừa load/vừa dựng: hẹn giờ kết thúc vòng hiện tại
+            self._schedule_round(room)
+            self._update_expiry(room_id, room.last_activity, not room.players)
+        elif room_id not in self._cold_index:
+            self.directory.remove(room_id)
+            self.room_expiry.discard(room_id)
+
+    def _on_cold_room_changed(self, room_id: str, summary: Optional[dict]):
+        if summary is None:
+            # Phòng vừa được dựng thì đã nằm trong self.rooms
+            if room_id not in self.rooms:
+                self.directory.remove(room_id)
+                self.room_expiry.discard(room_id)
+            return
+        # Phòng chưa dựng không có người chơi
+        self._update_expiry(room_id, summary.get('last_activity') or summary['created_at'], True)
+        entry = None
+        if not summary.get('is_private') and summary.get('is_active', True):
+            # Phòng chưa dựng không có người chơi (sau restart)
+            entry = {
+                'id': summary['id'],
+                'name': summary['name'],
+                'current_players': 0,
+                'max_players': summary['max_players'],
+                'round_number': summary['round_number']
+            }
+        self.directory.put(room_id, entry)
+
+    def _refresh_directory(self, room: Room):
+        """Cập nhật danh sách phòng sau khi số người chơi/trạng thái/vòng của phòng đổi"""
+        if self.rooms.get(room.id) is room:
+            self.directory.put(room.id, self._directory_entry(room))
+
+    def room_exists(self, room_id: str) -> bool:
+        """Kiểm tra phòng tồn tại mà không dựng phòng chưa load"""
+        return self.rooms.resolve(room_id) is not None or self._cold_index.resolve(room_id) is not None
+
+    def room_count(self) -> int:
+        """Tổng số phòng, kể cả phòng chưa được dựng"""
+        return len(self.rooms) + len(self._cold_index)
+
 
 
     def create_room(self, room_id: str, room_name: str, max_players: int = 10,
@@ -294,17 +1038,6 @@ class GameManager:
                 logger.warning(f"Create room failed: Invalid characters in room_id: {room_id}")
                 return None
         
-        if len(self.rooms) >= GAME_CONFIG['MAX_ROOMS']:
-            logger.warning("Create room failed: Max rooms reached")
-            return None
-        
-        # Kiểm tra trùng lặp (không phân biệt chữ hoa/thường)
-        normalized_id = self.normalize_room_id(room_id)
-        for existing_id in self.rooms:
-            if self.normalize_room_id(existing_id) == normalized_id:
-                logger.warning(f"Create room failed: Room with similar ID already exists: {existing_id}")
-                return None
-
         # Tạo round đầu tiên
         range_low, range_high = GAME_CONFIG['RANGE_DEFAULT']
         current_time = time.time()
@@ -322,7 +1055,7 @@ class GameManager:
             created_at=current_time,
             current_round=first_round,
             players={},
-            scores=defaultdict(int),
+            scores=Leaderboard(),
             round_number=1,
             is_active=True,
             max_players=max_players,
@@ -330,23 +1063,111 @@ class GameManager:
             is_private=is_private
         )
 
-        self.rooms[room_id] = room
+        # Kiểm tra và thêm trong cùng một khóa: hai request tạo cùng ID chỉ một cái thành công
+        with self._registry_lock:
+            if self.room_count() >= GAME_CONFIG['MAX_ROOMS']:
+                logger.warning("Create room failed: Max rooms reached")
+                return None
+
+            # Kiểm tra trùng lặp (không phân biệt chữ hoa/thường)
+            existing_id = self.rooms.resolve(room_id) or self._cold_index.resolve(room_id)
+            if existing_id is not None:
+                logger.warning(f"Create room failed: Room with similar ID already exists: {existing_id}")
+                return None
+
+            self.rooms[room_id] = room
         logger.info(f"Created room: {room_id} ({room_name})")
         
-        # Lưu rooms vào file sau khi tạo phòng
-        self.save_rooms_to_file()
+        # Ghi vào journal (write-behind sẽ gom và ghi theo lô)
+        self._record(room, 'room_created', data=self._room_to_dict(room))
         
         return room
 
     def delete_room(self, room_id: str):
         """Xóa phòng"""
-        room = self.find_room_by_id(room_id)
-        if room:
+        with self._registry_lock:
+            existing_id = self.rooms.resolve(room_id)
+            if existing_id is not None:
+                del self.rooms[existing_id]  # Sử dụng room.id gốc để xóa
+        if existing_id is None:
+            # Phòng chưa dựng không có ai kết nối: xóa khỏi index, không cần đọc dữ liệu phòng
+            with self._hydrate_lock:
+                existing_id = self._cold_index.resolve(room_id)
+                if existing_id is None:
+                    return
+                with self._registry_lock:
+                    del self._cold_index[existing_id]
+        else:
             # Thông báo cho tất cả người chơi
-            socketio.emit('room_deleted', {'room_id': room_id}, to=room_id)
-            # Xóa khỏi quản lý
-            del self.rooms[room.id]  # Sử dụng room.id gốc để xóa
-            logger.info(f"Deleted room: {room_id}")
+            broadcast_to_room('room_deleted', {'room_id': existing_id}, existing_id)
+        if self.persistence_enabled:
+            with self._snapshot_lock:
+                self._captured.pop(existing_id, None)
+            if self.journal:
+                self.journal.append({'op': 'room_deleted', 'room': existing_id, 'ts': time.time()})
+            self.saver.mark_deleted(existing_id)
+        logger.info(f"Deleted room: {room_id}")
+
+    @staticmethod
+    def _push_change(room: Room, **delta) -> dict:
+        """Ghi một delta vào vòng đệm của phòng (gọi khi đang giữ room.lock)"""
+        room.state_seq += 1
+        change = dict(delta, seq=room.state_seq)
+        room.changes.append(change)
+        return change
+
+    @staticmethod
+    def state_fields(room: Room, change: Optional[dict]) -> dict:
+        """Phần trạng thái gắn vào sự kiện phát cho phòng"""
+        if change is None:
+            return {}
+        return {'epoch': room.state_epoch, 'seq': change['seq'], 'changes': [change]}
+
+    def find_change(self, room: Room, kind: str, player_name: str) -> Optional[dict]:
+        """Delta gần nhất loại kind ('joined', 'left', 'scores') của một người chơi"""
+        with room.lock:
+            for change in reversed(room.changes):
+                if player_name in change.get(kind, ()):
+                    return change
+        return None
+
+    def get_room_changes(self, room_id: str, since_seq: int, epoch: str) -> Optional[dict]:
+        """Các delta sau since_seq; None nếu client cần snapshot đầy đủ
+        (khác epoch, đã tụt quá vòng đệm hoặc có reset ở giữa)"""
+        room = self.find_room_by_id(room_id)
+        if not room:
+            return None
+        with room.lock:
+            if epoch != room.state_epoch or since_seq > room.state_seq:
+                return None
+            changes = [change for change in room.changes if change['seq'] > since_seq]
+            if since_seq < room.state_seq and (not changes or changes[0]['seq'] != since_seq + 1):
+                return None
+            if any(change.get('reset') for change in changes):
+                return None
+            return {'id': room.id, 'epoch': room.state_epoch, 'seq': room.state_seq, 'changes': changes}
+
+    def _find_player_sid(self, room: Room, player_name: str) -> Optional[str]:
+        """Tìm sid của người chơi đang trong phòng theo tên (O(1) qua room.player_sids)"""
+        if len(room.player_sids) != len(room.players):
+            # room.players bị sửa trực tiếp: dựng lại index
+            room.player_sids = {p.name: p_sid for p_sid, p in room.players.items()}
+        sid = room.player_sids.get(player_name)
+        player = room.players.get(sid) if sid is not None else None
+        if player is None or player.name != player_name:
+            return None
+        return sid
+
+    def _save_player_stats(self, room: Room, player: Player) -> dict:
+        """Lưu thống kê của người chơi vào phòng để khôi phục chính xác khi vào lại"""
+        stats = {
+            'score': player.score,
+            'streak': player.streak,
+            'total_guesses': player.total_guesses,
+            'correct_guesses': player.correct_guesses
+        }
+        room.player_stats[player.name] = stats
+        return stats
 
     def join_room(self, room_id: str, player_name: str, sid: str, password: str = None) -> Tuple[bool, str]:
         """Tham gia phòng"""
@@ -374,155 +1195,170 @@ class GameManager:
             logger.warning(f"Join room failed: Room {room_id} not found")
             return False, "Phòng không tồn tại"
 
-        # Kiểm tra mật khẩu
-        if room.is_private and room.password != password:
-            logger.warning(f"Join room failed: Wrong password for room {room_id}")
-            return False, "Mật khẩu không đúng"
-
-        # Kiểm tra số lượng người chơi
-        if len(room.players) >= room.max_players:
-            logger.warning(f"Join room failed: Room {room_id} is full")
-            return False, "Phòng đã đầy"
-
-        # Kiểm tra tên đã tồn tại
-        if any(p.name == player_name for p in room.players.values()):
-            logger.warning(f"Join room failed: Player name {player_name} already exists in room {room_id}")
-            return False, "Tên người chơi đã tồn tại"
-
-        # Kiểm tra xem có người chơi cũ với tên này không (để khôi phục điểm)
-        existing_player_data = None
-        
-        # 1. Kiểm tra trong room.players hiện tại (nếu có)
-        for old_sid, old_player in list(room.players.items()):
-            if old_player.name == player_name:
-                # Lưu thông tin người chơi cũ trước khi xóa
-                existing_player_data = {
-                    'score': old_player.score,
-                    'streak': old_player.streak,
-                    'total_guesses': old_player.total_guesses,
-                    'correct_guesses': old_player.correct_guesses,
-                    'last_guess_at': old_player.last_guess_at
-                }
-                # Xóa người chơi cũ
-                del room.players[old_sid]
-                if old_sid in self.player_rooms:
-                    del self.player_rooms[old_sid]
-                logger.info(f"Removed old player {player_name} to allow rejoin with same name")
-                break
-        
-        # 2. Nếu không tìm thấy trong room.players, kiểm tra trong room.scores (người chơi đã rời phòng trước đó)
-        if not existing_player_data and player_name in room.scores:
-            # Khôi phục điểm số từ room.scores (người chơi đã rời phòng trước đó)
-            existing_score = room.scores[player_name]
+        with room.lock:
+            if self.rooms.get(room.id) is not room:
+                # Phòng vừa bị xóa (vd. bị dọn) trong lúc chờ khóa
+                logger.warning(f"Join room failed: Room {room_id} was deleted")
+                return False, "Phòng không tồn tại"
+
+            # Kiểm tra mật khẩu
+            if room.is_private and room.password != password:
+                logger.warning(f"Join room failed: Wrong password for room {room_id}")
+                return False, "Mật khẩu không đúng"
+
+            # Kiểm tra số lượng người chơi
+            if len(room.players) >= room.max_players:
+                logger.warning(f"Join room failed: Room {room_id} is full")
+                return False, "Phòng đã đầy"
+
+            # Kiểm tra tên đã tồn tại
+            if self._find_player_sid(room, player_name) is not None:
+                logger.warning(f"Join room failed: Player name {player_name} already exists in room {room_id}")
+                return False, "Tên người chơi đã tồn tại"
+
+            # Kiểm tra xem có người chơi cũ với tên này không (để khôi phục điểm)
+            existing_player_data = None
+
+            # 1. Thống kê đã lưu của người chơi đã rời phòng (chính xác, O(1))
+            stats = room.player_stats.get(player_name)
+            if stats:
+                existing_player_data = dict(stats, last_guess_at=0)
+                logger.info(f"Found saved stats for {player_name}: {stats}")
+
+            # 2. Dữ liệu cũ chưa có player_stats: ước tính từ room.scores (người chơi đã rời phòng trước đó)
+            if not existing_player_data and player_name in room.scores:
+                # Khôi phục điểm số từ room.scores (người chơi đã rời phòng trước đó)
+                existing_score = room.scores[player_name]
             
-            # Tìm thông tin thống kê từ game_history nếu có
-            total_guesses = 0
-            correct_guesses = 0
-            for history in room.game_history:
-                if history.get('winner') == player_name:
-                    # Nếu người chơi này đã thắng trước đó, ước tính thống kê
-                    total_guesses = max(total_guesses, history.get('total_guesses', 0))
-                    correct_guesses += 1  # Mỗi lần thắng = 1 lần đoán đúng
+                # Tìm thông tin thống kê từ game_history nếu có
+                total_guesses = 0
+                correct_guesses = 0
+                for history in room.game_history:
+                    if history.get('winner') == player_name:
+                        # Nếu người chơi này đã thắng trước đó, ước tính thống kê
+                        total_guesses = max(total_guesses, history.get('total_guesses', 0))
+                        correct_guesses += 1  # Mỗi lần thắng = 1 lần đoán đúng
             
-            existing_player_data = {
-                'score': existing_score,
-                'streak': 0,  # Reset streak khi join lại
-                'total_guesses': total_guesses,
-                'correct_guesses': correct_guesses,
-                'last_guess_at': 0  # Reset last guess time
-            }
-            logger.info(f"Found previous score for {player_name}: {existing_score}, total_guesses: {total_guesses}, correct_guesses: {correct_guesses}")
+                existing_player_data = {
+                    'score': existing_score,
+                    'streak': 0,  # Reset streak khi join lại
+                    'total_guesses': total_guesses,
+                    'correct_guesses': correct_guesses,
+                    'last_guess_at': 0  # Reset last guess time
+                }
+                logger.info(f"Found previous score for {player_name}: {existing_score}, total_guesses: {total_guesses}, correct_guesses: {correct_guesses}")
         
-        # 3. Nếu vẫn không tìm thấy, kiểm tra trong game_history để khôi phục thống kê
-        if not existing_player_data and room.game_history:
-            for history in room.game_history:
-                if history.get('winner') == player_name:
-                    # Tìm thấy người chơi trong lịch sử, khôi phục một phần thông tin
-                    total_guesses = history.get('total_guesses', 0)
-                    correct_guesses = 1  # Ít nhất 1 lần đoán đúng vì đã thắng
+            # 3. Nếu vẫn không tìm thấy, kiểm tra trong game_history để khôi phục thống kê
+            if not existing_player_data and room.game_history:
+                for history in room.game_history:
+                    if history.get('winner') == player_name:
+                        # Tìm thấy người chơi trong lịch sử, khôi phục một phần thông tin
+                        total_guesses = history.get('total_guesses', 0)
+                        correct_guesses = 1  # Ít nhất 1 lần đoán đúng vì đã thắng
                     
-                    existing_player_data = {
-                        'score': room.scores.get(player_name, 0),  # Lấy điểm từ scores nếu có
-                        'streak': 0,  # Reset streak
-                        'total_guesses': total_guesses,
-                        'correct_guesses': correct_guesses,
-                        'last_guess_at': 0  # Reset time
-                    }
-                    logger.info(f"Found {player_name} in game history, will restore partial info: score={existing_player_data['score']}, total_guesses={total_guesses}")
-                    break
-
-        # Tạo người chơi mới hoặc khôi phục từ người chơi cũ
-        if existing_player_data:
-            # Khôi phục điểm số và thống kê từ người chơi cũ
-            player = Player(
-                name=player_name,
-                sid=sid,
-                joined_at=time.time(),
-                last_guess_at=existing_player_data['last_guess_at']
-            )
-            player.score = existing_player_data['score']
-            player.streak = existing_player_data['streak']
-            player.total_guesses = existing_player_data['total_guesses']
-            player.correct_guesses = existing_player_data['correct_guesses']
+                        existing_player_data = {
+                            'score': room.scores.get(player_name, 0),  # Lấy điểm từ scores nếu có
+                            'streak': 0,  # Reset streak
+                            'total_guesses': total_guesses,
+                            'correct_guesses': correct_guesses,
+                            'last_guess_at': 0  # Reset time
+                        }
+                        logger.info(f"Found {player_name} in game history, will restore partial info: score={existing_player_data['score']}, total_guesses={total_guesses}")
+                        break
+
+            # Tạo người chơi mới hoặc khôi phục từ người chơi cũ
+            if existing_player_data:
+                # Khôi phục điểm số và thống kê từ người chơi cũ
+                player = Player(
+                    name=player_name,
+                    sid=sid,
+                    joined_at=time.time(),
+                    last_guess_at=existing_player_data['last_guess_at']
+                )
+                player.score = existing_player_data['score']
+                player.streak = existing_player_data['streak']
+                player.total_guesses = existing_player_data['total_guesses']
+                player.correct_guesses = existing_player_data['correct_guesses']
             
-            # Khôi phục điểm số trong room.scores
-            room.scores[player_name] = existing_player_data['score']
+                # Khôi phục điểm số trong room.scores
+                room.scores[player_name] = existing_player_data['score']
             
-            logger.info(f"Restored player {player_name} with score {player.score}, streak {player.streak}")
-        else:
-            # Tạo người chơi mới hoàn toàn
-            player = Player(
-                name=player_name,
-                sid=sid,
-                joined_at=time.time(),
-                last_guess_at=0
-            )
-            logger.info(f"Created new player {player_name}")
-
-        room.players[sid] = player
-        self.player_rooms[sid] = room_id
-
-        # Reset thời gian vòng chơi nếu vòng đã kết thúc
-        current_time = time.time()
-        if current_time > room.current_round.end_time:
-            # Vòng đã kết thúc, tạo vòng mới
-            self._start_new_round(room)
-            logger.info(f"Round ended, started new round for new player {player_name}")
-
-        logger.info(f"Player {player_name} joined room {room_id}")
+                logger.info(f"Restored player {player_name} with score {player.score}, streak {player.streak}")
+            else:
+                # Tạo người chơi mới hoàn toàn
+                player = Player(
+                    name=player_name,
+                    sid=sid,
+                    joined_at=time.time(),
+                    last_guess_at=0
+                )
+                logger.info(f"Created new player {player_name}")
+
+            room.players[sid] = player
+            room.player_sids[player_name] = sid
+            if existing_player_data:
+                self._save_player_stats(room, player)
+            with self._registry_lock:
+                self.player_rooms[sid] = room.id  # luôn lưu ID gốc, không phải ID người chơi nhập
+
+            # Reset thời gian vòng chơi nếu vòng đã kết thúc
+            current_time = time.time()
+            if current_time > room.current_round.end_time:
+                # Vòng đã kết thúc, tạo vòng mới
+                self._start_new_round(room)
+                logger.info(f"Round ended, started new round for new player {player_name}")
+            self._refresh_directory(room)
+            # Sau vòng mới (nếu có) để các sự kiện tới client theo đúng thứ tự seq
+            joined = {'joined': [player_name]}
+            if player_name in room.scores:
+                joined['scores'] = {player_name: room.scores[player_name]}
+            self._push_change(room, **joined)
+
+            logger.info(f"Player {player_name} joined room {room_id}")
         
-        # Lưu rooms vào file sau khi có thay đổi
-        self.save_rooms_to_file()
+            # Ghi vào journal (write-behind sẽ gom và ghi theo lô)
+            self._record(room, 'player_joined', player=player_name,
+                         score=room.scores.get(player_name), is_active=room.is_active,
+                         stats=room.player_stats.get(player_name))
+            self._update_expiry(room.id, room.last_activity, False)
         
-        return True, "Tham gia thành công"
+            return True, "Tham gia thành công"
 
     def leave_room(self, sid: str):
         """Rời phòng"""
-        if sid not in self.player_rooms:
+        room_id = self.player_rooms.get(sid)
+        if room_id is None:
             return
-        
-        room_id = self.player_rooms[sid]
+
         room = self.find_room_by_id(room_id)
         if not room:
             return
-        if sid in room.players:
+        with room.lock:
+            if sid not in room.players:
+                return
             player_name = room.players[sid].name
             del room.players[sid]
-            del self.player_rooms[sid]
+            with self._registry_lock:
+                self.player_rooms.pop(sid, None)
+            if room.player_sids.get(player_name) == sid:
+                del room.player_sids[player_name]
 
             # Thông báo cho phòng
-            socketio.emit('player_left', {
+            change = self._push_change(room, left=[player_name])
+            broadcast_to_room('player_left', dict({
                 'room_id': room_id,
                 'player_name': player_name,
                 'current_players': len(room.players)
-            }, to=room_id)
+            }, **self.state_fields(room, change)), room_id)
 
             # Nếu phòng trống, đánh dấu không hoạt động
             if len(room.players) == 0:
                 room.is_active = False
+            self._refresh_directory(room)
 
-            # Lưu rooms vào file sau khi có thay đổi
-            self.save_rooms_to_file()
+            # Ghi vào journal (write-behind sẽ gom và ghi theo lô)
+            self._record(room, 'player_left', player=player_name, is_active=room.is_active)
+            self._update_expiry(room.id, room.last_activity, not room.players)
 
             logger.info(f"Player {player_name} left room {room_id}")
 
@@ -538,100 +1374,128 @@ class GameManager:
         if not room or sid not in room.players:
             logger.warning(f"Make guess failed: Room {room_id} or player {sid} not found")
             return False, "Không tìm thấy phòng hoặc người chơi", {}
-        player = room.players[sid]
-        current_time = time.time()
-
-        # Kiểm tra thời gian
-        if current_time > room.current_round.end_time:
-            logger.info(f"Round ended in room {room_id}, starting new round")
-            # Tự động tạo vòng mới thay vì từ chối đoán
-            self._start_new_round(room)
-            # Cho phép đoán trong vòng mới
-            return self.make_guess(room_id, sid, guess)
-
-        # Kiểm tra rate limit và số lần đoán
-        if not player.can_make_guess():
-            if current_time - player.last_guess_at < GAME_CONFIG['RATE_LIMIT_MS'] / 1000:
-                logger.warning(f"Make guess failed: Rate limit exceeded for player {player.name} in room {room_id}")
-                return False, "Đoán quá nhanh, vui lòng chờ", {}
-            else:
-                logger.warning(f"Make guess failed: Max guesses per round exceeded for player {player.name} in room {room_id}")
-                return False, f"Bạn đã đoán quá {GAME_CONFIG['MAX_GUESSES_PER_ROUND']} lần trong vòng này", {}
-
-        # Kiểm tra phạm vi
-        if guess < room.current_round.range_low or guess > room.current_round.range_high:
-            logger.info(f"Make guess failed: Out of range guess {guess} in room {room_id}")
-            return False, f"Số phải trong khoảng [{room.current_round.range_low}, {room.current_round.range_high}]", {}
-
-        # Cập nhật thông tin người chơi
-        player.last_guess_at = current_time
-        player.total_guesses += 1
-        player.guesses_this_round += 1
-
-        # Kiểm tra kết quả
-        if guess == room.current_round.number:
-            # Đoán đúng
-            time_bonus = max(0, int((room.current_round.end_time - current_time) / 10))
-            base_score = GAME_CONFIG['SCORE_CORRECT']
-            streak_bonus = int(player.streak * GAME_CONFIG['SCORE_STREAK_MULTIPLIER'])
-            total_score = base_score + time_bonus + streak_bonus
-
-            player.score += total_score
-            player.correct_guesses += 1
-            player.streak += 1
-
-            room.scores[player.name] = player.score
-            room.current_round.winner = player.name
-            room.current_round.total_guesses += 1
-
-            # Lưu lịch sử vòng
-            round_history = {
-                'round_number': room.round_number,
-                'number': room.current_round.number,
-                'winner': player.name,
-                'total_guesses': room.current_round.total_guesses,
-                'duration': current_time - room.current_round.start_time
-            }
-            room.game_history.append(round_history)
 
-            # Lưu số đã đoán đúng trước khi tạo vòng mới
-            correct_number = room.current_round.number
-
-            # Tạo vòng mới
-            self._start_new_round(room)
-            
-            # Lưu rooms vào file sau khi có thay đổi điểm số
-            self.save_rooms_to_file()
-
-            return True, f"🎉 Chính xác! Số cần tìm là {correct_number}", {
-                'correct': True,
-                'score_gained': total_score,
-                'new_total_score': player.score,
-                'streak': player.streak,
-                'time_bonus': time_bonus,
-                'streak_bonus': streak_bonus,
-                'total_guesses': room.current_round.total_guesses
-            }
-        else:
-            # Đoán sai
-            player.streak = 0
-            room.current_round.total_guesses += 1
-
-            # Gợi ý rõ ràng hơn cho người chơi
-            if guess < room.current_round.number:
-                hint = f"Số cần tìm lớn hơn {guess}"
+        with room.lock:
+            if sid not in room.players:
+                return False, "Không tìm thấy phòng hoặc người chơi", {}
+            player = room.players[sid]
+            current_time = time.time()
+
+            # Kiểm tra thời gian: bình thường round_scheduler đã kết thúc vòng đúng hạn,
+            # đây chỉ là dự phòng (scheduler tắt hoặc chưa kịp chạy)
+            if current_time > room.current_round.end_time:
+                logger.info(f"Round ended in room {room_id}, starting new round")
+                # Tự động tạo vòng mới thay vì từ chối đoán, lượt đoán tính cho vòng mới
+                self._start_new_round(room)
+
+            # Kiểm tra rate limit và số lần đoán
+            if not player.can_make_guess():
+                if current_time - player.last_guess_at < GAME_CONFIG['RATE_LIMIT_MS'] / 1000:
+                    logger.warning(f"Make guess failed: Rate limit exceeded for player {player.name} in room {room_id}")
+                    return False, "Đoán quá nhanh, vui lòng chờ", {}
+                else:
+                    logger.warning(f"Make guess failed: Max guesses per round exceeded for player {player.name} in room {room_id}")
+                    return False, f"Bạn đã đoán quá {GAME_CONFIG['MAX_GUESSES_PER_ROUND']} lần trong vòng này", {}
+
+            # Kiểm tra phạm vi
+            if guess < room.current_round.range_low or guess > room.current_round.range_high:
+                logger.info(f"Make guess failed: Out of range guess {guess} in room {room_id}")
+                return False, f"Số phải trong khoảng [{room.current_round.range_low}, {room.current_round.range_high}]", {}
+
+            # Cập nhật thông tin người chơi
+            player.last_guess_at = current_time
+            player.total_guesses += 1
+            player.guesses_this_round += 1
+
+            # Kiểm tra kết quả
+            if guess == room.current_round.number:
+                # Đoán đúng
+                time_bonus = max(0, int((room.current_round.end_time - current_time) / 10))
+                base_score = GAME_CONFIG['SCORE_CORRECT']
+                streak_bonus = int(player.streak * GAME_CONFIG['SCORE_STREAK_MULTIPLIER'])
+                total_score = base_score + time_bonus + streak_bonus
+
+                player.score += total_score
+                player.correct_guesses += 1
+                player.streak += 1
+
+                room.scores[player.name] = player.score
+                global_score = self.global_leaderboard.add(player.name, total_score)
+                stats = self._save_player_stats(room, player)
+                room.current_round.winner = player.name
+                room.current_round.total_guesses += 1
+
+                # Lưu lịch sử vòng
+                round_history = {
+                    'round_number': room.round_number,
+                    'number': room.current_round.number,
+                    'winner': player.name,
+                    'total_guesses': room.current_round.total_guesses,
+                    'duration': current_time - room.current_round.start_time
+                }
+                room.game_history.append(round_history)
+
+                # Lưu số đã đoán đúng trước khi tạo vòng mới
+                correct_number = room.current_round.number
+
+                # Ghi vào journal trước khi vòng mới được ghi
+                self._record(room, 'guess_made', player=player.name, correct=True, score=player.score,
+                             total_guesses=room.current_round.total_guesses, history=round_history, stats=stats,
+                             global_score=global_score)
+
+                # Tạo vòng mới, rồi ghi delta điểm (sau delta của vòng mới, đúng thứ tự phát)
+                self._start_new_round(room)
+                self._push_change(room, scores={player.name: player.score})
+
+                return True, f"🎉 Chính xác! Số cần tìm là {correct_number}", {
+                    'correct': True,
+                    'score_gained': total_score,
+                    'new_total_score': player.score,
+                    'streak': player.streak,
+                    'time_bonus': time_bonus,
+                    'streak_bonus': streak_bonus,
+                    'total_guesses': room.current_round.total_guesses
+                }
             else:
-                hint = f"Số cần tìm nhỏ hơn {guess}"
+                # Đoán sai
+                player.streak = 0
+                room.current_round.total_guesses += 1
+                stats = self._save_player_stats(room, player)
+
+                # Gợi ý rõ ràng hơn cho người chơi
+                if guess < room.current_round.number:
+                    hint = f"Số cần tìm lớn hơn {guess}"
+                else:
+                    hint = f"Số cần tìm nhỏ hơn {guess}"
                 
-            # Lưu rooms vào file sau khi có thay đổi thống kê
-            self.save_rooms_to_file()
+                # Ghi vào journal (write-behind sẽ gom và ghi theo lô)
+                self._record(room, 'guess_made', player=player.name, correct=False,
+                             total_guesses=room.current_round.total_guesses, stats=stats)
             
-            return True, hint, {
-                'correct': False,
-                'hint': hint,
-                'range': [room.current_round.range_low, room.current_round.range_high],
-                'total_guesses': room.current_round.total_guesses
-            }
+                return True, hint, {
+                    'correct': False,
+                    'hint': hint,
+                    'range': [room.current_round.range_low, room.current_round.range_high],
+                    'total_guesses': room.current_round.total_guesses
+                }
+
+    def _schedule_round(self, room: Room):
+        if GAME_CONFIG['ROUND_SCHEDULER'] and room.current_round:
+            self.round_scheduler.schedule(room.id, room.current_round.end_time)
+
+    def _expire_round(self, room_id: str, deadline: float):
+        """Chạy trên thread hẹn giờ: vòng hết giờ thì bắt đầu vòng mới và thông báo ngay"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            return  # phòng đã bị xóa
+        with room.lock:
+            if room.current_round is None or room.current_round.end_time != deadline:
+                return  # vòng đã được thay (có người đoán đúng hoặc reset)
+            if not room.players:
+                # Phòng trống không cần vòng mới: join_room sẽ tạo khi có người vào
+                return
+            logger.info(f"Round {room.round_number} timed out in room {room_id}")
+            self._start_new_round(room)
 
     def _start_new_round(self, room: Room, reset_mode: bool = False):
         """Bắt đầu vòng mới"""
@@ -658,16 +1522,24 @@ class GameManager:
         )
 
         room.current_round = new_round
+        self._refresh_directory(room)
+        self._schedule_round(room)
+        change = self._push_change(room, round={
+            'round_number': room.round_number,
+            'range': [range_low, range_high],
+            'end_time': new_round.end_time
+        })
 
         # Thông báo vòng mới
-        socketio.emit('new_round', {
+        broadcast_to_room('new_round', {
             'room_id': room.id,
             'round_number': room.round_number,
             'range': [range_low, range_high],
             'end_time': new_round.end_time,
             'previous_winner': room.current_round.winner,
-            'message': f"🎮 Vòng {room.round_number}: Đoán số từ {range_low} đến {range_high}"
-        }, to=room.id)
+            'message': f"🎮 Vòng {room.round_number}: Đoán số từ {range_low} đến {range_high}",
+            **self.state_fields(room, change)
+        }, room.id)
 
         # Emit event cũ để tương thích ngược
         emit_legacy_events(room.id, 'round', {
@@ -678,43 +1550,97 @@ class GameManager:
 
         logger.info(f"Started new round {room.round_number} in room {room.id}")
         
-        # Lưu rooms vào file sau khi có thay đổi
-        self.save_rooms_to_file()
+        # Ghi vào journal (write-behind sẽ gom và ghi theo lô)
+        self._record(room, 'round_started', round=asdict(new_round), round_number=room.round_number)
 
     def reset_room(self, room_id: str, admin_sid: str) -> Tuple[bool, str]:
         """Reset phòng (chỉ admin)"""
         room = self.find_room_by_id(room_id)
         if not room:
             return False, "Phòng không tồn tại"
-        if admin_sid not in room.players:
-            return False, "Bạn không phải người chơi trong phòng này"
 
-        # Reset điểm số
-        for player in room.players.values():
-            player.score = 0
-            player.streak = 0
-            player.total_guesses = 0
-            player.correct_guesses = 0
+        with room.lock:
+            if admin_sid not in room.players:
+                return False, "Bạn không phải người chơi trong phòng này"
 
-        room.scores.clear()
-        room.game_history.clear()
+            # Reset điểm số
+            for player in room.players.values():
+                player.score = 0
+                player.streak = 0
+                player.total_guesses = 0
+                player.correct_guesses = 0
 
-        # Tạo vòng mới (sẽ set round_number = 1)
-        self._start_new_round(room, reset_mode=True)
+            room.scores.clear()
+            room.game_history.clear()
+            room.player_stats.clear()
 
-        logger.info(f"Room {room_id} reset by admin")
-        
-        # Lưu rooms vào file sau khi có thay đổi
-        self.save_rooms_to_file()
+            # Client đang theo dõi delta phải lấy lại snapshot đầy đủ
+            self._push_change(room, reset=True)
+
+            # Ghi vào journal trước khi vòng mới được ghi
+            self._record(room, 'room_reset')
+
+            # Tạo vòng mới (sẽ set round_number = 1)
+            self._start_new_round(room, reset_mode=True)
+
+            logger.info(f"Room {room_id} reset by admin")
         
-        return True, "Reset phòng thành công"
+            return True, "Reset phòng thành công"
 
-    def get_room_info(self, room_id: str) -> Optional[dict]:
-        """Lấy thông tin phòng"""
+    def _scoreboard(self, room: Room, sid: Optional[str] = None) -> dict:
+        """Top-N của bảng xếp hạng kèm hạng của người chơi có sid (nếu đang trong phòng)"""
+        top_n = GAME_CONFIG['LEADERBOARD_SIZE']
+        board = {
+            'room_id': room.id,
+            'scores': room.scores.as_dict(top_n),  # tương thích client cũ: {tên: điểm}
+            'leaderboard': room.scores.top(top_n),
+            'ranked_players': len(room.scores)
+        }
+        player = room.players.get(sid) if sid else None
+        if player:
+            board['player_rank'] = room.scores.entry(player.name)
+        return board
+
+    def get_leaderboard(self, room_id: str, limit: int = 10, player_name: Optional[str] = None,
+                        radius: int = 2) -> Optional[dict]:
+        """Top-N, hạng và những người xung quanh một người chơi"""
         room = self.find_room_by_id(room_id)
         if not room:
             return None
-        return {
+        result = {
+            'room_id': room.id,
+            'leaderboard': room.scores.top(limit),
+            'ranked_players': len(room.scores)
+        }
+        if player_name:
+            result['player_rank'] = room.scores.entry(player_name)
+            result['around'] = room.scores.around(player_name, radius)
+        return result
+
+    def get_global_leaderboard(self, limit: int = 10, player_name: Optional[str] = None,
+                               board=None) -> dict:
+        """Top-N của bảng xếp hạng chung kèm hạng và phần trăm của một người chơi.
+        board: bảng gộp của mọi worker (ClusterLeaderboard), mặc định là bảng của worker này"""
+        if board is None:
+            board = self.global_leaderboard
+        result = {
+            'leaderboard': board.top(limit),
+            'total_players': len(board)
+        }
+        if player_name:
+            result['player'] = board.player(player_name)
+        return result
+
+    def get_room_info(self, room_id: str, sid: Optional[str] = None) -> Optional[dict]:
+        """Lấy thông tin phòng (bảng điểm chỉ gồm top-N và hạng của người hỏi)"""
+        room = self.find_room_by_id(room_id)
+        if not room:
+            return None
+        with room.lock:
+            return self._room_info(room, sid)
+
+    def _room_info(self, room: Room, sid: Optional[str]) -> dict:
+        info = {
             'id': room.id,
             'name': room.name,
             'round_number': room.round_number,
@@ -731,68 +1657,143 @@ class GameManager:
                     'correct_guesses': p.correct_guesses
                 } for p in room.players.values()
             ],
-            'scores': dict(room.scores),
             'is_private': room.is_private,
             'max_players': room.max_players,
-            'current_players': len(room.players)
+            'current_players': len(room.players),
+            # Client áp các delta có seq lớn hơn lên snapshot này
+            'epoch': room.state_epoch,
+            'seq': room.state_seq
         }
+        info.update(self._scoreboard(room, sid))
+        return info
+
+    def get_room_history(self, room_id: str, limit: int = 10) -> Optional[List[dict]]:
+        """Lịch sử các vòng của phòng, mới nhất trước"""
+        room = self.find_room_by_id(room_id)
+        if not room:
+            return None
+        recent = list(reversed(room.game_history))
+        if limit <= len(recent) or not self.storage:
+            return recent[:limit]
+        # Các vòng cũ hơn chỉ còn trong backend (SQLite giữ toàn bộ lịch sử)
+        self.save_rooms_to_file()
+        stored = self.storage.load_history(room.id, limit)
+        return stored if len(stored) > len(recent) else recent
 
     def get_available_rooms(self) -> List[dict]:
-        """Lấy danh sách phòng có sẵn"""
-        available_rooms = []
-        for room in self.rooms.values():
-            if not room.is_private and room.is_active:
-                available_rooms.append({
-                    'id': room.id,
-                    'name': room.name,
-                    'current_players': len(room.players),
-                    'max_players': room.max_players,
-                    'round_number': room.round_number
-                })
-        return available_rooms
+        """Lấy danh sách phòng có sẵn (kể cả phòng chưa dựng), không được sửa"""
+        return self.directory.snapshot()[1]
 
 # ---- Helper functions
+def send_room_batch(room_id: str, batch: dict):
+    transport.broadcast('room_batch', batch, to=room_id)
+
+# Outbox theo phòng (BROADCAST_TICK_MS > 0): client nhận 'room_batch' thay cho từng sự kiện
+room_outbox = RoomOutbox(send_room_batch, GAME_CONFIG['BROADCAST_TICK_MS'] / 1000)
+
+def send_room_snapshot(sid: str, room_id: str):
+    """Client vừa hết chậm: gửi snapshot mới nhất của phòng thay cho các sự kiện đã bỏ"""
+    room_info = game_manager.get_room_info(room_id, sid)
+    if room_info:
+        transport.broadcast('room_info', room_info, to=sid)
+
+# Hàng đợi gửi theo kết nối: client chậm bị bỏ bớt sự kiện chỉ mang trạng thái, quá ngưỡng thì bị ngắt
+slow_consumers = SlowConsumers(
+    sample=lambda: transport.queue_depths(),
+    room_of=lambda sid: game_manager.player_rooms.get(sid),
+    recover=send_room_snapshot,
+    disconnect=lambda sid: transport.disconnect_client(sid),
+    lag_threshold=GAME_CONFIG['SLOW_CONSUMER_QUEUE'],
+    disconnect_threshold=GAME_CONFIG['SLOW_CONSUMER_DISCONNECT'],
+    policy=GAME_CONFIG['SLOW_CONSUMER_POLICY'],
+    interval=GAME_CONFIG['QUEUE_SAMPLE_MS'] / 1000
+)
+
+def broadcast_to_room(event: str, data: dict, room_id: str):
+    """Phát sự kiện cho cả phòng, qua outbox nếu sự kiện được phép gom"""
+    if room_outbox.enabled and event in COALESCED_EVENTS:
+        room_outbox.post(room_id, event, data)
+        return
+    # Sự kiện gửi ngay: các sự kiện đã gom của phòng phải tới trước, lô của thread tick không chen vào giữa
+    with room_outbox.ordered(room_id):
+        transport.broadcast(event, data, to=room_id)
+
+# sid của các client dùng giao thức cũ: đã gửi join/guess/chat hoặc kết nối với auth {'protocol': 'legacy'}.
+# Event cũ chỉ gửi tới nhóm Socket.IO legacy:<room_id> của các client này (vẫn một emit cho mỗi nhóm)
+legacy_clients: Set[str] = set()
+
+def legacy_group(room_id: str) -> str:
+    return f"legacy:{room_id}"
+
+def mark_legacy_client(sid: str):
+    """Ghi nhận client sid nói giao thức cũ; đang ở trong phòng thì vào nhóm legacy của phòng"""
+    if sid in legacy_clients:
+        return
+    legacy_clients.add(sid)
+    logger.info(f"Client {sid} uses the legacy protocol")
+    room_id = game_manager.player_rooms.get(sid)
+    if room_id:
+        transport.enter_room(legacy_group(room_id))
+
 def emit_legacy_events(room_id, event_type, data, target_sid=None):
-    """Emit các events cũ để tương thích ngược"""
+    """Emit các events cũ để tương thích ngược (chỉ tới client dùng giao thức cũ)"""
     try:
         if event_type == 'round':
             # Emit event 'round' cũ
-            socketio.emit('round', {
+            transport.broadcast('round', {
                 'room': room_id,
                 'round': data.get('round_number', '?'),
                 'range': data.get('range', [1, 100]),
                 'endsAt': data.get('end_time', 0) * 1000  # Convert to milliseconds
-            }, to=room_id)
+            }, to=legacy_group(room_id))
 
         elif event_type == 'scoreboard':
             # Emit event 'scoreboard' cũ
-            socketio.emit('scoreboard', data.get('scores', {}), to=room_id)
+            transport.broadcast('scoreboard', data.get('scores', {}), to=legacy_group(room_id))
 
         elif event_type == 'message':
             # Emit event 'message' cũ - chỉ cho người chơi cụ thể nếu có target_sid
             if target_sid:
-                socketio.emit('message', {
+                if target_sid not in legacy_clients:
+                    return  # client mới đã nhận guess_result
+                transport.broadcast('message', {
                     'room': room_id,
                     'msg': data.get('message', '')
                 }, to=target_sid)
             else:
-                socketio.emit('message', {
+                transport.broadcast('message', {
                     'room': room_id,
                     'msg': data.get('message', '')
-                }, to=room_id)
+                }, to=legacy_group(room_id))
 
     except Exception as e:
         logger.error(f"Error emitting legacy events: {e}")
 
+def room_route(room_id: str) -> Optional[dict]:
+    """{'room_id', 'worker', 'url'} của worker sở hữu phòng nếu đó không phải worker này,
+    None khi phòng thuộc tiến trình hiện tại (luôn như vậy khi chạy một tiến trình)"""
+    if cluster is None or cluster.is_local(room_id):
+        return None
+    return cluster.route(room_id)
+
 # Khởi tạo game manager
 game_manager = GameManager()
+if cluster:
+    # Số worker có thể đã đổi từ lần chạy trước: nhận/bỏ phòng theo chủ mới
+    game_manager.rebalance(cluster)
+# Danh sách phòng trả cho client: khi chạy nhiều worker thì gộp phòng của mọi worker
+room_listing = ClusterDirectory(game_manager.directory, cluster) if cluster else game_manager.directory
+# Bảng xếp hạng chung: khi chạy nhiều worker thì cộng điểm của mọi worker
+global_ranking = ClusterLeaderboard(game_manager.global_leaderboard, cluster) if cluster else None
+# Flush các thay đổi còn chờ khi tiến trình kết thúc
+atexit.register(game_manager.shutdown)
 
 # Tự động tạo phòng lobby mặc định
 def create_default_rooms():
     """Tạo các phòng mặc định khi server khởi động"""
     try:
         # Tạo phòng lobby nếu chưa có
-        if "lobby" not in game_manager.rooms:
+        if room_route("lobby") is None and not game_manager.room_exists("lobby"):
             lobby_room = game_manager.create_room("lobby", "Phòng Lobby", 20)
             if lobby_room:
                 logger.info("✅ Tạo phòng lobby mặc định thành công")
@@ -800,7 +1801,7 @@ def create_default_rooms():
                 logger.warning("❌ Không thể tạo phòng lobby mặc định")
 
         # Tạo phòng demo nếu chưa có
-        if "demo" not in game_manager.rooms:
+        if room_route("demo") is None and not game_manager.room_exists("demo"):
             demo_room = game_manager.create_room("demo", "Phòng Demo", 10)
             if demo_room:
                 logger.info("✅ Tạo phòng demo thành công")
@@ -813,36 +1814,41 @@ def create_default_rooms():
 # Tạo phòng mặc định
 create_default_rooms()
 
-# Routes
-@app.route("/")
-def home():
-    return jsonify({
+# Nội dung các REST route, dùng chung cho Flask và chế độ asyncio (async_server.py)
+def server_info() -> dict:
+    return {
         "message": "Guess Number Server v2.0",
         "status": "running",
         "version": "2.0.0",
         "timestamp": datetime.now().isoformat()
-    })
+    }
 
-@app.route("/api/rooms")
-def get_rooms():
-    """API lấy danh sách phòng"""
-    return jsonify({
-        "rooms": game_manager.get_available_rooms(),
-        "total": len(game_manager.rooms)
-    })
+def server_stats() -> dict:
+    """Số liệu server (lớp lưu trữ, hàng đợi ghi snapshot)"""
+    return {
+        "rooms": game_manager.room_count(),
+        "players": len(game_manager.player_rooms),
+        "scheduler": dict(game_manager.round_scheduler.stats),
+        "cleanup": game_manager.get_cleanup_stats(),
+        "persistence": game_manager.get_persistence_stats(),
+        "worker": cluster.worker_id if cluster else None,
+        "bus": broadcast_bus.bus.get_stats() if broadcast_bus else None,
+        "outbox": room_outbox.get_stats(),
+        "wire": wire_clients.get_stats(),
+        "transport": dict(engine_config.as_dict(), **transport_metrics.get_stats()),
+        "backpressure": slow_consumers.get_stats()
+    }
 
-@app.route("/api/rooms/<room_id>")
-def get_room_info(room_id):
-    """API lấy thông tin phòng"""
-    room_info = game_manager.get_room_info(room_id)
-    if room_info:
-        return jsonify(room_info)
-    return jsonify({"error": "Phòng không tồn tại"}), 404
+def global_leaderboard_payload() -> Tuple[int, str]:
+    """(version, JSON) mọi điểm chung của worker này, các worker khác dùng để gộp bảng xếp hạng"""
+    return game_manager.global_leaderboard.payload()
 
-@app.route("/api/rooms", methods=["POST"])
-def create_room_api():
-    """API tạo phòng"""
-    data = request.get_json()
+def listing_for_scope(scope: Optional[str]):
+    """?scope=local: chỉ phòng của worker này (các worker khác dùng để gộp danh sách)"""
+    return game_manager.directory if scope == 'local' else room_listing
+
+def create_room_from_api(data: dict) -> Tuple[dict, int]:
+    """Tạo phòng từ body của POST /api/rooms, trả về (payload, HTTP status)"""
     room_id = data.get('room_id', '').strip()
     room_name = data.get('room_name', 'Phòng mới').strip()
     max_players = min(data.get('max_players', 10), GAME_CONFIG['MAX_PLAYERS_PER_ROOM'])
@@ -850,16 +1856,123 @@ def create_room_api():
     is_private = bool(password)
 
     if not room_id:
-        return jsonify({"error": "ID phòng không được để trống"}), 400
+        return {"error": "ID phòng không được để trống"}, 400
+
+    route = room_route(room_id)
+    if route:
+        # Phòng thuộc worker khác: 307 giữ nguyên method và body khi client gửi lại
+        return route, 307
 
     room = game_manager.create_room(room_id, room_name, max_players, password, is_private)
     if room:
-        return jsonify({
+        return {
             "success": True,
             "room": game_manager.get_room_info(room_id)
-        })
+        }, 200
+    else:
+        return {"error": "Không thể tạo phòng"}, 400
+
+# Routes
+@app.route("/")
+def home():
+    return jsonify(server_info())
+
+@app.route("/api/rooms")
+def get_rooms():
+    """API lấy danh sách phòng"""
+    version, body = listing_for_scope(request.args.get('scope')).payload()
+    etag = f"rooms-{version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+def redirect_to_owner(room_id):
+    """Redirect 307 tới worker sở hữu phòng, None nếu phòng thuộc worker này"""
+    route = room_route(room_id)
+    if route is None:
+        return None
+    query = request.query_string.decode('latin-1')
+    return redirect(route['url'] + request.path + (f"?{query}" if query else ''), code=307)
+
+@app.route("/api/route")
+def get_room_route():
+    """API cho biết worker nào giữ phòng ?room= (client kết nối socket tới url đó)"""
+    room_id = request.args.get('room', '').strip()
+    if not room_id:
+        return jsonify({"error": "ID phòng không được để trống"}), 400
+    if cluster is None:
+        return jsonify({"room_id": normalize_room_id(room_id), "worker": 0, "url": None})
+    return jsonify(cluster.route(room_id))
+
+@app.route("/api/rooms/<room_id>")
+def get_room_info(room_id):
+    """API lấy thông tin phòng"""
+    owner = redirect_to_owner(room_id)
+    if owner:
+        return owner
+    room_info = game_manager.get_room_info(room_id)
+    if room_info:
+        return jsonify(room_info)
+    return jsonify({"error": "Phòng không tồn tại"}), 404
+
+@app.route("/api/rooms/<room_id>/history")
+def get_room_history(room_id):
+    """API lấy lịch sử các vòng của phòng"""
+    owner = redirect_to_owner(room_id)
+    if owner:
+        return owner
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    history = game_manager.get_room_history(room_id, limit)
+    if history is None:
+        return jsonify({"error": "Phòng không tồn tại"}), 404
+    return jsonify({"room_id": room_id, "history": history})
+
+@app.route("/api/rooms/<room_id>/leaderboard")
+def get_room_leaderboard(room_id):
+    """API bảng xếp hạng của phòng: top-N, hạng và những người xung quanh ?player="""
+    owner = redirect_to_owner(room_id)
+    if owner:
+        return owner
+    limit = min(max(request.args.get('limit', GAME_CONFIG['LEADERBOARD_SIZE'], type=int), 1), 100)
+    radius = min(max(request.args.get('radius', 2, type=int), 0), 10)
+    leaderboard = game_manager.get_leaderboard(room_id, limit, request.args.get('player'), radius)
+    if leaderboard is None:
+        return jsonify({"error": "Phòng không tồn tại"}), 404
+    return jsonify(leaderboard)
+
+@app.route("/api/leaderboard")
+def get_global_leaderboard():
+    """API bảng xếp hạng chung của mọi phòng (?limit=, ?player=)"""
+    limit = min(max(request.args.get('limit', GAME_CONFIG['LEADERBOARD_SIZE'], type=int), 1), 100)
+    return jsonify(game_manager.get_global_leaderboard(limit, request.args.get('player'), global_ranking))
+
+@app.route("/api/leaderboard/scores")
+def get_global_scores():
+    """Mọi điểm chung của worker này (dùng nội bộ giữa các worker, có ETag)"""
+    version, body = global_leaderboard_payload()
+    etag = f"scores-{version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
     else:
-        return jsonify({"error": "Không thể tạo phòng"}), 400
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+@app.route("/api/stats")
+def get_stats():
+    """API số liệu server (lớp lưu trữ, hàng đợi ghi snapshot)"""
+    return jsonify(server_stats())
+
+@app.route("/api/rooms", methods=["POST"])
+def create_room_api():
+    """API tạo phòng"""
+    payload, status = create_room_from_api(request.get_json())
+    if status == 307:
+        return redirect(payload['url'] + request.path, code=307)
+    return jsonify(payload), status
 
 # Socket.IO Events
 @socketio.on('create_room')
@@ -870,7 +1983,13 @@ def on_create_room(data):
     max_players = data.get('max_players', 10)
 
     if not room_id or not room_name:
-        emit('create_room_error', {'error': 'ID phòng và tên phòng không được để trống'})
+        transport.reply('create_room_error', {'error': 'ID phòng và tên phòng không được để trống'})
+        return
+
+    route = room_route(room_id)
+    if route:
+        # Phòng thuộc worker khác: client chuyển socket sang đó rồi gửi lại create_room
+        transport.reply('room_redirect', dict(route, event='create_room'))
         return
 
     # Tạo phòng
@@ -878,34 +1997,51 @@ def on_create_room(data):
 
     if room:
         # Tham gia Socket.IO room ngay sau khi tạo
-        join_room(room_id)
+        transport.enter_room(room_id)
 
-        emit('room_created', {
+        transport.reply('room_created', {
             'room_id': room_id,
             'room_name': room_name,
             'max_players': max_players
         })
 
         logger.info(f"Room {room_id} created successfully")
-        
-        # Lưu rooms vào file sau khi tạo phòng
-        game_manager.save_rooms_to_file()
     else:
-        emit('create_room_error', {'error': 'Không thể tạo phòng'})
+        transport.reply('create_room_error', {'error': 'Không thể tạo phòng'})
         logger.warning(f"Failed to create room {room_id}")
 
 @socketio.on('connect')
-def on_connect():
-    logger.info(f"Client connected: {request.sid}")
-    emit('connected', {'sid': request.sid})
+def on_connect(auth=None):
+    sid = transport.current_sid()
+    logger.info(f"Client connected: {sid}")
+    transport_metrics.connected(sid, transport.transport_name(sid))
+    slow_consumers.start()
+    if isinstance(auth, dict) and auth.get('protocol') == 'legacy':
+        mark_legacy_client(sid)
+    wire = wire_clients.negotiate(sid, auth)
+    if wire != 'json':
+        # Tất cả client nhị phân: đích của emit không chỉ định room
+        transport.enter_room(wire_group(None))
+    transport.reply('connected', {'sid': sid, 'wire': wire})
 
 @socketio.on('disconnect')
 def on_disconnect():
-    logger.info(f"Client disconnected: {request.sid}")
-    game_manager.leave_room(request.sid)
-    
-    # Lưu rooms vào file sau khi disconnect
-    game_manager.save_rooms_to_file()
+    sid = transport.current_sid()
+    logger.info(f"Client disconnected: {sid}")
+    game_manager.leave_room(sid)
+    legacy_clients.discard(sid)
+    wire_clients.forget(sid)
+    transport_metrics.disconnected(sid)
+
+@socketio.on('transport_upgraded')
+def on_transport_upgraded(data=None):
+    """Client báo đã nâng cấp từ long-polling lên WebSocket (chỉ dùng cho số liệu)"""
+    sid = transport.current_sid()
+    if transport.transport_name(sid) != 'websocket':
+        return
+    latency = transport_metrics.upgraded(sid)
+    if latency is not None:
+        logger.debug(f"Client {sid} upgraded to websocket after {latency:.0f}ms")
 
 @socketio.on('join_room')
 def on_join_room(data):
@@ -921,31 +2057,41 @@ def on_join_room(data):
         password = password_raw.strip() or None
 
     if not room_id:
-        emit('join_error', {'error': 'ID phòng không được để trống'})
+        transport.reply('join_error', {'error': 'ID phòng không được để trống'})
         return
 
-    success, message = game_manager.join_room(room_id, player_name, request.sid, password)
+    route = room_route(room_id)
+    if route:
+        transport.reply('room_redirect', dict(route, event='join_room'))
+        return
+
+    sid = transport.current_sid()
+    success, message = game_manager.join_room(room_id, player_name, sid, password)
     
     if success:
         room = game_manager.find_room_by_id(room_id)
+        room_id = room.id  # dùng ID gốc để khớp với các broadcast của phòng
         # Tham gia Socket.IO room để nhận tin nhắn
-        join_room(room_id)
+        transport.enter_room(room_id)
+        if sid in legacy_clients:
+            transport.enter_room(legacy_group(room_id))
         logger.info(f"Player {player_name} joined Socket.IO room {room_id}")
 
         # Gửi thông tin phòng
-        emit('room_joined', {
+        transport.reply('room_joined', {
             'room_id': room_id,
             'room_name': room.name,
             'player_name': player_name,
-            'room_info': game_manager.get_room_info(room_id)
+            'room_info': game_manager.get_room_info(room_id, sid)
         })
 
         # Thông báo cho phòng
-        socketio.emit('player_joined', {
+        change = game_manager.find_change(room, 'joined', player_name)
+        broadcast_to_room('player_joined', dict({
             'room_id': room_id,
             'player_name': player_name,
             'current_players': len(room.players)
-        }, to=room_id)
+        }, **game_manager.state_fields(room, change)), room_id)
 
         # Nếu đây là người chơi đầu tiên, bắt đầu vòng 1
         if len(room.players) == 1:
@@ -953,24 +2099,22 @@ def on_join_room(data):
             logger.info(f"First player joined room {room_id}, room already has round 1 ready")
 
         logger.info(f"Player {player_name} successfully joined room {room_id}")
-        
-        # Lưu rooms vào file sau khi tham gia phòng
-        game_manager.save_rooms_to_file()
     else:
-        emit('join_error', {'error': message})
+        transport.reply('join_error', {'error': message})
         logger.warning(f"Failed to join room: {message}")
 
 @socketio.on('join')
 def on_join_legacy(data):
     """Event handler cũ để tương thích ngược - chuyển đổi sang join_room"""
     logger.info(f"Legacy 'join' event received, converting to 'join_room'")
+    mark_legacy_client(transport.current_sid())
 
     # Chuyển đổi data format cũ sang mới
     room_id = data.get('room', '').strip()
     player_name = data.get('name', 'Player').strip()[:20]
 
     if not room_id:
-        emit('join_error', {'error': 'ID phòng không được để trống'})
+        transport.reply('join_error', {'error': 'ID phòng không được để trống'})
         return
 
     # Gọi lại event handler mới
@@ -983,12 +2127,9 @@ def on_join_legacy(data):
 @socketio.on('leave_room')
 def on_leave_room():
     """Rời phòng"""
-    game_manager.leave_room(request.sid)
-    
-    # Lưu rooms vào file sau khi rời phòng
-    game_manager.save_rooms_to_file()
+    game_manager.leave_room(transport.current_sid())
     
-    emit('room_left', {'message': 'Đã rời phòng'})
+    transport.reply('room_left', {'message': 'Đã rời phòng'})
 
 @socketio.on('make_guess')
 def on_make_guess(data):
@@ -997,13 +2138,14 @@ def on_make_guess(data):
     try:
         guess = int(data.get('guess'))
     except (ValueError, TypeError):
-        emit('guess_error', {'error': 'Số không hợp lệ'})
+        transport.reply('guess_error', {'error': 'Số không hợp lệ'})
         return
 
-    success, message, details = game_manager.make_guess(room_id, request.sid, guess)
+    sid = transport.current_sid()
+    success, message, details = game_manager.make_guess(room_id, sid, guess)
 
     if success:
-        emit('guess_result', {
+        transport.reply('guess_result', {
             'message': message,
             'details': details
         })
@@ -1011,30 +2153,36 @@ def on_make_guess(data):
         # Emit event cũ để tương thích ngược - chỉ cho người chơi đã đoán
         emit_legacy_events(room_id, 'message', {
             'message': message
-        }, target_sid=request.sid)
+        }, target_sid=sid)
 
         # Cập nhật bảng điểm nếu đoán đúng
         if details.get('correct'):
-            socketio.emit('scoreboard_updated', {
-                'scores': game_manager.get_room_info(room_id)['scores']
-            }, to=room_id)
-            
-            # Lưu rooms vào file sau khi có thay đổi điểm số
-            game_manager.save_rooms_to_file()
+            # Chỉ gửi delta điểm của người vừa đoán đúng; client tự gộp vào bảng điểm của mình
+            room = game_manager.find_room_by_id(room_id)
+            player = room.players.get(sid) if room else None
+            change = game_manager.find_change(room, 'scores', player.name) if player else None
+            if change:
+                # 'scores' (top N) cho client cũ chưa đọc delta 'changes'
+                broadcast_to_room('scoreboard_updated', dict({
+                    'room_id': room.id,
+                    'scores': room.scores.as_dict(GAME_CONFIG['LEADERBOARD_SIZE']),
+                    'ranked_players': len(room.scores)
+                }, **game_manager.state_fields(room, change)), room.id)
     else:
-        emit('guess_error', {'error': message})
+        transport.reply('guess_error', {'error': message})
 
 @socketio.on('guess')
 def on_guess_legacy(data):
     """Event handler cũ để tương thích ngược - chuyển đổi sang make_guess"""
     logger.info(f"Legacy 'guess' event received, converting to 'make_guess'")
+    mark_legacy_client(transport.current_sid())
 
     # Chuyển đổi data format cũ sang mới
     room_id = data.get('room', '').strip()
     try:
         guess = int(data.get('number'))
     except (ValueError, TypeError):
-        emit('guess_error', {'error': 'Số không hợp lệ'})
+        transport.reply('guess_error', {'error': 'Số không hợp lệ'})
         return
 
     # Gọi lại event handler mới
@@ -1051,26 +2199,28 @@ def on_chat_message(data):
 
     # Validation input
     if not room_id or not message:
-        emit('chat_error', {'error': 'ID phòng và tin nhắn không được để trống'})
+        transport.reply('chat_error', {'error': 'ID phòng và tin nhắn không được để trống'})
         return
 
     if len(message) > GAME_CONFIG['MAX_CHAT_LENGTH']:
-        emit('chat_error', {'error': f'Tin nhắn quá dài (tối đa {GAME_CONFIG["MAX_CHAT_LENGTH"]} ký tự)'})
+        transport.reply('chat_error', {'error': f'Tin nhắn quá dài (tối đa {GAME_CONFIG["MAX_CHAT_LENGTH"]} ký tự)'})
         return
 
                 # Tìm phòng (không phân biệt chữ hoa/thường)
     room = game_manager.find_room_by_id(room_id)
     if not room:
         logger.warning(f"Chat failed: Room {room_id} not found")
-        emit('chat_error', {'error': 'Không thể gửi tin nhắn'})
+        transport.reply('chat_error', {'error': 'Không thể gửi tin nhắn'})
         return
-    
-    if request.sid not in room.players:
-        logger.warning(f"Chat failed: Player {request.sid} not found in room {room_id}")
-        emit('chat_error', {'error': 'Không thể gửi tin nhắn'})
+    room_id = room.id  # dùng ID gốc để khớp với Socket.IO room đã tham gia
+
+    sid = transport.current_sid()
+    if sid not in room.players:
+        logger.warning(f"Chat failed: Player {sid} not found in room {room_id}")
+        transport.reply('chat_error', {'error': 'Không thể gửi tin nhắn'})
         return
     
-    player = room.players[request.sid]
+    player = room.players[sid]
 
     # Thêm tin nhắn chat mới
     player.add_chat_message()
@@ -1083,10 +2233,7 @@ def on_chat_message(data):
         'type': 'chat'
     }
 
-    socketio.emit('chat_message', chat_data, to=room_id)
-    
-    # Lưu rooms vào file sau khi có thay đổi
-    game_manager.save_rooms_to_file()
+    broadcast_to_room('chat_message', chat_data, room_id)
     
     logger.info(f"Chat in room {room_id}: {player.name}: {message}")
 
@@ -1094,6 +2241,7 @@ def on_chat_message(data):
 def on_chat_legacy(data):
     """Event handler cũ để tương thích ngược - chuyển đổi sang chat_message"""
     logger.info(f"Legacy 'chat' event received, converting to 'chat_message'")
+    mark_legacy_client(transport.current_sid())
 
     # Chuyển đổi data format cũ sang mới
     room_id = data.get('room', '').strip()
@@ -1109,36 +2257,62 @@ def on_chat_legacy(data):
 def on_reset_room(data):
     """Reset phòng"""
     room_id = data.get('room_id', '').strip()
+    room = game_manager.find_room_by_id(room_id)
+    if room:
+        room_id = room.id  # dùng ID gốc để khớp với Socket.IO room đã tham gia
 
-    success, message = game_manager.reset_room(room_id, request.sid)
+    success, message = game_manager.reset_room(room_id, transport.current_sid())
 
     if success:
-        emit('room_reset', {'message': message})
-        socketio.emit('room_reset', {'message': message}, to=room_id)
-        
-        # Lưu rooms vào file sau khi reset phòng
-        game_manager.save_rooms_to_file()
+        transport.reply('room_reset', {'message': message})
+        broadcast_to_room('room_reset', {'message': message}, room_id)
         
         logger.info(f"Room {room_id} reset successfully")
     else:
-        emit('reset_error', {'error': message})
+        transport.reply('reset_error', {'error': message})
 
 @socketio.on('get_room_info')
 def on_get_room_info(data):
-    """Lấy thông tin phòng"""
+    """Lấy thông tin phòng (kèm since_seq + epoch: chỉ các delta còn thiếu nếu được)"""
     room_id = data.get('room_id', '').strip()
-    room_info = game_manager.get_room_info(room_id)
+    since_seq = data.get('since_seq')
+    if isinstance(since_seq, int) and data.get('epoch'):
+        changes = game_manager.get_room_changes(room_id, since_seq, data['epoch'])
+        if changes is not None:
+            transport.reply('room_info', changes)
+            return
+    room_info = game_manager.get_room_info(room_id, transport.current_sid())
 
     if room_info:
-        emit('room_info', room_info)
+        transport.reply('room_info', room_info)
     else:
-        emit('room_info_error', {'error': 'Phòng không tồn tại'})
+        transport.reply('room_info_error', {'error': 'Phòng không tồn tại'})
+
+@socketio.on('get_global_leaderboard')
+def on_get_global_leaderboard(data=None):
+    """Lấy bảng xếp hạng chung (mặc định kèm hạng của chính người hỏi)"""
+    data = data if isinstance(data, dict) else {}
+    try:
+        limit = min(max(int(data.get('limit', GAME_CONFIG['LEADERBOARD_SIZE'])), 1), 100)
+    except (ValueError, TypeError):
+        limit = GAME_CONFIG['LEADERBOARD_SIZE']
+    player_name = data.get('player_name')
+    sid = transport.current_sid()
+    if not player_name and sid in game_manager.player_rooms:
+        room = game_manager.find_room_by_id(game_manager.player_rooms[sid])
+        player = room.players.get(sid) if room else None
+        player_name = player.name if player else None
+    transport.reply('global_leaderboard', game_manager.get_global_leaderboard(limit, player_name, global_ranking))
 
 @socketio.on('get_available_rooms')
-def on_get_available_rooms():
+def on_get_available_rooms(data=None):
     """Lấy danh sách phòng có sẵn"""
-    rooms = game_manager.get_available_rooms()
-    emit('available_rooms', {'rooms': rooms})
+    version, rooms = room_listing.snapshot()
+    # Client đã có bản mới nhất: chỉ trả version
+    if isinstance(data, dict) and data.get('version') == version:
+        transport.reply('available_rooms', {'version': version, 'not_modified': True})
+        return
+    transport.reply('available_rooms', {'rooms': rooms, 'version': version})
 
 # Error handlers
 @app.errorhandler(404)
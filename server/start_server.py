@@ -59,14 +59,15 @@ def setup_logging(env_type):
     
     return logger
 
-def check_dependencies():
+def check_dependencies(async_mode='threading'):
     """Kiểm tra dependencies"""
     required_packages = [
         'flask',
         'flask_socketio',
-        'flask_cors',
-        'eventlet'
+        'flask_cors'
     ]
+    # Chế độ asyncio chạy trên uvicorn, không cần eventlet
+    required_packages.append('uvicorn' if async_mode == 'asyncio' else 'eventlet')
     
     missing_packages = []
     for package in required_packages:
@@ -87,7 +88,7 @@ def check_dependencies():
     
     return True
 
-def start_server(env_type, host, port, workers):
+def start_server(env_type, host, port, workers, async_mode='threading'):
     """Khởi động server"""
     try:
         # Thiết lập môi trường
@@ -97,12 +98,20 @@ def start_server(env_type, host, port, workers):
         logger = setup_logging(env_type)
         
         # Kiểm tra dependencies
-        if not check_dependencies():
+        if not check_dependencies(async_mode):
             sys.exit(1)
         
+        if env_type == 'production' and workers > 1:
+            # Tiến trình này chỉ giám sát: mỗi worker là một server riêng giữ một phần các phòng
+            from cluster import Supervisor
+            logger.info(f"Production mode with {workers} worker processes on ports {port}-{port + workers - 1}")
+            Supervisor(workers, port, ['--env', env_type, '--host', host, '--async-mode', async_mode],
+                       public_host=os.environ.get('GAME_PUBLIC_HOST', 'localhost')).run()
+            return
+
         # Import server sau khi đã thiết lập môi trường
         try:
-            from server import app, socketio, GAME_CONFIG
+            from server import app, socketio, GAME_CONFIG, engine_config
         except ImportError as e:
             logger.error(f"Failed to import server: {e}")
             print(f"❌ Import error: {e}")
@@ -114,10 +123,17 @@ def start_server(env_type, host, port, workers):
         logger.info(f"Host: {host}")
         logger.info(f"Port: {port}")
         logger.info(f"Game config: {GAME_CONFIG}")
-        
-        if env_type == 'production':
-            # Production mode với multiple workers
-            logger.info(f"Production mode with {workers} workers")
+        logger.info(f"Transport: {engine_config.as_dict()}")
+
+        if async_mode == 'asyncio':
+            # Cùng giao thức sự kiện và REST route, phục vụ bằng AsyncServer trên ASGI
+            import async_server
+            logger.info("Async mode: python-socketio AsyncServer on uvicorn")
+            async_server.run(host=host, port=port,
+                             log_level='debug' if env_type == 'development' else 'info')
+        elif env_type == 'production':
+            # Production mode, một tiến trình (hoặc một worker do Supervisor khởi động)
+            logger.info("Production mode")
             socketio.run(
                 app,
                 host=host,
@@ -144,6 +160,36 @@ def start_server(env_type, host, port, workers):
         logger.error(f"Failed to start server: {e}")
         sys.exit(1)
 
+def setup_transport(args):
+    """Ghi cấu hình Engine.IO vào biến môi trường: server.py (và các worker con) đọc lại khi tạo SocketIO"""
+    from engine import EngineConfig
+
+    config = EngineConfig.from_env()
+    overrides = {
+        'profile': args.transport_profile,
+        'ping_interval': args.ping_interval,
+        'ping_timeout': args.ping_timeout,
+        'max_http_buffer_size': args.max_http_buffer_size,
+        'deflate_threshold': args.deflate_threshold
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(config, name, value)
+    os.environ.update(config.to_env())
+
+def convert_snapshot_command(path, snapshot_format):
+    """Chuyển snapshot sang định dạng khác rồi thoát (không khởi động server)"""
+    from storage import convert_snapshot
+
+    try:
+        rooms, before, after = convert_snapshot(Path(path), snapshot_format)
+    except (OSError, ValueError) as e:
+        print(f"❌ Convert failed: {e}")
+        sys.exit(1)
+
+    ratio = before / after if after else 0
+    print(f"✅ Converted {rooms} rooms to {snapshot_format}: {before} -> {after} bytes ({ratio:.1f}x)")
+
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(
@@ -154,11 +200,21 @@ Examples:
   # Development mode
   python start_server.py --env development
   
-  # Production mode
+  # Production mode: 4 tiến trình worker ở cổng 5000-5003, phòng chia theo consistent hash
   python start_server.py --env production --host 0.0.0.0 --port 5000 --workers 4
   
   # Testing mode
   python start_server.py --env testing --port 5001
+
+  # Chỉ WebSocket (không long-polling), nén message từ 2KB, phát hiện client mất kết nối sau ~15s
+  python start_server.py --env production --transport-profile websocket --deflate-threshold 2048 \
+      --ping-interval 10 --ping-timeout 5
+
+  # Chế độ asyncio (nhiều kết nối đồng thời, cần uvicorn)
+  python start_server.py --env production --async-mode asyncio
+
+  # Chuyển snapshot sang định dạng nhị phân
+  python start_server.py --convert-snapshot game_data_rooms --format binary
         """
     )
     
@@ -186,9 +242,59 @@ Examples:
         '--workers', '-w',
         type=int,
         default=1,
-        help='Number of workers for production mode (default: 1)'
+        help='Number of worker processes for production mode, on consecutive ports (default: 1)'
     )
     
+    parser.add_argument(
+        '--async-mode',
+        choices=['threading', 'asyncio'],
+        default='threading',
+        help='Serving stack: Flask-SocketIO threads or asyncio/ASGI (default: threading)'
+    )
+
+    parser.add_argument(
+        '--transport-profile',
+        choices=['default', 'websocket'],
+        help='Engine.IO transports: polling then upgrade, or websocket only (default: default)'
+    )
+
+    parser.add_argument(
+        '--ping-interval',
+        type=float,
+        help='Seconds between server pings (default: 25)'
+    )
+
+    parser.add_argument(
+        '--ping-timeout',
+        type=float,
+        help='Seconds to wait for a pong before dropping the client (default: 20)'
+    )
+
+    parser.add_argument(
+        '--max-http-buffer-size',
+        type=int,
+        help='Largest accepted message or polling payload in bytes (default: 1000000)'
+    )
+
+    parser.add_argument(
+        '--deflate-threshold',
+        type=int,
+        help='Compress messages from this many bytes, -1 disables compression (default: 1024)'
+    )
+
+    parser.add_argument(
+        '--convert-snapshot',
+        metavar='PATH',
+        help='Convert a snapshot file or shard directory and exit'
+    )
+
+    parser.add_argument(
+        '--format',
+        choices=['json', 'binary'],
+        default='binary',
+        help='Target format for --convert-snapshot (default: binary)'
+    )
+
     parser.add_argument(
         '--version', '-v',
         action='version',
@@ -196,6 +302,10 @@ Examples:
     )
     
     args = parser.parse_args()
+
+    if args.convert_snapshot:
+        convert_snapshot_command(args.convert_snapshot, args.format)
+        return
     
     # Validation
     if args.env == 'production' and args.workers < 1:
@@ -206,8 +316,15 @@ Examples:
         print("❌ Port must be between 1 and 65535")
         sys.exit(1)
     
+    if args.ping_interval is not None and args.ping_interval <= 0 or \
+            args.ping_timeout is not None and args.ping_timeout <= 0:
+        print("❌ Ping interval and timeout must be positive")
+        sys.exit(1)
+
+    setup_transport(args)
+
     # Khởi động server
-    start_server(args.env, args.host, args.port, args.workers)
+    start_server(args.env, args.host, args.port, args.workers, args.async_mode)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,704 @@
+"""
+Các backend lưu trữ phòng cho GameManager
+- JsonFileStorage: một file game_data.json chứa tất cả phòng
+- ShardedJsonStorage: mỗi phòng một file + manifest nhỏ, chỉ ghi lại phòng đã thay đổi
+- SQLiteStorage: SQLite ở chế độ WAL, cập nhật từng dòng trong transaction theo lô
+Mỗi backend cũng lưu bảng xếp hạng chung (tên người chơi -> tổng điểm mọi phòng).
+Các backend file ghi JSON hoặc định dạng nhị phân gọn (codec.py), khi đọc tự nhận diện.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from codec import encode_snapshot, read_snapshot_file
+
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOT_FORMATS = ('json', 'binary')
+
+
+def _atomic_write_json(path: Path, data, indent=None):
+    """Ghi JSON ra file tạm rồi đổi tên để không làm hỏng file khi bị ngắt giữa chừng"""
+    tmp_file = path.with_name(path.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_file, path)
+
+
+def _atomic_write_snapshot(path: Path, data, snapshot_format: str, indent=None):
+    """Ghi snapshot theo định dạng đã chọn ('json' hoặc 'binary')"""
+    if snapshot_format != 'binary':
+        _atomic_write_json(path, data, indent=indent)
+        return
+    tmp_file = path.with_name(path.name + '.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(encode_snapshot(data))
+    os.replace(tmp_file, path)
+
+
+class PartialWriteError(Exception):
+    """Một số phòng trong lô không ghi được; các phòng còn lại đã được ghi xong"""
+
+    def __init__(self, failed_rooms: Set[str], errors: Dict[str, Exception]):
+        self.failed_rooms = set(failed_rooms)
+        self.errors = errors
+        first = next(iter(errors.values()), None)
+        super().__init__(f"{len(self.failed_rooms)} room(s) failed to write: {first}")
+
+
+# Các trường của Room đủ để liệt kê phòng mà chưa cần dựng Room đầy đủ
+SUMMARY_FIELDS = ('id', 'name', 'is_private', 'is_active', 'max_players',
+                  'round_number', 'created_at', 'last_activity')
+
+
+def room_summary(room_dict: dict) -> dict:
+    """Bản tóm tắt nhẹ của phòng dùng cho index"""
+    return {field: room_dict.get(field) for field in SUMMARY_FIELDS}
+
+
+class StorageBackend:
+    """Giao diện chung cho các backend lưu trữ phòng.
+    Các thay đổi (upsert/delete/append_history) chỉ có hiệu lực sau commit()."""
+
+    # True nếu backend cần journal phía trước để tránh ghi lại dữ liệu lớn mỗi lần flush
+    journaled = True
+    # True khi dữ liệu được đọc từ định dạng cũ, lần ghi sau phải ghi đủ mọi phòng
+    migrated = False
+
+    def exists(self) -> bool:
+        raise NotImplementedError
+
+    def load_all(self) -> Tuple[Dict[str, dict], int]:
+        """Đọc tất cả phòng, trả về (rooms_data, journal_seq)"""
+        raise NotImplementedError
+
+    def load_index(self) -> Optional[Tuple[Dict[str, dict], int]]:
+        """Đọc index nhẹ (room_id -> room_summary) mà không đọc dữ liệu phòng.
+        Trả về None nếu backend không có index, khi đó phải dùng load_all()."""
+        return None
+
+    def load_room(self, room_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def upsert_room(self, room_id: str, room_dict: dict):
+        raise NotImplementedError
+
+    def delete_room(self, room_id: str):
+        raise NotImplementedError
+
+    def append_history(self, room_id: str, entry: dict):
+        """Lưu một vòng đã kết thúc (backend file đã có game_history trong room_dict)"""
+
+    def clear_history(self, room_id: str):
+        """Phòng đã reset: bỏ lịch sử đã lưu (backend file thay cả game_history theo room_dict)"""
+
+    def load_history(self, room_id: str, limit: int = 10) -> List[dict]:
+        """Lịch sử các vòng gần nhất, mới nhất trước"""
+        room_dict = self.load_room(room_id)
+        if not room_dict:
+            return []
+        return list(reversed(room_dict.get('game_history', [])))[:limit]
+
+    def load_global_scores(self) -> Dict[str, int]:
+        """Điểm của bảng xếp hạng chung: tên người chơi -> tổng điểm (gọi sau load_all/load_index)"""
+        return {}
+
+    def upsert_global_scores(self, scores: Dict[str, int]):
+        """Cập nhật điểm đã thay đổi của bảng xếp hạng chung"""
+        raise NotImplementedError
+
+    def commit(self, journal_seq: int = 0):
+        """Ghi tất cả thay đổi đang chờ trong một lần"""
+        raise NotImplementedError
+
+    def rollback(self):
+        """Bỏ các thay đổi chưa commit sau khi một lô ghi lỗi (lô sẽ được ghi lại từ đầu)"""
+
+    def write(self, rooms_data: Dict[str, dict], deleted_ids: Iterable[str], journal_seq: int = 0,
+              global_scores: Dict[str, int] = None):
+        """Ghi một lô phòng đã thay đổi, phòng đã xóa và điểm chung đã thay đổi"""
+        for room_id, room_dict in rooms_data.items():
+            self.upsert_room(room_id, room_dict)
+        for room_id in deleted_ids:
+            self.delete_room(room_id)
+        if global_scores:
+            self.upsert_global_scores(global_scores)
+        self.commit(journal_seq)
+
+    def close(self):
+        pass
+
+
+class JsonFileStorage(StorageBackend):
+    """Toàn bộ phòng trong một file JSON (định dạng game_data.json)"""
+
+    def __init__(self, path: Path, snapshot_format: str = 'json'):
+        self.path = Path(path)
+        self.snapshot_format = snapshot_format
+        # File chứa mọi phòng nên phải giữ bản đầy đủ trong bộ nhớ để ghi lại
+        self._rooms: Dict[str, dict] = {}
+        self._global_scores: Dict[str, int] = {}
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load_all(self) -> Tuple[Dict[str, dict], int]:
+        if not self.path.exists():
+            return {}, 0
+        data = read_snapshot_file(self.path)
+        if 'version' in data and 'rooms' in data:
+            rooms_data, journal_seq = data['rooms'], data.get('journal_seq', 0)
+            self._global_scores = dict(data.get('global_scores', {}))
+        else:
+            # Định dạng cũ: {room_id: room_dict}
+            rooms_data, journal_seq = data, 0
+        self._rooms = dict(rooms_data)
+        return rooms_data, journal_seq
+
+    def load_room(self, room_id: str) -> Optional[dict]:
+        return self._rooms.get(room_id)
+
+    def upsert_room(self, room_id: str, room_dict: dict):
+        self._rooms[room_id] = room_dict
+
+    def delete_room(self, room_id: str):
+        self._rooms.pop(room_id, None)
+
+    def load_global_scores(self) -> Dict[str, int]:
+        return dict(self._global_scores)
+
+    def upsert_global_scores(self, scores: Dict[str, int]):
+        self._global_scores.update(scores)
+
+    def commit(self, journal_seq: int = 0):
+        snapshot = {
+            'version': 2,
+            'journal_seq': journal_seq,  # các record journal có seq <= giá trị này đã nằm trong snapshot
+            'saved_at': time.time(),
+            'rooms': self._rooms,
+            'global_scores': self._global_scores
+        }
+        _atomic_write_snapshot(self.path, snapshot, self.snapshot_format, indent=2)
+
+
+class ShardedJsonStorage(StorageBackend):
+    """Mỗi phòng một file <room_id>.json trong thư mục riêng, kèm manifest.json.
+    Điểm chung chia theo tên vào GLOBAL_BUCKETS file global/<n>.json, chỉ ghi lại file đã đổi."""
+
+    GLOBAL_BUCKETS = 64
+    # room_id chỉ gồm ký tự an toàn và đủ ngắn thì dùng nguyên làm tên file
+    PLAIN_NAME = re.compile(r'[A-Za-z0-9_-]{1,64}')
+    # Tên file của thư mục đã dành cho manifest (so không phân biệt hoa thường cho FS như NTFS/APFS)
+    RESERVED_NAMES = {'manifest'}
+    PREFIX_LENGTH = 40
+
+    def __init__(self, directory: Path, legacy_file: Path = None, load_workers: int = 8,
+                 snapshot_format: str = 'json'):
+        self.directory = Path(directory)
+        self.snapshot_format = snapshot_format
+        self.manifest_path = self.directory / 'manifest.json'
+        # game_data.json cũ, dùng để chuyển đổi lần đầu
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.load_workers = load_workers
+        self._manifest: Dict[str, str] = {}  # room_id -> tên file shard
+        self._index: Dict[str, dict] = {}     # room_id -> room_summary, ghi kèm manifest
+        self._pending_upserts: Dict[str, dict] = {}
+        self._pending_deletes = set()
+        self._global_files: Dict[str, str] = {}              # bucket -> tên file
+        self._global_buckets: Dict[str, Dict[str, int]] = {}  # bucket đã đọc: tên -> điểm
+        self._pending_global = set()                          # bucket cần ghi lại
+        self._journal_seq = 0  # journal_seq của manifest đang có trên đĩa
+
+    @classmethod
+    def shard_name(cls, room_id: str, snapshot_format: str = 'json') -> str:
+        """Tên file an toàn, độ dài giới hạn cho room_id (room_id có thể chứa dấu cách và chữ Unicode).
+        room_id khác (kể cả tên trùng file dành riêng như 'manifest'): tiền tố ASCII dễ đọc + '~' + sha1,
+        room_id thật nằm trong manifest. '~' không có trong tên dạng nguyên nên hai dạng không trùng nhau."""
+        ext = '.bin' if snapshot_format == 'binary' else '.json'
+        if cls.PLAIN_NAME.fullmatch(room_id) and room_id.lower() not in cls.RESERVED_NAMES:
+            return room_id + ext
+        ascii_id = unicodedata.normalize('NFKD', room_id).encode('ascii', 'ignore').decode('ascii')
+        prefix = re.sub(r'[^A-Za-z0-9_-]+', '_', ascii_id).strip('_')[:cls.PREFIX_LENGTH]
+        digest = hashlib.sha1(room_id.encode('utf-8')).hexdigest()[:16]
+        return f"{prefix}~{digest}{ext}"
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists() or bool(self.legacy_file and self.legacy_file.exists())
+
+    def _read_shard(self, file_name: str) -> dict:
+        # Manifest có thể trỏ tới shard của cả hai định dạng (vd. đang chuyển đổi dần)
+        return read_snapshot_file(self.directory / file_name)
+
+    def _safe_read(self, room_id: str, file_name: str):
+        try:
+            return self._read_shard(file_name)
+        except Exception as e:
+            logger.error(f"Error reading shard for room {room_id}: {e}")
+            return None
+
+    def load_all(self) -> Tuple[Dict[str, dict], int]:
+        """Đọc manifest rồi load song song các shard"""
+        if not self.manifest_path.exists():
+            if self.legacy_file and self.legacy_file.exists():
+                logger.info(f"No shard manifest, migrating from {self.legacy_file.name}")
+                self.migrated = True
+                return JsonFileStorage(self.legacy_file).load_all()
+            return {}, 0
+
+        manifest = self._read_manifest()
+
+        rooms_data = {}
+        items = list(self._manifest.items())
+        with ThreadPoolExecutor(max_workers=max(1, self.load_workers)) as pool:
+            results = pool.map(lambda item: self._safe_read(*item), items)
+            for (room_id, _), room_dict in zip(items, results):
+                if room_dict is not None:
+                    rooms_data[room_id] = room_dict
+
+        # Manifest cũ chưa có index: dựng lại để lần commit sau ghi đủ
+        self._index = {room_id: room_summary(room_dict) for room_id, room_dict in rooms_data.items()}
+        return rooms_data, manifest.get('journal_seq', 0)
+
+    def _read_manifest(self) -> dict:
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self._manifest = dict(manifest.get('rooms', {}))
+        for room_id, file_name in list(self._manifest.items()):
+            if file_name.lower() == self.manifest_path.name:
+                # Shard của bản cũ đã bị chính manifest ghi đè: không còn dữ liệu phòng để đọc
+                logger.error(f"Dropping room {room_id}: its shard was overwritten by the manifest")
+                del self._manifest[room_id]
+        self._index = dict(manifest.get('index', {}))
+        self._global_files = dict(manifest.get('global', {}))
+        self._journal_seq = manifest.get('journal_seq', 0)
+        return manifest
+
+    def load_index(self) -> Optional[Tuple[Dict[str, dict], int]]:
+        """Chỉ đọc manifest (index nằm trong manifest), không mở shard nào"""
+        if not self.manifest_path.exists():
+            return None
+        manifest = self._read_manifest()
+        if set(self._index) != set(self._manifest):
+            # Manifest cũ chưa có index đầy đủ
+            return None
+        return dict(self._index), manifest.get('journal_seq', 0)
+
+    def load_room(self, room_id: str) -> Optional[dict]:
+        file_name = self._manifest.get(room_id)
+        return self._safe_read(room_id, file_name) if file_name else None
+
+    def upsert_room(self, room_id: str, room_dict: dict):
+        self._pending_upserts[room_id] = room_dict
+        self._pending_deletes.discard(room_id)
+
+    def delete_room(self, room_id: str):
+        self._pending_deletes.add(room_id)
+        self._pending_upserts.pop(room_id, None)
+
+    @classmethod
+    def global_bucket(cls, name: str) -> str:
+        # crc32 thay vì hash(): hash của str đổi giữa các lần chạy
+        return str(zlib.crc32(name.encode('utf-8')) % cls.GLOBAL_BUCKETS)
+
+    def _load_global_bucket(self, bucket: str) -> Dict[str, int]:
+        scores = self._global_buckets.get(bucket)
+        if scores is None:
+            file_name = self._global_files.get(bucket)
+            scores = {}
+            if file_name:
+                try:
+                    scores = self._read_shard(file_name)
+                except Exception as e:
+                    logger.error(f"Error reading global score bucket {bucket}: {e}")
+            self._global_buckets[bucket] = scores
+        return scores
+
+    def load_global_scores(self) -> Dict[str, int]:
+        scores = {}
+        for bucket in self._global_files:
+            scores.update(self._load_global_bucket(bucket))
+        return scores
+
+    def upsert_global_scores(self, scores: Dict[str, int]):
+        for name, score in scores.items():
+            bucket = self.global_bucket(name)
+            self._load_global_bucket(bucket)[name] = score
+            self._pending_global.add(bucket)
+
+    def commit(self, journal_seq: int = 0):
+        """Ghi các shard đã thay đổi, xóa shard của phòng đã xóa rồi cập nhật manifest"""
+        upserts, self._pending_upserts = self._pending_upserts, {}
+        deletes, self._pending_deletes = self._pending_deletes, set()
+        global_buckets, self._pending_global = self._pending_global, set()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        removed = []
+        errors: Dict[str, Exception] = {}
+        for room_id, room_dict in upserts.items():
+            file_name = self.shard_name(room_id, self.snapshot_format)
+            try:
+                _atomic_write_snapshot(self.directory / file_name, room_dict, self.snapshot_format)
+            except Exception as e:
+                # Một phòng lỗi không được chặn các phòng khác; manifest vẫn trỏ tới shard cũ của nó
+                logger.error(f"Error writing shard for room {room_id}: {e}")
+                errors[room_id] = e
+                continue
+            old_name = self._manifest.get(room_id)
+            if old_name and old_name != file_name:
+                removed.append(old_name)  # shard cũ ở định dạng hoặc cách đặt tên khác
+            self._manifest[room_id] = file_name
+            self._index[room_id] = room_summary(room_dict)
+
+        for room_id in deletes:
+            self._index.pop(room_id, None)
+            file_name = self._manifest.pop(room_id, None)
+            if file_name:
+                removed.append(file_name)
+
+        if global_buckets:
+            (self.directory / 'global').mkdir(exist_ok=True)
+        for bucket in global_buckets:
+            file_name = 'global/' + self.shard_name(bucket, self.snapshot_format)
+            _atomic_write_snapshot(self.directory / file_name, self._global_buckets[bucket], self.snapshot_format)
+            old_name = self._global_files.get(bucket)
+            if old_name and old_name != file_name:
+                removed.append(old_name)
+            self._global_files[bucket] = file_name
+
+        if errors:
+            # Phòng lỗi chỉ còn thay đổi trong journal: giữ journal_seq cũ để lần khởi động sau vẫn replay
+            journal_seq = self._journal_seq
+
+        # Manifest ghi sau cùng: shard mới chỉ có hiệu lực khi manifest trỏ tới
+        _atomic_write_json(self.manifest_path, {
+            'version': 3,
+            'journal_seq': journal_seq,
+            'saved_at': time.time(),
+            'rooms': self._manifest,
+            'index': self._index,
+            'global': self._global_files
+        })
+
+        for file_name in removed:
+            if file_name.lower() == self.manifest_path.name:
+                continue
+            try:
+                (self.directory / file_name).unlink()
+            except FileNotFoundError:
+                pass
+
+        if errors:
+            raise PartialWriteError(set(errors), errors)
+        self._journal_seq = journal_seq
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite ở chế độ WAL: phòng, điểm số và lịch sử ở các bảng riêng có index"""
+
+    # Mỗi lần flush chỉ cập nhật các dòng đã thay đổi, không cần journal riêng
+    journaled = False
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rooms (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS scores (
+        room_id TEXT NOT NULL,
+        player TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        PRIMARY KEY (room_id, player)
+    );
+    CREATE INDEX IF NOT EXISTS idx_scores_rank ON scores (room_id, score DESC);
+    CREATE TABLE IF NOT EXISTS game_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id TEXT NOT NULL,
+        round_number INTEGER,
+        number INTEGER,
+        winner TEXT,
+        total_guesses INTEGER,
+        duration REAL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_history_room ON game_history (room_id, id);
+    CREATE INDEX IF NOT EXISTS idx_history_winner ON game_history (winner);
+    CREATE TABLE IF NOT EXISTS global_scores (
+        player TEXT PRIMARY KEY,
+        score INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_global_rank ON global_scores (score DESC);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    HISTORY_FIELDS = ('round_number', 'number', 'winner', 'total_guesses', 'duration')
+
+    def __init__(self, path: Path, legacy_file: Path = None, history_limit: int = 10):
+        self.path = Path(path)
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        # Số vòng gần nhất đưa vào room_dict khi load (bảng vẫn giữ toàn bộ lịch sử)
+        self.history_limit = history_limit
+        self._lock = threading.Lock()
+        self._in_transaction = False
+
+        # isolation_level=None: tự quản lý BEGIN/COMMIT để gom nhiều thay đổi vào một transaction
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._ensure_history_key()
+        # Database chưa từng commit thì có thể chuyển đổi từ game_data.json cũ
+        self._is_new = self._conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'journal_seq'"
+        ).fetchone() is None
+
+    def _ensure_history_key(self):
+        """Mỗi vòng của một phòng chỉ có một dòng lịch sử: ghi lại một lô (sau lỗi) không nhân đôi dòng.
+        Database cũ có thể đã có dòng trùng từ các lần ghi lại trước đây, giữ dòng mới nhất"""
+        if self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_history_round'"
+        ).fetchone():
+            return
+        self._conn.execute('BEGIN')
+        self._conn.execute(
+            'DELETE FROM game_history WHERE round_number IS NOT NULL AND id NOT IN '
+            '(SELECT MAX(id) FROM game_history GROUP BY room_id, round_number)'
+        )
+        self._conn.execute('CREATE UNIQUE INDEX idx_history_round ON game_history (room_id, round_number)')
+        self._conn.execute('COMMIT')
+
+    def exists(self) -> bool:
+        return not self._is_new or bool(self.legacy_file and self.legacy_file.exists())
+
+    def _begin(self):
+        if not self._in_transaction:
+            self._conn.execute('BEGIN')
+            self._in_transaction = True
+
+    def _rollback(self):
+        if self._in_transaction:
+            try:
+                self._conn.execute('ROLLBACK')
+            except sqlite3.OperationalError:
+                pass  # SQLite đã tự rollback (vd. đĩa đầy)
+            self._in_transaction = False
+
+    @contextmanager
+    def _writing(self):
+        """Thay đổi nằm trong transaction của lô đang ghi. Lỗi ở bất kỳ bước nào thì ROLLBACK cả lô:
+        lô lỗi được thử lại từ đầu, các dòng đã ghi dở không được để lại cho lần COMMIT sau"""
+        with self._lock:
+            self._begin()
+            try:
+                yield
+            except BaseException:
+                self._rollback()
+                raise
+
+    def _room_dict_from_row(self, room_id: str, data: str) -> dict:
+        room_dict = json.loads(data)
+        room_dict['scores'] = dict(self._conn.execute(
+            'SELECT player, score FROM scores WHERE room_id = ?', (room_id,)
+        ).fetchall())
+        room_dict['game_history'] = list(reversed(self._query_history(room_id, self.history_limit)))
+        return room_dict
+
+    def _query_history(self, room_id: str, limit: int) -> List[dict]:
+        rows = self._conn.execute(
+            'SELECT round_number, number, winner, total_guesses, duration FROM game_history '
+            'WHERE room_id = ? ORDER BY id DESC LIMIT ?', (room_id, limit)
+        ).fetchall()
+        return [dict(zip(self.HISTORY_FIELDS, row)) for row in rows]
+
+    def load_all(self) -> Tuple[Dict[str, dict], int]:
+        with self._lock:
+            if self._is_new and self.legacy_file and self.legacy_file.exists():
+                logger.info(f"New SQLite database, migrating from {self.legacy_file.name}")
+                self.migrated = True
+                return JsonFileStorage(self.legacy_file).load_all()
+
+            rooms_data = {}
+            for room_id, data in self._conn.execute('SELECT id, data FROM rooms').fetchall():
+                rooms_data[room_id] = self._room_dict_from_row(room_id, data)
+            return rooms_data, self._journal_seq()
+
+    def _journal_seq(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'journal_seq'").fetchone()
+        return int(row[0]) if row else 0
+
+    def load_index(self) -> Optional[Tuple[Dict[str, dict], int]]:
+        """Chỉ đọc bảng rooms (không đọc điểm số và lịch sử)"""
+        with self._lock:
+            if self._is_new:
+                return None
+            index = {}
+            for room_id, data in self._conn.execute('SELECT id, data FROM rooms').fetchall():
+                index[room_id] = room_summary(json.loads(data))
+            return index, self._journal_seq()
+
+    def load_room(self, room_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM rooms WHERE id = ?', (room_id,)).fetchone()
+            return self._room_dict_from_row(room_id, row[0]) if row else None
+
+    def load_history(self, room_id: str, limit: int = 10) -> List[dict]:
+        with self._lock:
+            return self._query_history(room_id, limit)
+
+    def top_scores(self, room_id: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Bảng xếp hạng của phòng, dùng index (room_id, score DESC)"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT player, score FROM scores WHERE room_id = ? ORDER BY score DESC LIMIT ?',
+                (room_id, limit)
+            ).fetchall()
+
+    def load_global_scores(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute('SELECT player, score FROM global_scores').fetchall())
+
+    def upsert_global_scores(self, scores: Dict[str, int]):
+        with self._writing():
+            self._conn.executemany(
+                'INSERT INTO global_scores (player, score) VALUES (?, ?) '
+                'ON CONFLICT(player) DO UPDATE SET score = excluded.score',
+                list(scores.items())
+            )
+
+    def upsert_room(self, room_id: str, room_dict: dict):
+        data = {k: v for k, v in room_dict.items() if k not in ('scores', 'game_history')}
+        scores = room_dict.get('scores', {})
+        with self._writing():
+            self._conn.execute(
+                'INSERT INTO rooms (id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+                (room_id, json.dumps(data, ensure_ascii=False), time.time())
+            )
+            if scores:
+                self._conn.executemany(
+                    'INSERT INTO scores (room_id, player, score) VALUES (?, ?, ?) '
+                    'ON CONFLICT(room_id, player) DO UPDATE SET score = excluded.score',
+                    [(room_id, player, score) for player, score in scores.items()]
+                )
+            else:
+                self._conn.execute('DELETE FROM scores WHERE room_id = ?', (room_id,))
+            if not room_dict.get('game_history'):
+                # Phòng đã reset: lịch sử bị xóa cùng điểm số
+                self._conn.execute('DELETE FROM game_history WHERE room_id = ?', (room_id,))
+            elif self.migrated:
+                self._migrate_history(room_id, room_dict['game_history'])
+
+    def _migrate_history(self, room_id: str, entries: List[dict]):
+        """Lần ghi đầu sau khi chuyển từ file JSON: đưa game_history cũ vào bảng"""
+        has_rows = self._conn.execute(
+            'SELECT 1 FROM game_history WHERE room_id = ? LIMIT 1', (room_id,)
+        ).fetchone()
+        if not has_rows:
+            for entry in entries:
+                self._insert_history(room_id, entry)
+
+    def _insert_history(self, room_id: str, entry: dict):
+        # Ghi lại cùng vòng (lô được thử lại, hoặc phòng reset rồi chơi lại vòng đó) thì cập nhật dòng cũ
+        self._conn.execute(
+            'INSERT INTO game_history (room_id, round_number, number, winner, total_guesses, duration, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(room_id, round_number) DO UPDATE SET number = excluded.number, winner = excluded.winner, '
+            'total_guesses = excluded.total_guesses, duration = excluded.duration, created_at = excluded.created_at',
+            (room_id,) + tuple(entry.get(field) for field in self.HISTORY_FIELDS) + (time.time(),)
+        )
+
+    def delete_room(self, room_id: str):
+        with self._writing():
+            self._conn.execute('DELETE FROM rooms WHERE id = ?', (room_id,))
+            self._conn.execute('DELETE FROM scores WHERE room_id = ?', (room_id,))
+            self._conn.execute('DELETE FROM game_history WHERE room_id = ?', (room_id,))
+
+    def append_history(self, room_id: str, entry: dict):
+        with self._writing():
+            self._insert_history(room_id, entry)
+
+    def clear_history(self, room_id: str):
+        with self._writing():
+            self._conn.execute('DELETE FROM game_history WHERE room_id = ?', (room_id,))
+
+    def commit(self, journal_seq: int = 0):
+        with self._writing():
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('journal_seq', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (str(journal_seq),)
+            )
+            self._conn.execute('COMMIT')
+            self._in_transaction = False
+            self._is_new = False
+            self.migrated = False
+
+    def rollback(self):
+        with self._lock:
+            self._rollback()
+
+    def close(self):
+        with self._lock:
+            self._rollback()
+            self._conn.close()
+
+
+def create_storage_backend(kind: str, persistence_file: Path, load_workers: int = 8,
+                           snapshot_format: str = 'json') -> StorageBackend:
+    """Tạo backend theo cấu hình: 'json', 'sharded' hoặc 'sqlite'"""
+    persistence_file = Path(persistence_file)
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+    if kind == 'json':
+        return JsonFileStorage(persistence_file, snapshot_format=snapshot_format)
+    if kind == 'sharded':
+        # game_data_rooms/<room_id>.json + manifest.json, đọc được game_data.json cũ khi chuyển đổi
+        return ShardedJsonStorage(
+            persistence_file.parent / f"{persistence_file.stem}_rooms",
+            legacy_file=persistence_file,
+            load_workers=load_workers,
+            snapshot_format=snapshot_format
+        )
+    if kind == 'sqlite':
+        return SQLiteStorage(persistence_file.with_suffix('.sqlite3'), legacy_file=persistence_file)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def convert_snapshot(path: Path, snapshot_format: str) -> Tuple[int, int, int]:
+    """Chuyển snapshot (file game_data hoặc thư mục shard) sang định dạng khác.
+    Trả về (số phòng, tổng byte trước, tổng byte sau)."""
+    path = Path(path)
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+
+    if path.is_dir():
+        storage = ShardedJsonStorage(path, snapshot_format=snapshot_format)
+        if not storage.manifest_path.exists():
+            raise FileNotFoundError(f"No manifest.json in {path}")
+        before = sum((path / name).stat().st_size for name in
+                     json.loads(storage.manifest_path.read_text(encoding='utf-8'))['rooms'].values())
+        rooms_data, journal_seq = storage.load_all()
+        storage.write(rooms_data, [], journal_seq, storage.load_global_scores())
+        after = sum((path / name).stat().st_size for name in storage._manifest.values())
+        return len(rooms_data), before, after
+
+    before = path.stat().st_size
+    storage = JsonFileStorage(path, snapshot_format=snapshot_format)
+    rooms_data, journal_seq = storage.load_all()
+    storage.commit(journal_seq)
+    return len(rooms_data), before, path.stat().st_size
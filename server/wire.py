@@ -0,0 +1,89 @@
+"""
+Định dạng payload Socket.IO thỏa thuận theo từng kết nối
+Client gửi auth {'wire': 'msgpack'} khi kết nối; server ghi nhận và gửi payload của các sự kiện
+tới client đó dưới dạng msgpack (attachment nhị phân của Socket.IO) thay vì JSON text.
+Client cũ không gửi gì vẫn nhận JSON như trước.
+
+Phát cho một phòng: JSON tới phòng (bỏ qua các client nhị phân) + một emit msgpack tới nhóm
+wire:<room_id> của các client nhị phân. Phòng không có client nhị phân chỉ tốn một emit như cũ.
+"""
+
+import threading
+from typing import Dict, Optional, Set
+
+from codec import pack
+
+WIRE_JSON = 'json'
+WIRE_MSGPACK = 'msgpack'
+WIRE_FORMATS = (WIRE_JSON, WIRE_MSGPACK)
+
+
+def wire_group(to: Optional[str]) -> str:
+    """Socket.IO room chứa các client nhị phân của `to` (to=None: mọi client)"""
+    return f"wire:{to}" if to is not None else 'wire:*'
+
+
+class WireClients:
+    """sid -> định dạng đã thỏa thuận, và các client nhị phân trong từng Socket.IO room"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._formats: Dict[str, str] = {}
+        self._groups: Dict[Optional[str], Set[str]] = {}
+        self.stats = {
+            'negotiated': 0,
+            'packed_emits': 0,
+            'packed_bytes': 0
+        }
+
+    def negotiate(self, sid: str, auth) -> str:
+        """Chọn định dạng cho client vừa kết nối theo auth {'wire': ...}"""
+        requested = auth.get('wire') if isinstance(auth, dict) else None
+        if requested != WIRE_MSGPACK:
+            return WIRE_JSON
+        with self._lock:
+            self._formats[sid] = requested
+            self._groups.setdefault(None, set()).add(sid)
+            self.stats['negotiated'] += 1
+        return requested
+
+    def __len__(self) -> int:
+        return len(self._formats)
+
+    def is_binary(self, sid: str) -> bool:
+        return sid in self._formats
+
+    def enter(self, sid: str, room: str) -> bool:
+        """Ghi nhận client vào room; True nếu client nhị phân (cần vào nhóm wire của room)"""
+        if sid not in self._formats:
+            return False
+        with self._lock:
+            self._groups.setdefault(room, set()).add(sid)
+        return True
+
+    def forget(self, sid: str):
+        with self._lock:
+            if self._formats.pop(sid, None) is None:
+                return
+            for room in [room for room, sids in self._groups.items() if sid in sids]:
+                self._groups[room].discard(sid)
+                if not self._groups[room]:
+                    del self._groups[room]
+
+    def members(self, to: Optional[str]) -> Set[str]:
+        """Các client nhị phân sẽ nhận một emit tới `to` (room, sid, hoặc None = mọi client)"""
+        if to in self._formats:
+            return {to}
+        if not self._groups:
+            return set()
+        with self._lock:
+            return set(self._groups.get(to, ()))
+
+    def encode(self, data) -> bytes:
+        payload = pack(data)
+        self.stats['packed_emits'] += 1
+        self.stats['packed_bytes'] += len(payload)
+        return payload
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, clients=len(self))
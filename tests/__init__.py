@@ -1 +1,5 @@
 # Tests package for Guess Number Game Server
+import os
+
+# Tests chạy hoàn toàn trong bộ nhớ, không đọc/ghi server/game_data.json
+os.environ.setdefault('GAME_PERSISTENCE', '0')
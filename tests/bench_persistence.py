@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmark lớp lưu trữ: chi phí ghi/đọc theo số phòng, số người chơi và độ sâu lịch sử
+Chạy: python tests/bench_persistence.py [--rooms 1,100,1000] [--json results.json]
+hoặc: python tests/run_all.py --bench
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from unittest.mock import patch
+
+# Không đụng tới game_data.json thật khi import server
+os.environ.setdefault('GAME_PERSISTENCE', '0')
+
+# Thêm server directory vào path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from server import GameManager, GAME_CONFIG, Player
+
+# (tên, STORAGE_BACKEND, SNAPSHOT_FORMAT)
+FORMATS = [
+    ('json', 'json', 'json'),
+    ('json-binary', 'json', 'binary'),
+    ('sharded', 'sharded', 'json'),
+    ('sharded-binary', 'sharded', 'binary'),
+    ('sqlite', 'sqlite', 'json'),
+]
+
+
+def build_state(game_manager, rooms, players, history_depth):
+    """Tạo trạng thái giả lập: phòng đầy người chơi và lịch sử đầy đủ"""
+    current_time = time.time()
+    for i in range(rooms):
+        room = game_manager.create_room(f"bench_{i}", f"Bench Room {i}", max_players=max(players, 1))
+        for j in range(players):
+            name = f"Player{j}"
+            sid = f"sid_{i}_{j}"
+            room.players[sid] = Player(name=name, sid=sid, joined_at=current_time, last_guess_at=0, score=j * 25)
+            room.scores[name] = j * 25
+        for r in range(history_depth):
+            room.game_history.append({
+                'round_number': r + 1,
+                'number': 42,
+                'winner': f"Player{r % max(players, 1)}",
+                'total_guesses': 7,
+                'duration': 12.5
+            })
+        room.round_number = history_depth + 1
+    # Trạng thái trên được gán thẳng (nhanh hơn nhiều so với đi qua join_room/make_guess),
+    # nên bản chụp create_room để lại trong _captured đã cũ: bỏ đi để snapshot chụp lại phòng hiện tại
+    with game_manager._snapshot_lock:
+        game_manager._captured.clear()
+
+
+def dir_size(path, exclude=()):
+    """Tổng kích thước file trong thư mục, bỏ qua các file trong exclude (vd. journal)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if file_path not in exclude:
+                total += os.path.getsize(file_path)
+    return total
+
+
+def write_snapshot(game_manager, room_ids):
+    """Ghi lại room_ids như một lần compaction (journal được gộp vào snapshot), trả về thời gian (ms)"""
+    with game_manager._snapshot_lock:
+        game_manager._snapshot_dirty |= set(room_ids)
+    start = time.perf_counter()
+    journal = game_manager.journal
+    # Snapshot ghi với journal_seq = 0 thì lần load sau replay lại mọi room_created và dựng mọi phòng
+    journal_seq = journal.rotate() if journal else 0
+    batch = game_manager._write_snapshot(journal_seq=journal_seq)
+    if not batch.wait():
+        raise RuntimeError(f"Snapshot write failed: {batch.error}")
+    if journal:
+        journal.discard_rotated()
+    return (time.perf_counter() - start) * 1000
+
+
+def write_all(game_manager):
+    """Ghi toàn bộ phòng (như lần snapshot đầu tiên), trả về thời gian (ms)"""
+    return write_snapshot(game_manager, game_manager.rooms)
+
+
+def write_incremental(game_manager, fraction=0.01):
+    """Ghi lại một phần nhỏ phòng (trường hợp thường gặp khi server đang chạy)"""
+    return write_snapshot(game_manager, list(game_manager.rooms)[:max(1, int(len(game_manager.rooms) * fraction))])
+
+
+def measure_load(data_file, lazy):
+    """Khởi động GameManager mới từ dữ liệu đã ghi: thời gian (ms), bộ nhớ đỉnh (KB),
+    số phòng, số phòng đã dựng và số người chơi có điểm trong các phòng đã dựng"""
+    with patch.dict(GAME_CONFIG, {'LAZY_HYDRATION': lazy}):
+        tracemalloc.start()
+        start = time.perf_counter()
+        game_manager = GameManager(persistence_file=data_file)
+        elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    loaded = game_manager.room_count()
+    hydrated = len(game_manager.rooms)
+    scored_players = sum(len(room.scores) for room in game_manager.rooms.values())
+    game_manager.saver.stop()
+    game_manager.snapshot_writer.stop()
+    if game_manager.storage:
+        game_manager.storage.close()
+    return elapsed, peak / 1024, loaded, hydrated, scored_players
+
+
+def run_case(format_name, backend, snapshot_format, rooms, players, history_depth):
+    tmp_dir = tempfile.mkdtemp(prefix='bench_persist_')
+    data_file = Path(tmp_dir) / 'game_data.json'
+    config = {
+        'STORAGE_BACKEND': backend,
+        'SNAPSHOT_FORMAT': snapshot_format,
+        'PERSIST_INTERVAL': 3600,   # chỉ ghi khi benchmark yêu cầu
+        'MAX_ROOMS': rooms + 10
+    }
+    try:
+        with patch.dict(GAME_CONFIG, config):
+            game_manager = GameManager(persistence_file=data_file)
+            build_state(game_manager, rooms, players, history_depth)
+            full_ms = write_all(game_manager)
+            incremental_ms = write_incremental(game_manager)
+            game_manager.saver.stop()
+            game_manager.snapshot_writer.stop()
+            game_manager.storage.close()
+
+            # Chỉ tính dữ liệu snapshot; journal đã được gộp và không thuộc định dạng đang so sánh
+            journal = game_manager.journal
+            size = dir_size(tmp_dir, exclude={str(journal.path), str(journal.rotated_path)} if journal else ())
+            eager_ms, eager_peak_kb, loaded, _, scored_players = measure_load(data_file, lazy=False)
+            lazy_ms, lazy_peak_kb, lazy_loaded, lazy_hydrated, _ = measure_load(data_file, lazy=True)
+
+        if loaded != rooms or lazy_loaded != rooms:
+            raise RuntimeError(f"{format_name}: loaded {loaded} (lazy {lazy_loaded}) of {rooms} rooms")
+        if scored_players != rooms * players:
+            raise RuntimeError(f"{format_name}: loaded {scored_players} of {rooms * players} player scores")
+        if backend != 'json' and lazy_hydrated:
+            # Backend có index: không có journal để replay thì không phòng nào phải dựng lúc khởi động
+            raise RuntimeError(f"{format_name}: lazy load hydrated {lazy_hydrated} rooms")
+        return {
+            'format': format_name,
+            'rooms': rooms,
+            'players': players,
+            'history_depth': history_depth,
+            'write_full_ms': round(full_ms, 2),
+            'write_incremental_ms': round(incremental_ms, 2),
+            'load_eager_ms': round(eager_ms, 2),
+            'load_lazy_ms': round(lazy_ms, 2),
+            'size_bytes': size,
+            'peak_load_kb': round(eager_peak_kb, 1),
+            'peak_lazy_load_kb': round(lazy_peak_kb, 1)
+        }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark persistence của Guess Number Game Server')
+    parser.add_argument('--rooms', type=parse_int_list, default=[1, 100, 1000],
+                        help='Số phòng, phân tách bằng dấu phẩy (default: 1,100,1000)')
+    parser.add_argument('--players', type=parse_int_list, default=[0, 20],
+                        help='Số người chơi mỗi phòng (default: 0,20)')
+    parser.add_argument('--history', type=int, default=10,
+                        help='Số vòng trong game_history mỗi phòng (default: 10)')
+    parser.add_argument('--formats', default=','.join(name for name, _, _ in FORMATS),
+                        help='Các định dạng cần đo (default: tất cả)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='Ghi kết quả dạng JSON ra file ("-" = stdout)')
+    args = parser.parse_args(argv)
+
+    selected = [fmt for fmt in FORMATS if fmt[0] in args.formats.split(',')]
+    results = []
+
+    # Log INFO của server (mỗi phòng một dòng) làm sai lệch thời gian đo
+    logging.disable(logging.INFO)
+
+    header = (f"{'format':<15}{'rooms':>7}{'players':>8}{'write ms':>10}{'incr ms':>9}"
+              f"{'load ms':>10}{'lazy ms':>9}{'size KB':>10}{'peak KB':>10}")
+    if args.json != '-':
+        print("📊 Persistence benchmark")
+        print(header)
+        print("-" * len(header))
+
+    for rooms in args.rooms:
+        for players in args.players:
+            for format_name, backend, snapshot_format in selected:
+                result = run_case(format_name, backend, snapshot_format, rooms, players, args.history)
+                results.append(result)
+                if args.json != '-':
+                    print(f"{format_name:<15}{rooms:>7}{players:>8}"
+                          f"{result['write_full_ms']:>10.1f}{result['write_incremental_ms']:>9.1f}"
+                          f"{result['load_eager_ms']:>10.1f}{result['load_lazy_ms']:>9.1f}"
+                          f"{result['size_bytes'] / 1024:>10.1f}{result['peak_load_kb']:>10.1f}")
+
+    report = {
+        'benchmark': 'persistence',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'history_depth': args.history,
+        'results': results
+    }
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark định dạng payload Socket.IO: CPU mã hóa mỗi emit và số byte trên đường truyền, JSON so với msgpack
+Số byte tính trên các frame Socket.IO thật (packet text + attachment nhị phân), chưa gồm header WebSocket.
+Chạy: python tests/bench_wire.py [--players 8,50] [--iterations 2000] [--json results.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+# Không đụng tới game_data.json thật khi import server
+os.environ.setdefault('GAME_PERSISTENCE', '0')
+
+# Thêm server directory vào path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from socketio import packet
+
+import codec
+from server import GameManager, GAME_CONFIG
+from wire import WireClients, WIRE_FORMATS
+from bench_persistence import git_revision, parse_int_list
+
+
+def build_payloads(players):
+    """Các payload hay gặp nhất, lấy từ một phòng giả lập có `players` người chơi"""
+    tmp_dir = tempfile.mkdtemp(prefix='bench_wire_')
+    with patch('server.socketio.emit'), patch.dict(GAME_CONFIG, {'RATE_LIMIT_MS': 0}):
+        game_manager = GameManager(persistence_file=Path(tmp_dir) / 'game_data.json')
+        room = game_manager.create_room('bench_wire', 'Phòng đo định dạng', max_players=max(players, 1))
+        for i in range(players):
+            game_manager.join_room(room.id, f'Người chơi {i}', f'sid_{i}')
+        sid = next(iter(room.players))
+        _, message, wrong = game_manager.make_guess(room.id, sid, room.current_round.range_low)
+        _, _, correct = game_manager.make_guess(room.id, sid, room.current_round.number)
+        change = game_manager.find_change(room, 'scores', room.players[sid].name)
+        room_info = game_manager._room_info(room, sid)
+        game_manager.shutdown()
+
+    chat = [['chat_message', {'room_id': room.id, 'player_name': f'Người chơi {i}',
+                              'message': 'Số này lớn quá, thử nhỏ hơn đi!', 'timestamp': time.time(),
+                              'type': 'chat'}] for i in range(5)]
+    return {
+        'guess_result': {'message': message, 'details': wrong},
+        'guess_correct': {'message': message, 'details': correct},
+        'scoreboard_updated': dict({'room_id': room.id,
+                                    'scores': room.scores.as_dict(GAME_CONFIG['LEADERBOARD_SIZE']),
+                                    'ranked_players': len(room.scores)},
+                                   **GameManager.state_fields(room, change)),
+        'room_batch': {'room_id': room.id, 'events': chat},
+        'room_info': room_info
+    }
+
+
+def encode_packets(wire, event, data):
+    """Mã hóa một emit như python-socketio: trả về danh sách frame (str/bytes)"""
+    if wire == 'msgpack':
+        data = WireClients().encode(data)
+    encoded = packet.Packet(packet.EVENT, data=[event, data], namespace='/').encode()
+    return encoded if isinstance(encoded, list) else [encoded]
+
+
+def frame_bytes(frames):
+    return sum(len(frame.encode('utf-8')) if isinstance(frame, str) else len(frame) for frame in frames)
+
+
+def run_case(wire, event, data, iterations):
+    frames = encode_packets(wire, event, data)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode_packets(wire, event, data)
+    elapsed = time.perf_counter() - start
+    return {
+        'wire': wire,
+        'event': event,
+        'encode_us': elapsed / iterations * 1e6,
+        'bytes': frame_bytes(frames),
+        'frames': len(frames)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark định dạng payload Socket.IO')
+    parser.add_argument('--players', type=parse_int_list, default=[8, 50],
+                        help='Số người chơi trong phòng, phân tách bằng dấu phẩy (default: 8,50)')
+    parser.add_argument('--iterations', type=int, default=2000,
+                        help='Số lần mã hóa mỗi payload (default: 2000)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='Ghi kết quả dạng JSON ra file ("-" = stdout)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    results = []
+
+    header = f"{'event':<20}{'players':>8}{'wire':>9}{'encode us':>11}{'bytes':>8}{'frames':>8}"
+    if args.json != '-':
+        print(f"📊 Wire format benchmark (msgpack backend: {'C' if codec.msgpack else 'pure Python'})")
+        print(header)
+        print("-" * len(header))
+
+    for players in args.players:
+        for event, data in build_payloads(players).items():
+            for wire in WIRE_FORMATS:
+                result = dict(run_case(wire, event, data, args.iterations), players=players)
+                results.append(result)
+                if args.json != '-':
+                    print(f"{event:<20}{players:>8}{wire:>9}{result['encode_us']:>11.1f}"
+                          f"{result['bytes']:>8}{result['frames']:>8}")
+
+    report = {
+        'benchmark': 'wire',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'msgpack_backend': 'c' if codec.msgpack else 'python',
+        'timestamp': time.time(),
+        'iterations': args.iterations,
+        'results': results
+    }
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
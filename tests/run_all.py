@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """
 Test runner đơn giản và ổn định cho tất cả tests
+Dùng --bench để chạy benchmark persistence thay cho tests (các tham số còn lại
+được chuyển cho bench_persistence.py, vd. --bench --rooms 1,1000 --json results.json)
 """
 
+import argparse
 import os
 import sys
 import unittest
@@ -99,6 +102,17 @@ def main():
     
     return result.wasSuccessful()
 
+def run_bench(bench_args):
+    """Chạy benchmark persistence"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bench_persistence
+    bench_persistence.main(bench_args)
+    return True
+
 if __name__ == '__main__':
-    success = main()
+    parser = argparse.ArgumentParser(description='Chạy tests hoặc benchmark')
+    parser.add_argument('--bench', action='store_true', help='Chạy benchmark persistence')
+    args, remaining = parser.parse_known_args()
+
+    success = run_bench(remaining) if args.bench else main()
     sys.exit(0 if success else 1)
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import unittest
+from unittest.mock import AsyncMock
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import server
+from server import game_manager
+from async_server import AsyncGameServer
+
+
+async def drain():
+    """Cho event loop chạy các emit đã được xếp hàng từ executor"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def http_get(app, path, headers=None):
+    """Gửi một request GET qua ASGI app, trả về (status, headers, body)"""
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+
+class TestAsyncServer(unittest.TestCase):
+    """Chế độ asyncio dùng lại handler của server.py qua AsyncTransport"""
+
+    def setUp(self):
+        game_manager.rooms.clear()
+        game_manager.player_rooms.clear()
+        self.game_server = AsyncGameServer()
+        self.game_server.sio.emit = AsyncMock()
+        self.game_server.sio.enter_room = AsyncMock()
+
+    def tearDown(self):
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+
+    def run_async(self, coro_func):
+        async def wrapper():
+            self.game_server.start()
+            try:
+                await coro_func()
+                await drain()
+            finally:
+                self.game_server.stop()
+        asyncio.run(wrapper())
+        self.assertIsInstance(server.transport, server.SocketTransport)
+
+    def emitted(self, event):
+        return [c for c in self.game_server.sio.emit.call_args_list if c.args[0] == event]
+
+    def test_join_and_guess_use_shared_handlers(self):
+        room = game_manager.create_room('test_async', 'Async Room', 10)
+
+        async def scenario():
+            await self.game_server.dispatch('on_join_room', 'sid_a',
+                                            {'room_id': 'test_async', 'player_name': 'Alice'})
+            await self.game_server.dispatch('on_make_guess', 'sid_a',
+                                            {'room_id': 'test_async', 'guess': room.current_round.number})
+
+        self.run_async(scenario)
+
+        self.game_server.sio.enter_room.assert_called_once_with('sid_a', 'test_async')
+        joined = self.emitted('room_joined')
+        self.assertEqual(len(joined), 1)
+        self.assertEqual(joined[0].kwargs['to'], 'sid_a')
+        self.assertEqual(self.emitted('player_joined')[0].kwargs['to'], 'test_async')
+        self.assertTrue(self.emitted('guess_result')[0].args[1]['details']['correct'])
+        self.assertEqual(self.emitted('scoreboard_updated')[0].kwargs['to'], 'test_async')
+        self.assertEqual(game_manager.player_rooms.get('sid_a'), 'test_async')
+
+    def test_broadcast_from_background_thread(self):
+        game_manager.create_room('test_async_bg', 'Async Room', 10)
+
+        async def scenario():
+            # Như round scheduler: broadcast từ một thread không thuộc event loop
+            worker = threading.Thread(target=server.transport.broadcast,
+                                      args=('new_round', {'room_id': 'test_async_bg'}, 'test_async_bg'))
+            worker.start()
+            worker.join()
+
+        self.run_async(scenario)
+        self.assertEqual(len(self.emitted('new_round')), 1)
+
+    def test_rest_rooms_etag(self):
+        game_manager.create_room('test_async_rest', 'Async Room', 10)
+
+        async def scenario():
+            status, headers, body = await http_get(self.game_server.app, '/api/rooms')
+            self.assertEqual(status, 200)
+            self.assertIn('test_async_rest', [r['id'] for r in json.loads(body)['rooms']])
+
+            status, _, body = await http_get(self.game_server.app, '/api/rooms',
+                                             {'If-None-Match': headers['etag']})
+            self.assertEqual(status, 304)
+            self.assertEqual(body, b'')
+
+            status, _, _ = await http_get(self.game_server.app, '/api/rooms/missing_room')
+            self.assertEqual(status, 404)
+
+        self.run_async(scenario)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import server
+from server import app, game_manager
+from backpressure import SlowConsumers
+
+
+class TestSlowConsumers(unittest.TestCase):
+    def setUp(self):
+        self.depths = {}
+        self.recovered = []
+        self.disconnected = []
+        self.room_of = {'sid_a': 'room_1', 'sid_b': 'room_1', 'sid_c': 'room_2'}
+        self.monitor = SlowConsumers(lambda: dict(self.depths), self.room_of.get,
+                                     lambda sid, room_id: self.recovered.append((sid, room_id)),
+                                     self.disconnected.append,
+                                     lag_threshold=10, disconnect_threshold=100)
+
+    def test_lag_recover_and_disconnect(self):
+        self.depths.update({'sid_a': 12, 'sid_b': 0, 'sid_c': 150})
+        self.monitor.check()
+        self.assertEqual(self.monitor.lagging, {'sid_a': 'room_1'})
+        self.assertEqual(self.disconnected, ['sid_c'])
+
+        # Chỉ sự kiện mang trạng thái mới bị bỏ, và chỉ cho client chậm của phòng đó
+        self.assertEqual(self.monitor.shed('scoreboard_updated', 'room_1'), {'sid_a'})
+        self.assertEqual(self.monitor.shed('room_batch', None), {'sid_a'})
+        self.assertEqual(self.monitor.shed('new_round', 'room_1'), set())
+        self.assertEqual(self.monitor.shed('chat_message', 'room_2'), set())
+        # Chat không có trong snapshot: không bao giờ bị bỏ, kể cả trong room_batch
+        self.assertEqual(self.monitor.shed('chat_message', 'room_1'), set())
+        state_batch = {'events': [['presence', {}], ['scoreboard_updated', {}]]}
+        self.assertEqual(self.monitor.shed('room_batch', 'room_1', state_batch), {'sid_a'})
+        chat_batch = {'events': [['scoreboard_updated', {}], ['chat_message', {'message': 'hi'}]]}
+        self.assertEqual(self.monitor.shed('room_batch', 'room_1', chat_batch), set())
+
+        stats = self.monitor.get_stats()
+        self.assertEqual(stats['rooms']['room_1'], {'clients': 2, 'queued': 12, 'max_depth': 12, 'lagging': 1})
+        self.assertEqual(list(stats['rooms']), ['room_2', 'room_1'])  # phòng nhiều packet chờ nhất trước
+        self.assertEqual(stats['dropped_events'], 3)
+
+        # Chưa rút xuống nửa ngưỡng thì vẫn chậm; rút xong thì nhận snapshot
+        self.depths.update({'sid_a': 7})
+        del self.depths['sid_c']
+        self.monitor.check()
+        self.assertIn('sid_a', self.monitor.lagging)
+        self.depths['sid_a'] = 2
+        self.monitor.check()
+        self.assertEqual(self.monitor.lagging, {})
+        self.assertEqual(self.recovered, [('sid_a', 'room_1')])
+        self.assertEqual(self.monitor.stats['snapshots'], 1)
+
+    def test_drop_policy_sends_no_snapshot(self):
+        self.monitor.policy = 'drop'
+        self.depths['sid_a'] = 20
+        self.monitor.check()
+        self.depths['sid_a'] = 0
+        self.monitor.check()
+        self.assertEqual(self.recovered, [])
+        self.assertEqual(self.monitor.stats['recovered'], 1)
+
+    def test_disconnected_client_is_forgotten(self):
+        self.depths['sid_a'] = 20
+        self.monitor.check()
+        self.depths.clear()
+        self.monitor.check()
+        self.assertEqual(self.monitor.lagging, {})
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            SlowConsumers(dict, dict().get, print, print, policy='ignore')
+
+
+class TestSlowConsumerBroadcasts(unittest.TestCase):
+    """Client chậm trong phòng bị bỏ qua ở các broadcast gom được, được gửi snapshot khi bắt kịp"""
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.request_context = app.test_request_context()
+        self.request_context.push()
+        game_manager.rooms.clear()
+        game_manager.player_rooms.clear()
+        self.depths = {}
+        self.monitor = SlowConsumers(lambda: dict(self.depths), game_manager.player_rooms.get,
+                                     server.send_room_snapshot, lambda sid: None, lag_threshold=10)
+        self.monitor_patch = patch('server.slow_consumers', self.monitor)
+        self.monitor_patch.start()
+
+    def tearDown(self):
+        self.monitor_patch.stop()
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+        self.request_context.pop()
+        self.app_context.pop()
+
+    @patch('server.socketio.emit')
+    def test_lagging_client_skipped_then_resynced(self, mock_socketio_emit):
+        game_manager.create_room('test_slow', 'Slow Room')
+        game_manager.join_room('test_slow', 'Alice', 'sid_fast')
+        game_manager.join_room('test_slow', 'Bob', 'sid_slow')
+        self.depths.update({'sid_fast': 0, 'sid_slow': 50})
+        self.monitor.check()
+        mock_socketio_emit.reset_mock()
+
+        server.broadcast_to_room('player_left', {'room_id': 'test_slow', 'player_name': 'Carol'}, 'test_slow')
+        server.broadcast_to_room('chat_message', {'room_id': 'test_slow', 'message': 'hi'}, 'test_slow')
+        server.broadcast_to_room('new_round', {'room_id': 'test_slow'}, 'test_slow')
+        left, chat, new_round = mock_socketio_emit.call_args_list
+        self.assertEqual(left.kwargs, {'to': 'test_slow', 'skip_sid': ['sid_slow']})
+        self.assertEqual(chat.kwargs, {'to': 'test_slow'})
+        self.assertEqual(new_round.kwargs, {'to': 'test_slow'})
+
+        mock_socketio_emit.reset_mock()
+        self.depths['sid_slow'] = 0
+        self.monitor.check()
+        snapshot = mock_socketio_emit.call_args
+        self.assertEqual(snapshot.args[0], 'room_info')
+        self.assertEqual(snapshot.kwargs['to'], 'sid_slow')
+        self.assertEqual(snapshot.args[1]['id'], 'test_slow')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from importlib import metadata
+
+import socketio
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from bus import (BroadcastBus, BusManager, LocalBroker, UnixSocketBackend,
+                 encode_command, read_reply)
+from codec import unpack
+from wire import WireClients, wire_group
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class BrokerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='bus_test_')
+        self.path = os.path.join(self.tmp_dir, 'bus.sock')
+        self.broker = LocalBroker(self.path).start()
+
+    def tearDown(self):
+        self.broker.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class TestBroadcastBus(BrokerTestCase):
+    def test_batches_publishes_per_tick_and_keeps_order(self):
+        sender = BroadcastBus(UnixSocketBackend(self.path), tick=0.05)
+        receiver = BroadcastBus(UnixSocketBackend(self.path), tick=0.05)
+        received = []
+
+        def listen():
+            while len(received) < 100:
+                received.extend(receiver.receive())
+
+        # Kết nối bên nhận trước để broker biết cần chuyển frame tới đâu
+        receiver.backend.publish(b'[]')
+        thread = threading.Thread(target=listen, daemon=True)
+        thread.start()
+        self.assertTrue(wait_for(lambda: self.broker.stats['connections'] == 1))
+
+        for i in range(100):
+            sender.publish({'method': 'emit', 'event': 'chat_message', 'data': [i]})
+        thread.join(timeout=5)
+
+        self.assertEqual([m['data'][0] for m in received], list(range(100)))
+        # 100 emit liên tiếp trong một tick đi chung một vài frame
+        self.assertLessEqual(sender.stats['batches'], 3)
+        stats = receiver.get_stats()
+        self.assertEqual(stats['received'], 100)
+        self.assertGreater(stats['latency_ms_max'], 0)
+        self.assertNotIn('ts', received[0])
+        sender.stop()
+
+    def test_bad_message_is_dropped_alone(self):
+        sender = BroadcastBus(UnixSocketBackend(self.path), tick=0.001)
+        receiver = BroadcastBus(UnixSocketBackend(self.path), tick=0.001)
+        received = []
+
+        def listen():
+            while True:
+                received.extend(receiver.receive())
+
+        receiver.backend.publish(b'[]')
+        threading.Thread(target=listen, daemon=True).start()
+        self.assertTrue(wait_for(lambda: self.broker.stats['connections'] == 1))
+
+        sender.publish({'method': 'emit', 'event': 'bad', 'data': object()})
+        sender.publish({'method': 'emit', 'event': 'new_round', 'data': b'\x81\xa1n\x01'})
+        self.assertTrue(wait_for(lambda: len(received) == 1))
+        self.assertEqual(received[0]['event'], 'new_round')
+        self.assertEqual(received[0]['data'], b'\x81\xa1n\x01')
+        self.assertEqual(sender.stats['dropped'], 1)
+
+        # Thread publisher vẫn sống sau message lỗi
+        sender.publish({'method': 'emit', 'event': 'chat_message', 'data': ['hi']})
+        self.assertTrue(wait_for(lambda: len(received) == 2))
+        self.assertEqual(sender.get_stats()['pending'], 0)
+        sender.stop()
+
+    def test_publish_without_broker_drops_batch(self):
+        bus = BroadcastBus(UnixSocketBackend(os.path.join(self.tmp_dir, 'missing.sock')), tick=0)
+        bus.publish({'method': 'emit'})
+        bus.stop()
+        self.assertEqual(bus.stats['dropped'], 1)
+        self.assertEqual(bus.stats['errors'], 1)
+
+
+class TestBusManager(BrokerTestCase):
+    """Hai server Socket.IO như hai worker: emit tới room ở server A tới client của server B"""
+
+    def test_room_emit_reaches_other_server(self):
+        url = f"unix://{self.path}"
+        server_a = socketio.Server(async_mode='threading', client_manager=BusManager(url, tick=0.001))
+        server_b = socketio.Server(async_mode='threading', client_manager=BusManager(url, tick=0.001))
+        sent = []
+        server_b._send_eio_packet = lambda eio_sid, pkt: sent.append((eio_sid, pkt.data))
+
+        sid = server_b.manager.connect('eio_b', '/')
+        server_b.manager.enter_room(sid, '/', 'room_1')
+        server_b.manager.initialize()
+        self.assertTrue(wait_for(lambda: self.broker.stats['connections'] == 1))
+
+        server_a.emit('new_round', {'room_id': 'room_1', 'round_number': 2}, to='room_1')
+        server_a.emit('chat_message', {'room_id': 'room_2'}, to='room_2')
+
+        self.assertTrue(wait_for(lambda: server_b.manager.bus.stats['received'] == 2))
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0][0], 'eio_b')
+        self.assertIn('new_round', sent[0][1])
+        server_a.manager.bus.stop()
+
+    def test_msgpack_payload_reaches_other_server(self):
+        """Payload msgpack của client nhị phân (wire.py) đi qua bus và tới client ở server B nguyên vẹn"""
+        url = f"unix://{self.path}"
+        server_a = socketio.Server(async_mode='threading', client_manager=BusManager(url, tick=0.001))
+        server_b = socketio.Server(async_mode='threading', client_manager=BusManager(url, tick=0.001))
+        sent = []
+        server_b._send_eio_packet = lambda eio_sid, pkt: sent.append(pkt.data)
+        sid = server_b.manager.connect('eio_b', '/')
+        server_b.manager.enter_room(sid, '/', wire_group('room_1'))
+        server_b.manager.initialize()
+        self.assertTrue(wait_for(lambda: self.broker.stats['connections'] == 1))
+
+        payload = WireClients().encode({'room_id': 'room_1', 'message': 'Xin chào'})
+        server_a.emit('chat_message', payload, to=wire_group('room_1'))
+        server_a.manager.bus.publish({'method': 'emit', 'event': 'chat_message', 'data': payload,
+                                      'namespace': '/', 'room': wire_group('room_1')})
+
+        self.assertTrue(wait_for(lambda: len(sent) == 4))
+        self.assertEqual([data for data in sent if isinstance(data, bytes)], [payload, payload])
+        self.assertEqual(unpack(sent[1]), {'room_id': 'room_1', 'message': 'Xin chào'})
+        self.assertEqual(server_a.manager.bus.stats['errors'], 0)
+        server_a.manager.bus.stop()
+
+    def test_room_emit_reaches_local_clients(self):
+        """Worker phát emit cũng gửi cho client của chính nó (broker không gửi frame lại cho người gửi)"""
+        server_a = socketio.Server(async_mode='threading',
+                                   client_manager=BusManager(f"unix://{self.path}", tick=0.001))
+        sent = []
+        server_a._send_eio_packet = lambda eio_sid, pkt: sent.append((eio_sid, pkt.data))
+        sid = server_a.manager.connect('eio_a', '/')
+        server_a.manager.enter_room(sid, '/', 'room_1')
+
+        server_a.emit('new_round', {'room_id': 'room_1', 'round_number': 2}, to='room_1')
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0][0], 'eio_a')
+        self.assertTrue(wait_for(lambda: server_a.manager.bus.stats['batches'] == 1))
+        server_a.manager.bus.stop()
+
+
+class TestPinnedVersions(unittest.TestCase):
+    """BusManager dựa vào PubSubManager tự phát cho client cục bộ: chạy test với đúng bản đã pin"""
+
+    def test_socketio_packages_match_requirements(self):
+        requirements = os.path.join(os.path.dirname(__file__), '..', 'server', 'requirements.txt')
+        with open(requirements, encoding='utf-8') as f:
+            pins = dict(line.strip().split('==') for line in f if '==' in line and not line.startswith('#'))
+        for package in ('python-socketio', 'python-engineio', 'flask-socketio'):
+            self.assertEqual(metadata.version(package), pins[package], package)
+
+
+class TestRedisProtocol(unittest.TestCase):
+    def test_encode_and_read_reply(self):
+        self.assertEqual(encode_command('PUBLISH', 'socketio', b'[1]'),
+                         b'*3\r\n$7\r\nPUBLISH\r\n$8\r\nsocketio\r\n$3\r\n[1]\r\n')
+        reader = io.BytesIO(b'*3\r\n$7\r\nmessage\r\n$8\r\nsocketio\r\n$3\r\n[1]\r\n:2\r\n')
+        self.assertEqual(read_reply(reader), [b'message', b'socketio', b'[1]'])
+        self.assertEqual(read_reply(reader), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from werkzeug.serving import make_server
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import server
+from server import app, game_manager, GameManager, GAME_CONFIG
+from cluster import Cluster, ClusterDirectory, ClusterLeaderboard, HashRing, peer_data_files
+from storage import create_storage_backend
+
+
+def room_owned_by(cluster, worker, prefix='test_room'):
+    """Một room_id mà consistent hash gán cho worker"""
+    for i in range(1000):
+        room_id = f"{prefix}_{i}"
+        if cluster.owner(room_id) == worker:
+            return room_id
+    raise AssertionError(f"No room id for worker {worker}")
+
+
+class TestHashRing(unittest.TestCase):
+    def test_spreads_rooms_and_moves_few_on_resize(self):
+        keys = [f"room_{i}" for i in range(10000)]
+        ring = HashRing(range(4))
+        owners = [ring.node_for(key) for key in keys]
+
+        counts = [owners.count(worker) for worker in range(4)]
+        self.assertTrue(all(1800 < count < 3200 for count in counts), counts)
+
+        # Thêm worker thứ 5: chỉ khoảng 1/5 số phòng đổi chủ, và đều chuyển sang worker mới
+        bigger = HashRing(range(5))
+        moved = [key for key, owner in zip(keys, owners) if bigger.node_for(key) != owner]
+        self.assertLess(len(moved), 3000)
+        self.assertTrue(all(bigger.node_for(key) == 4 for key in moved))
+
+    def test_owner_uses_normalized_room_id(self):
+        cluster = Cluster(0, [5000, 5001, 5002])
+        self.assertEqual(cluster.owner(' Lobby '), cluster.owner('lobby'))
+        self.assertEqual(cluster.route('LOBBY')['room_id'], 'lobby')
+
+
+class TestClusterRouting(unittest.TestCase):
+    """Worker 0 của cụm hai worker: phòng của worker 1 được chuyển hướng"""
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.request_context = app.test_request_context()
+        self.request_context.push()
+        self.client = app.test_client()
+        game_manager.rooms.clear()
+        game_manager.player_rooms.clear()
+        self.cluster = Cluster(0, [5000, 5001])
+        self.cluster_patch = patch('server.cluster', self.cluster)
+        self.cluster_patch.start()
+
+    def tearDown(self):
+        self.cluster_patch.stop()
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+        self.request_context.pop()
+        self.app_context.pop()
+
+    @patch('server.emit')
+    def test_join_remote_room_redirects(self, mock_emit):
+        room_id = room_owned_by(self.cluster, 1)
+        with patch('server.request') as mock_request:
+            mock_request.sid = 'sid_remote'
+            server.on_join_room({'room_id': room_id, 'player_name': 'Alice'})
+
+        mock_emit.assert_called_once_with('room_redirect', {
+            'room_id': room_id, 'worker': 1, 'url': 'http://localhost:5001', 'event': 'join_room'
+        })
+        self.assertNotIn('sid_remote', game_manager.player_rooms)
+
+    def test_rest_routes_follow_owner(self):
+        local_id = room_owned_by(self.cluster, 0)
+        remote_id = room_owned_by(self.cluster, 1)
+        game_manager.create_room(local_id, 'Local Room')
+
+        self.assertEqual(self.client.get(f'/api/rooms/{local_id}').status_code, 200)
+
+        response = self.client.get(f'/api/rooms/{remote_id}/history?limit=5')
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response.headers['Location'], f'http://localhost:5001/api/rooms/{remote_id}/history?limit=5')
+
+        response = self.client.post('/api/rooms', json={'room_id': remote_id, 'room_name': 'Remote'})
+        self.assertEqual(response.status_code, 307)
+        self.assertFalse(game_manager.room_exists(remote_id))
+
+        route = json.loads(self.client.get(f'/api/route?room={remote_id}').data)
+        self.assertEqual(route['worker'], 1)
+
+
+class TestClusterDirectory(unittest.TestCase):
+    """Gộp danh sách phòng qua HTTP thật: worker "khác" là chính app này chạy ở một cổng tạm"""
+
+    def setUp(self):
+        game_manager.rooms.clear()
+        self.http_server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.http_server.shutdown()
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+
+    def test_merges_peer_rooms(self):
+        game_manager.create_room('test_merge', 'Merge Room')
+        cluster = Cluster(0, [1, self.http_server.server_port])
+        directory = ClusterDirectory(game_manager.directory, cluster, refresh_interval=0)
+
+        version, rooms = directory.snapshot()
+        # Phòng của worker này + phòng worker 1 trả về (cùng game_manager nên mỗi phòng hai lần)
+        self.assertEqual([r['id'] for r in rooms].count('test_merge'), 2)
+        self.assertEqual(version, 2 * game_manager.directory.version)
+
+        # Không có gì đổi: worker 1 trả 304 và danh sách giữ nguyên
+        self.assertEqual(directory.snapshot(), (version, rooms))
+
+        game_manager.create_room('test_merge_2', 'Merge Room 2')
+        version_after, body = directory.payload()
+        self.assertGreater(version_after, version)
+        self.assertEqual(json.loads(body)['total'], 4)
+
+
+class TestClusterLeaderboard(unittest.TestCase):
+    """Gộp điểm chung qua HTTP thật như TestClusterDirectory"""
+
+    def setUp(self):
+        self.saved_scores = json.loads(game_manager.global_leaderboard.payload()[1])['scores']
+        self.http_server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.http_server.shutdown()
+        game_manager.global_leaderboard.load(self.saved_scores)
+
+    def test_sums_scores_of_every_worker(self):
+        game_manager.global_leaderboard.load({'Alice': 30, 'Bob': 20})
+        cluster = Cluster(0, [1, self.http_server.server_port])
+        board = ClusterLeaderboard(game_manager.global_leaderboard, cluster, refresh_interval=0)
+
+        # Worker 1 là chính app này nên mỗi người có gấp đôi điểm
+        self.assertEqual([(e['name'], e['score']) for e in board.top(2)], [('Alice', 60), ('Bob', 40)])
+        version = board.version
+
+        # Không có gì đổi: worker 1 trả 304 và bản gộp giữ nguyên
+        self.assertEqual(board.version, version)
+
+        game_manager.global_leaderboard.add('Bob', 25)
+        self.assertEqual(board.player('Bob')['rank'], 1)
+        self.assertEqual(len(board), 2)
+        self.assertGreater(board.version, version)
+
+        response = app.test_client().get('/api/leaderboard/scores')
+        self.assertEqual(json.loads(response.data)['scores'], {'Alice': 30, 'Bob': 45})
+        cached = app.test_client().get('/api/leaderboard/scores', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+
+class TestRebalance(unittest.TestCase):
+    """Đổi từ một lên hai worker: phòng chuyển sang file của worker sở hữu mới"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cluster = Cluster(0, [5000, 5001])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def data_file(self, worker):
+        return Path(self.tmp_dir) / f'game_data.worker{worker}.json'
+
+    def test_peer_data_files(self):
+        GameManager(persistence_file=self.data_file(0)).shutdown()
+        (Path(self.tmp_dir) / 'game_data.worker3_rooms').mkdir()
+        (Path(self.tmp_dir) / 'other.worker5.json').touch()
+        self.assertEqual(peer_data_files(self.data_file(1)), {0: self.data_file(0), 3: self.data_file(3)})
+        self.assertEqual(peer_data_files(Path(self.tmp_dir) / 'game_data.json'), {})
+
+    def test_rooms_move_to_new_owner(self):
+        moving = room_owned_by(self.cluster, 1, 'test_moving')
+        staying = room_owned_by(self.cluster, 0, 'test_staying')
+        single = GameManager(persistence_file=self.data_file(0))
+        for room_id in (moving, staying):
+            room = single.create_room(room_id, room_id)
+            single.join_room(room_id, 'Alice', f'sid_{room_id}')
+            single.make_guess(room_id, f'sid_{room_id}', room.current_round.number)
+        single.shutdown()
+
+        # Worker 1 khởi động trước và nhận phòng của nó từ file của worker 0
+        worker1 = GameManager(persistence_file=self.data_file(1))
+        self.assertEqual(worker1.rebalance(Cluster(1, self.cluster.ports)), (1, 0))
+        self.assertGreater(worker1.find_room_by_id(moving).scores['Alice'], 0)
+
+        # Worker 0 bỏ phòng đó, và xóa khỏi file của mình vì worker 1 đã có bản mới hơn
+        worker0 = GameManager(persistence_file=self.data_file(0))
+        self.assertEqual(worker0.rebalance(self.cluster), (0, 1))
+        self.assertFalse(worker0.room_exists(moving))
+        self.assertTrue(worker0.room_exists(staying))
+        worker0.shutdown()
+        worker1.shutdown()
+
+        rooms_0, _ = create_storage_backend(GAME_CONFIG['STORAGE_BACKEND'], self.data_file(0)).load_all()
+        rooms_1, _ = create_storage_backend(GAME_CONFIG['STORAGE_BACKEND'], self.data_file(1)).load_all()
+        self.assertEqual(set(rooms_0), {staying})
+        self.assertEqual(set(rooms_1), {moving})
+        self.assertGreater(rooms_1[moving]['scores']['Alice'], 0)
+
+    def test_unconfirmed_room_stays_on_disk(self):
+        moving = room_owned_by(self.cluster, 1, 'test_moving')
+        single = GameManager(persistence_file=self.data_file(0))
+        single.create_room(moving, moving)
+        single.shutdown()
+
+        # Worker 1 chưa từng chạy: worker 0 bỏ phòng khỏi bộ nhớ nhưng giữ trong file
+        worker0 = GameManager(persistence_file=self.data_file(0))
+        self.assertEqual(worker0.rebalance(self.cluster), (0, 1))
+        self.assertFalse(worker0.room_exists(moving))
+        worker0.shutdown()
+
+        worker1 = GameManager(persistence_file=self.data_file(1))
+        self.assertEqual(worker1.rebalance(Cluster(1, self.cluster.ports)), (1, 0))
+        self.assertTrue(worker1.room_exists(moving))
+        worker1.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test đồng thời: nhiều thread cùng đoán số, vào/rời phòng và lưu dữ liệu
+"""
+
+import shutil
+import sys
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Thêm server directory vào path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from server import GameManager, GAME_CONFIG
+
+import logging
+logging.getLogger('socketio').setLevel(logging.ERROR)
+logging.getLogger('engineio').setLevel(logging.ERROR)
+
+ROOMS = ('test_stress_a', 'test_stress_b')
+PLAYERS_PER_ROOM = 8
+GUESSES_PER_PLAYER = 150
+
+
+class TestConcurrentGuesses(unittest.TestCase):
+    """Dồn make_guess từ nhiều thread rồi kiểm tra các bất biến của phòng"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Đổi thread thường xuyên để các lượt đoán thật sự xen kẽ nhau
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.config_patch = patch.dict(GAME_CONFIG, {'RATE_LIMIT_MS': 0, 'MAX_GUESSES_PER_ROUND': 10 ** 6,
+                                                     'PERSIST_INTERVAL': 0.01})
+        self.config_patch.start()
+        self.emit_patch = patch('server.socketio.emit')
+        self.emit_patch.start()
+        self.game_manager = GameManager(persistence_file=Path(self.tmp_dir) / 'game_data.json')
+        for room_id in ROOMS:
+            self.game_manager.create_room(room_id, 'Stress Room', max_players=PLAYERS_PER_ROOM)
+            for i in range(PLAYERS_PER_ROOM):
+                self.game_manager.join_room(room_id, f'Player{i}', f'{room_id}_sid_{i}')
+
+    def tearDown(self):
+        self.game_manager.shutdown()
+        self.emit_patch.stop()
+        self.config_patch.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        sys.setswitchinterval(self.switch_interval)
+
+    def run_threads(self, targets):
+        errors = []
+
+        def guarded(target):
+            try:
+                target()
+            except Exception as e:  # lỗi trong thread không tự làm test fail
+                errors.append(e)
+
+        threads = [threading.Thread(target=guarded, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertEqual(errors, [])
+
+    def test_one_winner_per_round_and_consistent_scores(self):
+        gained = {}  # (room_id, sid) -> tổng điểm make_guess trả về
+        stop_saving = threading.Event()
+
+        def player(room_id, sid):
+            room = self.game_manager.rooms[room_id]
+            total = 0
+            for i in range(GUESSES_PER_PLAYER):
+                # Đọc số cần tìm không giữ khóa: nhiều thread cùng đoán đúng một vòng
+                guess = room.current_round.number if i % 2 == 0 else room.current_round.range_low
+                ok, _, details = self.game_manager.make_guess(room_id, sid, guess)
+                self.assertTrue(ok)
+                total += details.get('score_gained', 0)
+            gained[(room_id, sid)] = total
+
+        def saver():
+            while not stop_saving.is_set():
+                self.game_manager.save_rooms_to_file()
+                for room in list(self.game_manager.rooms.values()):
+                    self.game_manager._room_to_dict(room)
+
+        save_thread = threading.Thread(target=saver)
+        save_thread.start()
+        try:
+            self.run_threads([lambda r=room_id, s=sid: player(r, s)
+                              for room_id in ROOMS
+                              for sid in list(self.game_manager.rooms[room_id].players)])
+        finally:
+            stop_saving.set()
+            save_thread.join(timeout=10)
+
+        for room_id in ROOMS:
+            room = self.game_manager.rooms[room_id]
+            wins = sum(p.correct_guesses for p in room.players.values())
+            # Mỗi vòng chỉ một người thắng: số vòng đã qua bằng tổng số lần đoán đúng
+            self.assertGreater(wins, 0)
+            self.assertEqual(room.round_number, 1 + wins)
+            for sid, p in room.players.items():
+                self.assertEqual(p.score, gained[(room_id, sid)])
+                self.assertEqual(room.scores[p.name], p.score)
+                self.assertEqual(p.total_guesses, GUESSES_PER_PLAYER)
+                self.assertEqual(room.player_stats[p.name]['score'], p.score)
+            winners = [entry['winner'] for entry in room.game_history]
+            self.assertEqual(len(winners), min(wins, room.game_history.maxlen))
+
+    def test_join_leave_while_guessing(self):
+        room_id = ROOMS[0]
+        players = list(self.game_manager.rooms[room_id].players)
+
+        def churn(i):
+            sid = f'churn_sid_{i}'
+            for _ in range(50):
+                # Phòng đầy: chỉ vào được khi có người khác vừa rời
+                self.game_manager.leave_room(players[i])
+                self.game_manager.join_room(room_id, f'Churn{i}', sid)
+                self.game_manager.leave_room(sid)
+                self.game_manager.join_room(room_id, f'Player{i}', players[i])
+
+        def guesser(sid):
+            for _ in range(200):
+                self.game_manager.make_guess(room_id, sid, 1)
+
+        self.run_threads([lambda i=i: churn(i) for i in range(3)] +
+                         [lambda s=sid: guesser(s) for sid in players[3:]])
+
+        room = self.game_manager.rooms[room_id]
+        self.assertLessEqual(len(room.players), room.max_players)
+        self.assertEqual(set(room.player_sids.values()), set(room.players))
+        members = {sid for sid, rid in self.game_manager.player_rooms.items() if rid == room_id}
+        self.assertEqual(members, set(room.players))
+
+
+if __name__ == '__main__':
+    unittest.main()
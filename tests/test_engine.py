@@ -0,0 +1,123 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, Request, TextMessage
+from wsproto.extensions import PerMessageDeflate
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import server
+from server import app
+from engine import EngineConfig, ThresholdDeflate, TransportMetrics
+
+
+class TestEngineConfig(unittest.TestCase):
+    def test_env_round_trip(self):
+        config = EngineConfig('websocket', 10, 5, 64_000, -1)
+        with patch.dict(os.environ, config.to_env()):
+            loaded = EngineConfig.from_env()
+        self.assertEqual(loaded, config)
+        options = loaded.server_options()
+        self.assertEqual(options['transports'], ['websocket'])
+        self.assertEqual(options['ping_interval'], 10)
+        self.assertEqual(options['max_http_buffer_size'], 64_000)
+        self.assertFalse(options['http_compression'])
+
+    def test_unknown_profile(self):
+        with patch.dict(os.environ, {'GAME_TRANSPORT_PROFILE': 'carrier-pigeon'}):
+            with self.assertRaises(ValueError):
+                EngineConfig.from_env()
+
+
+class TestThresholdDeflate(unittest.TestCase):
+    """Bắt tay WebSocket thật bằng wsproto: message nhỏ gửi thô, message lớn được nén"""
+
+    def connect(self, extension):
+        client = WSConnection(ConnectionType.CLIENT)
+        server_conn = WSConnection(ConnectionType.SERVER)
+        server_conn.receive_data(client.send(Request(host='localhost', target='/socket.io/',
+                                                     extensions=[PerMessageDeflate()])))
+        request = next(server_conn.events())
+        self.assertIsInstance(request, Request)
+        client.receive_data(server_conn.send(AcceptConnection(extensions=[extension])))
+        accepted = next(client.events())
+        return client, server_conn, accepted
+
+    def send(self, client, server_conn, text):
+        frame = server_conn.send(TextMessage(data=text))
+        client.receive_data(frame)
+        received = ''.join(event.data for event in client.events())
+        self.assertEqual(received, text)
+        return frame
+
+    def test_compresses_only_large_messages(self):
+        client, server_conn, accepted = self.connect(ThresholdDeflate(256))
+        self.assertEqual([ext.name for ext in accepted.extensions], ['permessage-deflate'])
+
+        small = self.send(client, server_conn, '42["guess_result",{"correct":false}]')
+        self.assertFalse(small[0] & 0x40)  # RSV1 = 0: không nén
+        large_text = '42["room_info",' + '{"name":"Người chơi","score":10},' * 50 + '{}]'
+        large = self.send(client, server_conn, large_text)
+        self.assertTrue(large[0] & 0x40)
+        self.assertLess(len(large), len(large_text.encode('utf-8')) / 2)
+        # Sau message nén, message nhỏ vẫn giải mã đúng
+        self.send(client, server_conn, '3')
+
+    def test_negative_threshold_declines_extension(self):
+        _, _, accepted = self.connect(ThresholdDeflate(-1))
+        self.assertEqual(accepted.extensions, [])
+
+
+class TestTransportMetrics(unittest.TestCase):
+    def test_counts_and_upgrade_latency(self):
+        metrics = TransportMetrics()
+        metrics.connected('sid_poll', 'polling')
+        metrics.connected('sid_ws', 'websocket')
+        self.assertIsNotNone(metrics.upgraded('sid_poll'))
+        self.assertIsNone(metrics.upgraded('sid_poll'))  # chỉ tính lần nâng cấp đầu tiên
+        self.assertIsNone(metrics.upgraded('sid_ws'))    # mở thẳng WebSocket, không có nâng cấp
+        metrics.disconnected('sid_ws')
+
+        stats = metrics.get_stats()
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['connections_total'], 2)
+        self.assertEqual(stats['initial_transport'], {'polling': 1, 'websocket': 1})
+        self.assertEqual(stats['upgrades'], 1)
+        self.assertIn('upgrade_ms_p95', stats)
+
+
+class TestTransportHandlers(unittest.TestCase):
+    def setUp(self):
+        self.request_context = app.test_request_context()
+        self.request_context.push()
+        self.metrics_patch = patch('server.transport_metrics', TransportMetrics())
+        self.metrics_patch.start()
+
+    def tearDown(self):
+        self.metrics_patch.stop()
+        self.request_context.pop()
+
+    @patch('server.emit')
+    def test_upgrade_reported_only_after_websocket(self, mock_emit):
+        with patch('server.request') as mock_request, \
+                patch.object(server.transport, 'transport_name', return_value='polling'):
+            mock_request.sid = 'sid_1'
+            server.on_connect()
+            server.on_transport_upgraded()  # vẫn đang long-polling: bỏ qua
+            self.assertEqual(server.transport_metrics.stats['upgrades'], 0)
+            with patch.object(server.transport, 'transport_name', return_value='websocket'):
+                server.on_transport_upgraded()
+            self.assertEqual(server.transport_metrics.stats['upgrades'], 1)
+            server.on_disconnect()
+
+        stats = server.transport_metrics.get_stats()
+        self.assertEqual(stats['connections'], 0)
+        self.assertEqual(stats['initial_transport'], {'polling': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
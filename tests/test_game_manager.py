@@ -1,4 +1,5 @@
 import unittest
+import json
 import time
 import sys
 import os
@@ -6,7 +7,7 @@ import os
 # Thêm server directory vào path để import
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
 
-from server import GameManager, Player, GameRound, Room, GAME_CONFIG
+from server import GameManager, Player, GameRound, Room, RoomIndex, GAME_CONFIG
 
 class TestGameManager(unittest.TestCase):
     def setUp(self):
@@ -344,5 +345,131 @@ class TestGameManager(unittest.TestCase):
         # Kiểm tra phòng đã được đánh dấu để xóa
         self.assertIn(self.test_room_id, inactive_rooms)
 
+    def test_reaper_removes_only_expired_empty_rooms(self):
+        """Test tác vụ dọn chỉ xóa phòng trống đã quá hạn, giữ phòng có người và phòng mặc định"""
+        ttl = GAME_CONFIG['EMPTY_ROOM_TTL']
+        self.game_manager.create_room("test_empty", "Empty Room")
+        self.game_manager.create_room("test_busy", "Busy Room")
+        self.game_manager.create_room("lobby", "Lobby Room")
+        self.game_manager.join_room("test_busy", self.test_player_name, self.test_sid)
+        self.assertEqual(self.game_manager.get_cleanup_stats()['tracked'], 1)
+
+        self.assertEqual(self.game_manager.reap_expired_rooms(now=time.time() + 1), 0)
+        self.assertEqual(self.game_manager.reap_expired_rooms(now=time.time() + ttl + 1), 1)
+        self.assertNotIn("test_empty", self.game_manager.rooms)
+        self.assertIn("test_busy", self.game_manager.rooms)
+        self.assertIn("lobby", self.game_manager.rooms)
+
+        # Người cuối rời phòng: hẹn dọn tính từ lúc rời
+        self.game_manager.leave_room(self.test_sid)
+        self.assertEqual(self.game_manager.reap_expired_rooms(now=time.time() + ttl / 2), 0)
+        self.assertEqual(self.game_manager.reap_expired_rooms(now=time.time() + ttl + 1), 1)
+        self.assertEqual(self.game_manager.get_cleanup_stats()['reaped'], 2)
+
+    def test_reaper_reschedules_room_with_new_activity(self):
+        """Test phòng có hoạt động mới sau khi vào index không bị xóa sớm"""
+        room = self.game_manager.create_room(self.test_room_id, "Test Room")
+        deadline = self.game_manager.room_expiry.get(self.test_room_id)
+        room.last_activity = deadline - GAME_CONFIG['EMPTY_ROOM_TTL'] + 100
+
+        self.assertEqual(self.game_manager.reap_expired_rooms(now=deadline), 0)
+        self.assertIn(self.test_room_id, self.game_manager.rooms)
+        self.assertAlmostEqual(self.game_manager.room_expiry.get(self.test_room_id), deadline + 100)
+
+    def test_find_room_case_insensitive(self):
+        """Test tìm phòng không phân biệt chữ hoa/thường và khoảng trắng"""
+        room = self.game_manager.create_room("test_Room_ABC", "Test Room")
+
+        self.assertIs(self.game_manager.find_room_by_id("TEST_room_abc"), room)
+        self.assertIs(self.game_manager.find_room_by_id(" test_room_abc "), room)
+        self.assertIsNone(self.game_manager.create_room("TEST_ROOM_abc", "Duplicate"))
+
+        self.game_manager.delete_room("test_room_abc")
+        self.assertIsNone(self.game_manager.find_room_by_id("test_Room_ABC"))
+
+    def test_player_rooms_store_original_room_id(self):
+        """Test player_rooms lưu ID gốc khi người chơi nhập khác chữ hoa/thường"""
+        self.game_manager.create_room("test_Room_ABC", "Test Room")
+        success, _ = self.game_manager.join_room("TEST_ROOM_ABC", self.test_player_name, self.test_sid)
+
+        self.assertTrue(success)
+        self.assertEqual(self.game_manager.player_rooms[self.test_sid], "test_Room_ABC")
+
+    def test_rejoin_restores_exact_stats(self):
+        """Test vào lại phòng khôi phục chính xác điểm, streak và số lần đoán"""
+        room = self.game_manager.create_room(self.test_room_id, "Test Room")
+        self.game_manager.join_room(self.test_room_id, self.test_player_name, self.test_sid)
+        player = room.players[self.test_sid]
+        self.game_manager.make_guess(self.test_room_id, self.test_sid, room.current_round.number)
+        player.last_guess_at = 0
+        wrong = room.current_round.range_low if room.current_round.number != room.current_round.range_low else room.current_round.range_high
+        self.game_manager.make_guess(self.test_room_id, self.test_sid, wrong)
+        player.last_guess_at = 0
+        self.game_manager.make_guess(self.test_room_id, self.test_sid, room.current_round.number)
+        expected = (player.score, player.streak, player.total_guesses, player.correct_guesses)
+
+        self.game_manager.leave_room(self.test_sid)
+        self.assertNotIn(self.test_player_name, room.player_sids)
+
+        success, _ = self.game_manager.join_room(self.test_room_id, self.test_player_name, "new_sid")
+        self.assertTrue(success)
+        rejoined = room.players["new_sid"]
+        self.assertEqual((rejoined.score, rejoined.streak, rejoined.total_guesses, rejoined.correct_guesses),
+                         expected)
+        self.assertEqual(expected[2], 3)
+        self.assertEqual(room.player_sids[self.test_player_name], "new_sid")
+
+    def test_duplicate_name_check_survives_direct_player_mutation(self):
+        """Test index tên được dựng lại khi room.players bị sửa trực tiếp"""
+        room = self.game_manager.create_room(self.test_room_id, "Test Room")
+        room.players["manual_sid"] = Player(name="Manual", sid="manual_sid", joined_at=time.time(), last_guess_at=0)
+
+        success, message = self.game_manager.join_room(self.test_room_id, "Manual", "other_sid")
+        self.assertFalse(success)
+        self.assertEqual(message, "Tên người chơi đã tồn tại")
+
+    def test_room_index_tracks_direct_mutation(self):
+        """Test index chuẩn hóa vẫn đúng khi dict bị sửa trực tiếp"""
+        index = RoomIndex({"Lobby": 1})
+        index["Demo"] = 2
+        self.assertEqual(index.resolve("lobby"), "Lobby")
+        self.assertEqual(index.resolve("DEMO"), "Demo")
+
+        index.pop("Lobby")
+        del index["Demo"]
+        self.assertIsNone(index.resolve("lobby"))
+        self.assertIsNone(index.resolve("demo"))
+
+        index["Room"] = 3
+        index.clear()
+        self.assertIsNone(index.resolve("room"))
+
+    def test_room_directory_updates_incrementally(self):
+        """Test danh sách phòng chỉ đổi version khi phòng thêm/xóa hoặc số người chơi/trạng thái đổi"""
+        directory = self.game_manager.directory
+        self.game_manager.create_room(self.test_room_id, "Test Room")
+        self.game_manager.create_room("test_private", "Private", password="secret", is_private=True)
+        version, rooms = directory.snapshot()
+        self.assertEqual([r['id'] for r in rooms], [self.test_room_id])
+
+        # Không có thay đổi: cùng version, cùng danh sách đã dựng sẵn
+        self.assertEqual(directory.snapshot(), (version, rooms))
+        self.assertIs(directory.snapshot()[1], rooms)
+
+        self.game_manager.join_room(self.test_room_id, self.test_player_name, self.test_sid)
+        joined_version, rooms = directory.snapshot()
+        self.assertGreater(joined_version, version)
+        self.assertEqual(rooms[0]['current_players'], 1)
+
+        # Phòng trống bị ẩn khỏi danh sách
+        self.game_manager.leave_room(self.test_sid)
+        left_version, rooms = directory.snapshot()
+        self.assertGreater(left_version, joined_version)
+        self.assertEqual(rooms, [])
+
+        self.game_manager.delete_room("test_private")
+        self.assertGreater(directory.snapshot()[0], left_version)
+        self.assertEqual(json.loads(directory.payload()[1])['total'], 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,6 +6,8 @@ Test logic vòng chơi và scoreboard cho Guess Number Game Server
 import unittest
 import sys
 import os
+import random
+import threading
 import time
 from unittest.mock import Mock, patch
 
@@ -13,6 +15,8 @@ from unittest.mock import Mock, patch
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
 
 from server import GameManager, Player, GameRound, Room, GAME_CONFIG
+from leaderboard import Leaderboard, GlobalLeaderboard, SortedBuckets
+from scheduler import RoundScheduler
 
 # Disable Socket.IO logging for tests
 import logging
@@ -124,6 +128,40 @@ class TestGameRounds(unittest.TestCase):
             # Nếu thành công, có thể do logic thời gian đã được sửa
             self.assertTrue(success)
     
+    def test_expired_round_guess_counts_in_new_round(self):
+        """Test đoán sau khi vòng hết giờ (scheduler chưa chạy) tạo vòng mới và tính lượt đoán"""
+        self.room.current_round.end_time = time.time() - 1
+        initial_round = self.room.round_number
+
+        success, message, details = self.game_manager.make_guess(
+            self.test_room_id, self.test_sid, 50
+        )
+
+        self.assertEqual(self.room.round_number, initial_round + 1)
+        self.assertEqual(self.player.guesses_this_round, 0 if details.get('correct') else 1)
+
+    @patch('server.socketio.emit')
+    def test_scheduler_ends_round_on_time(self, mock_emit):
+        """Test vòng hết giờ được kết thúc bởi scheduler, không cần ai đoán"""
+        initial_round = self.room.round_number
+        old_deadline = self.room.current_round.end_time
+
+        self.game_manager._expire_round(self.test_room_id, old_deadline)
+        self.assertEqual(self.room.round_number, initial_round + 1)
+        event_names = [call[0][0] for call in mock_emit.call_args_list]
+        self.assertIn('new_round', event_names)
+
+        # Mục cũ trong heap (vòng đã được thay) bị bỏ qua
+        self.game_manager._expire_round(self.test_room_id, old_deadline)
+        self.assertEqual(self.room.round_number, initial_round + 1)
+
+    def test_scheduler_skips_empty_room(self):
+        """Test phòng trống không tạo vòng mới khi hết giờ"""
+        self.game_manager.leave_room(self.test_sid)
+        initial_round = self.room.round_number
+        self.game_manager._expire_round(self.test_room_id, self.room.current_round.end_time)
+        self.assertEqual(self.room.round_number, initial_round)
+
     def test_correct_guess_creates_new_round(self):
         """Test đoán đúng tạo vòng mới"""
         initial_round = self.room.round_number
@@ -307,6 +345,131 @@ class TestScoreboard(unittest.TestCase):
         self.assertEqual(len(self.room.scores), 0)
         self.assertEqual(self.room.round_number, 1)
 
+    def test_room_info_sends_top_n_and_own_rank(self):
+        """Test get_room_info chỉ gửi top-N kèm hạng của người hỏi"""
+        for i in range(30):
+            self.room.scores[f"Old{i}"] = 100 + i
+        self.room.scores[self.test_player_name] = 5
+
+        with patch.dict(GAME_CONFIG, {'LEADERBOARD_SIZE': 3}):
+            info = self.game_manager.get_room_info(self.test_room_id, self.test_sid)
+
+        self.assertEqual(list(info['scores']), ["Old29", "Old28", "Old27"])
+        self.assertEqual([entry['rank'] for entry in info['leaderboard']], [1, 2, 3])
+        self.assertEqual(info['ranked_players'], 31)
+        self.assertEqual(info['player_rank'], {'name': self.test_player_name, 'score': 5, 'rank': 31})
+
+class TestRoundScheduler(unittest.TestCase):
+    """Test bộ hẹn giờ vòng chơi dùng min-heap"""
+
+    def test_fires_due_rounds_in_deadline_order(self):
+        """Test 10k vòng trong một heap, chỉ mục tới hạn được xử lý, theo thứ tự deadline"""
+        fired = []
+        scheduler = RoundScheduler(lambda key, deadline: fired.append(deadline))
+        scheduler._stopped = True  # không cần thread, gọi run_due trực tiếp
+        for i in range(10000):
+            scheduler.schedule(f"room_{i}", float((i * 7919) % 10000))
+
+        self.assertEqual(scheduler.run_due(now=4999.5), 5000)
+        self.assertEqual(fired, sorted(fired))
+        self.assertEqual(scheduler.stats['pending'], 5000)
+
+    def test_thread_fires_on_time(self):
+        """Test thread hẹn giờ gọi callback khi tới deadline"""
+        done = threading.Event()
+        scheduler = RoundScheduler(lambda key, deadline: done.set())
+        try:
+            scheduler.schedule("later", time.time() + 60)
+            scheduler.schedule("soon", time.time() + 0.05)
+            self.assertTrue(done.wait(2))
+            self.assertEqual(scheduler.stats['fired'], 1)
+        finally:
+            scheduler.stop()
+
+class TestLeaderboard(unittest.TestCase):
+    """Test bảng xếp hạng sắp xếp sẵn"""
+
+    def test_top_and_rank_with_ties(self):
+        """Test cùng điểm thì cùng hạng"""
+        board = Leaderboard({"A": 10, "B": 30, "C": 30, "D": 5})
+        self.assertEqual(board.top(3), [
+            {'name': 'B', 'score': 30, 'rank': 1},
+            {'name': 'C', 'score': 30, 'rank': 1},
+            {'name': 'A', 'score': 10, 'rank': 3},
+        ])
+        self.assertEqual(board.rank("D"), 4)
+        self.assertIsNone(board.rank("Nobody"))
+
+    def test_updates_keep_order(self):
+        """Test cập nhật/xóa như dict vẫn giữ thứ tự"""
+        board = Leaderboard({"A": 10, "B": 20})
+        board["A"] = 50
+        self.assertEqual(board.rank("A"), 1)
+        self.assertEqual(board.rank("B"), 2)
+
+        board.pop("A")
+        board["C"] += 25  # hành vi defaultdict(int) cũ
+        self.assertEqual(board.as_dict(10), {"C": 25, "B": 20})
+
+        board.clear()
+        self.assertEqual(board.top(5), [])
+
+    def test_sorted_buckets_match_sorted_list(self):
+        """Test SortedBuckets (bucket nhỏ để tách/gộp thường xuyên) khớp với list sắp xếp thường"""
+        rng = random.Random(12)
+        with patch.object(SortedBuckets, 'LOAD', 4):
+            board = Leaderboard({f"P{i}": rng.randint(0, 50) for i in range(40)})
+            for _ in range(2000):
+                name = f"P{rng.randint(0, 80)}"
+                if rng.random() < 0.3:
+                    board.pop(name, None)
+                else:
+                    board[name] = rng.randint(0, 50)
+                if rng.random() < 0.1:
+                    expected = sorted((-score, n) for n, score in board.items())
+                    self.assertEqual(board._order.slice(0, len(board)), expected)
+                    start = rng.randint(0, len(board))
+                    self.assertEqual(board._order.slice(start, start + 7), expected[start:start + 7])
+                    for n in rng.sample(sorted(board), min(5, len(board))):
+                        self.assertEqual(board.rank(n), sum(score > board[n] for score in board.values()) + 1)
+            board.clear()
+            self.assertEqual(board.top(5), [])
+
+    def test_around(self):
+        """Test những người xung quanh một người chơi"""
+        board = Leaderboard({f"P{i}": i for i in range(10)})
+        self.assertEqual([e['name'] for e in board.around("P5", radius=1)], ["P6", "P5", "P4"])
+        self.assertEqual([e['name'] for e in board.around("P9", radius=2)], ["P9", "P8", "P7"])
+        self.assertEqual(board.around("Nobody"), [])
+
+    def test_global_leaderboard_percentile(self):
+        """Test bảng xếp hạng chung cộng dồn điểm và tính phần trăm"""
+        board = GlobalLeaderboard()
+        for i in range(4):
+            board.add(f"P{i}", (i + 1) * 10)
+        self.assertEqual(board.add("P0", 100), 110)
+        self.assertEqual(board.player("P0"), {'name': 'P0', 'score': 110, 'rank': 1, 'percentile': 100.0})
+        self.assertEqual(board.percentile("P1"), 25.0)
+        self.assertIsNone(board.player("Nobody"))
+        self.assertEqual(set(board.take_dirty()), {"P0", "P1", "P2", "P3"})
+        self.assertEqual(board.take_dirty(), {})
+
+    def test_correct_guess_updates_global_leaderboard(self):
+        """Test đoán đúng ở các phòng khác nhau cộng vào cùng một tổng điểm"""
+        game_manager = GameManager()
+        first = game_manager.create_room("test_global_a", "Global A")
+        second = game_manager.create_room("test_global_b", "Global B")
+        game_manager.join_room("test_global_a", "Roamer", "sid_a")
+        game_manager.join_room("test_global_b", "Roamer", "sid_b")
+
+        game_manager.make_guess("test_global_a", "sid_a", first.current_round.number)
+        game_manager.make_guess("test_global_b", "sid_b", second.current_round.number)
+
+        total = first.scores["Roamer"] + second.scores["Roamer"]
+        result = game_manager.get_global_leaderboard(5, "Roamer")
+        self.assertEqual(result['leaderboard'][0], {'name': 'Roamer', 'score': total, 'rank': 1})
+        self.assertEqual(result['player']['score'], total)
+
 class TestGameHistory(unittest.TestCase):
     """Test lịch sử vòng chơi"""
     
@@ -368,5 +531,57 @@ class TestGameHistory(unittest.TestCase):
         # round_number sẽ là 1 vì mỗi lần đoán đúng sẽ tạo vòng mới
         self.assertEqual(latest_history['round_number'], 1)
 
+class TestRoomStateDeltas(unittest.TestCase):
+    """Test state_seq và các delta gửi cho client"""
+
+    def setUp(self):
+        self.game_manager = GameManager()
+        self.test_room_id = "test_room_delta"
+        self.room = self.game_manager.create_room(self.test_room_id, "Delta Room")
+        self.game_manager.join_room(self.test_room_id, "Alice", "sid_alice")
+        self.snapshot = self.game_manager.get_room_info(self.test_room_id)
+
+    def tearDown(self):
+        for room_id in list(self.game_manager.rooms.keys()):
+            if room_id.startswith("test_"):
+                self.game_manager.delete_room(room_id)
+
+    def changes_since_snapshot(self):
+        return self.game_manager.get_room_changes(self.test_room_id, self.snapshot['seq'], self.snapshot['epoch'])
+
+    def test_changes_follow_snapshot_in_order(self):
+        self.game_manager.join_room(self.test_room_id, "Bob", "sid_bob")
+        self.game_manager.make_guess(self.test_room_id, "sid_alice", self.room.current_round.number)
+        self.game_manager.leave_room("sid_bob")
+
+        result = self.changes_since_snapshot()
+        changes = result['changes']
+        self.assertEqual([c['seq'] for c in changes],
+                         list(range(self.snapshot['seq'] + 1, self.room.state_seq + 1)))
+        self.assertEqual(changes[0]['joined'], ['Bob'])
+        # Vòng mới được ghi trước điểm để các sự kiện tới client đúng thứ tự
+        self.assertEqual(changes[1]['round']['round_number'], 2)
+        self.assertEqual(changes[2]['scores'], {'Alice': self.room.players['sid_alice'].score})
+        self.assertEqual(changes[3]['left'], ['Bob'])
+        self.assertEqual(result['seq'], self.room.state_seq)
+
+        # Client đã cập nhật: không còn gì để gửi
+        self.assertEqual(self.game_manager.get_room_changes(
+            self.test_room_id, self.room.state_seq, self.room.state_epoch)['changes'], [])
+        self.assertIs(self.game_manager.find_change(self.room, 'scores', 'Alice'), changes[2])
+
+    def test_full_snapshot_when_behind_or_stale(self):
+        # Sai epoch (vd. server khởi động lại)
+        self.assertIsNone(self.game_manager.get_room_changes(self.test_room_id, self.snapshot['seq'], 'other'))
+
+        # Tụt quá vòng đệm
+        for _ in range(GAME_CONFIG['STATE_CHANGE_RING'] + 1):
+            self.game_manager._start_new_round(self.room)
+        self.assertIsNone(self.changes_since_snapshot())
+
+    def test_reset_requires_full_snapshot(self):
+        self.game_manager.reset_room(self.test_room_id, "sid_alice")
+        self.assertIsNone(self.changes_since_snapshot())
+
 if __name__ == '__main__':
     unittest.main()
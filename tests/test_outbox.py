@@ -0,0 +1,141 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import server
+from server import app, game_manager
+from outbox import RoomOutbox
+
+
+class TestRoomOutbox(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        # Tick dài: test tự flush để kiểm tra nội dung lô
+        self.outbox = RoomOutbox(lambda room_id, batch: self.sent.append(batch), tick=60)
+
+    def tearDown(self):
+        self.outbox.stop()
+
+    def test_merges_presence_and_scoreboard(self):
+        self.outbox.post('room_1', 'player_joined', {'player_name': 'Alice', 'current_players': 1})
+        self.outbox.post('room_1', 'scoreboard_updated', {'scores': {'Alice': 10}})
+        self.outbox.post('room_1', 'chat_message', {'message': 'hi'})
+        self.outbox.post('room_1', 'player_joined', {'player_name': 'Bob', 'current_players': 2})
+        self.outbox.post('room_1', 'player_left', {'player_name': 'Alice', 'current_players': 1})
+        self.outbox.post('room_1', 'scoreboard_updated', {'scores': {'Alice': 20}})
+        self.outbox.post('room_2', 'chat_message', {'message': 'other room'})
+
+        self.outbox.flush('room_1')
+        self.assertEqual(self.sent, [{'room_id': 'room_1', 'events': [
+            ['presence', {'room_id': 'room_1', 'joined': ['Bob'], 'left': [], 'current_players': 1}],
+            ['chat_message', {'message': 'hi'}],
+            ['scoreboard_updated', {'scores': {'Alice': 20}}],
+        ]}])
+        self.assertEqual(self.outbox.stats['merged'], 3)
+
+        self.outbox.flush()
+        self.assertEqual([batch['room_id'] for batch in self.sent], ['room_1', 'room_2'])
+
+    def test_background_flush_after_tick(self):
+        outbox = RoomOutbox(lambda room_id, batch: self.sent.append(batch), tick=0.01)
+        outbox.post('room_1', 'chat_message', {'message': 'a'})
+        outbox.post('room_1', 'chat_message', {'message': 'b'})
+        deadline = time.time() + 2
+        while not self.sent and time.time() < deadline:
+            time.sleep(0.01)
+        outbox.stop()
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(self.sent[0]['events']), 2)
+
+
+    def test_immediate_event_waits_for_batch_in_flight(self):
+        """Lô thread tick đang gửi dở phải tới trước sự kiện gửi ngay của cùng phòng"""
+        sending, release = threading.Event(), threading.Event()
+
+        def slow_send(room_id, batch):
+            sending.set()
+            release.wait(2)
+            self.sent.append('room_batch')
+
+        outbox = RoomOutbox(slow_send, tick=60)
+        outbox.post('room_1', 'chat_message', {'message': 'a'})
+        tick = threading.Thread(target=outbox.flush)
+        tick.start()
+        self.assertTrue(sending.wait(2))
+
+        def send_now():
+            with outbox.ordered('room_1'):
+                self.sent.append('new_round')
+
+        immediate = threading.Thread(target=send_now)
+        immediate.start()
+        immediate.join(0.1)
+        self.assertEqual(self.sent, [])  # chờ lô đang gửi
+        release.set()
+        tick.join(2)
+        immediate.join(2)
+        outbox.stop()
+        self.assertEqual(self.sent, ['room_batch', 'new_round'])
+
+class TestOutboxHandlers(unittest.TestCase):
+    """Bật outbox cho server: sự kiện phòng đi theo lô, guess_result vẫn gửi ngay"""
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.request_context = app.test_request_context()
+        self.request_context.push()
+        game_manager.rooms.clear()
+        game_manager.player_rooms.clear()
+        self.outbox = RoomOutbox(server.send_room_batch, tick=60)
+        self.outbox_patch = patch('server.room_outbox', self.outbox)
+        self.outbox_patch.start()
+
+    def tearDown(self):
+        self.outbox_patch.stop()
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+        self.request_context.pop()
+        self.app_context.pop()
+
+    @patch('server.join_room')
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_room_events_are_batched(self, mock_socketio_emit, mock_emit, mock_join_room):
+        room = game_manager.create_room('test_outbox', 'Outbox Room')
+        with patch('server.request') as mock_request:
+            for sid, name in (('sid_a', 'Alice'), ('sid_b', 'Bob')):
+                mock_request.sid = sid
+                server.on_join_room({'room_id': 'test_outbox', 'player_name': name})
+            mock_request.sid = 'sid_a'
+            server.on_chat_message({'room_id': 'test_outbox', 'message': 'xin chào'})
+            number = room.current_round.number
+            server.on_make_guess({'room_id': 'test_outbox', 'guess': number})
+
+        # guess_result trả ngay cho người đoán
+        self.assertIn('guess_result', [c.args[0] for c in mock_emit.call_args_list])
+        room_events = [c.args[0] for c in mock_socketio_emit.call_args_list]
+        self.assertNotIn('player_joined', room_events)
+        self.assertNotIn('chat_message', room_events)
+        # new_round gửi ngay và đẩy lô đang chờ đi trước nó
+        self.assertEqual(room_events[:2], ['room_batch', 'new_round'])
+        first_batch = mock_socketio_emit.call_args_list[0].args[1]
+        self.assertEqual([event for event, _ in first_batch['events']], ['presence', 'chat_message'])
+        self.assertEqual(first_batch['events'][0][1]['joined'], ['Alice', 'Bob'])
+
+        self.outbox.flush()
+        last = mock_socketio_emit.call_args_list[-1]
+        self.assertEqual(last.args[0], 'room_batch')
+        self.assertEqual(last.args[1]['events'][0][0], 'scoreboard_updated')
+        self.assertEqual(last.kwargs['to'], 'test_outbox')
+
+
+if __name__ == '__main__':
+    unittest.main()
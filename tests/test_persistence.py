@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Test lớp lưu trữ write-behind và journal cho Guess Number Game Server
+"""
+
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+# Thêm server directory vào path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from server import GameManager, GAME_CONFIG
+from persistence import WriteBehindSaver, EventJournal, SnapshotBatch, SnapshotWriter, apply_journal_record
+import storage
+
+class TestWriteBehindSaver(unittest.TestCase):
+    """Test gom thay đổi và flush theo lô"""
+
+    def setUp(self):
+        """Khởi tạo saver với hàm ghi giả"""
+        self.calls = []
+        self.saver = WriteBehindSaver(
+            lambda dirty, deleted: self.calls.append((set(dirty), set(deleted))),
+            interval=60,
+            max_dirty=100
+        )
+
+    def tearDown(self):
+        """Dừng thread nền"""
+        self.saver.stop()
+
+    def test_coalesce_many_marks_into_one_write(self):
+        """Test nhiều thay đổi trên cùng phòng chỉ ghi một lần"""
+        for _ in range(50):
+            self.saver.mark_dirty("room_a")
+        self.saver.mark_dirty("room_b")
+
+        self.assertEqual(self.saver.pending_count(), 2)
+        self.assertTrue(self.saver.flush())
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0], ({"room_a", "room_b"}, set()))
+        self.assertEqual(self.saver.pending_count(), 0)
+
+    def test_delete_overrides_dirty(self):
+        """Test phòng bị xóa sau khi thay đổi chỉ được ghi nhận là xóa"""
+        self.saver.mark_dirty("room_a")
+        self.saver.mark_deleted("room_a")
+        self.saver.flush()
+
+        self.assertEqual(self.calls, [(set(), {"room_a"})])
+
+    def test_flush_without_changes_is_noop(self):
+        """Test flush khi không có thay đổi không gọi hàm ghi"""
+        self.assertTrue(self.saver.flush())
+        self.assertEqual(self.calls, [])
+
+    def test_threshold_triggers_background_flush(self):
+        """Test vượt ngưỡng dirty thì thread nền flush sớm"""
+        written = threading.Event()
+
+        def save(dirty, deleted):
+            self.calls.append((set(dirty), set(deleted)))
+            written.set()
+
+        saver = WriteBehindSaver(save, interval=60, max_dirty=3)
+        try:
+            for i in range(3):
+                saver.mark_dirty(f"room_{i}")
+            self.assertTrue(written.wait(2))
+            self.assertEqual(len(self.calls), 1)
+            self.assertEqual(self.calls[0][0], {"room_0", "room_1", "room_2"})
+        finally:
+            saver.stop()
+
+    def test_failed_flush_requeues_rooms(self):
+        """Test ghi lỗi thì các phòng được giữ lại để thử lần sau"""
+        def failing_save(dirty, deleted):
+            raise IOError("disk full")
+
+        saver = WriteBehindSaver(failing_save, interval=60)
+        saver.mark_dirty("room_a")
+        self.assertFalse(saver.flush())
+        self.assertEqual(saver.pending_count(), 1)
+        self.assertEqual(saver.stats['errors'], 1)
+
+class TestSnapshotWriter(unittest.TestCase):
+    """Test thread ghi snapshot với hàng đợi giới hạn"""
+
+    def test_full_queue_blocks_producer(self):
+        """Test hàng đợi đầy thì bên gửi bị chặn và được ghi vào số liệu"""
+        release = threading.Event()
+        written = []
+
+        def slow_write(batch):
+            release.wait(2)
+            written.append(batch.journal_seq)
+
+        writer = SnapshotWriter(slow_write, max_queue=1)
+        producer = threading.Thread(target=lambda: [
+            writer.submit(SnapshotBatch({}, set(), journal_seq=seq)) for seq in range(4)
+        ])
+        producer.start()
+        producer.join(0.3)
+        self.assertTrue(producer.is_alive())  # đang chờ vì hàng đợi đầy
+
+        release.set()
+        producer.join(2)
+        writer.stop()
+        self.assertEqual(written, [0, 1, 2, 3])
+        self.assertGreaterEqual(writer.stats['blocked_submits'], 1)
+        self.assertEqual(writer.stats['written'], 4)
+
+    def test_failed_batch_reported(self):
+        """Test lô ghi lỗi được trả về qua on_error"""
+        failed = []
+
+        def failing_write(batch):
+            raise IOError("disk full")
+
+        writer = SnapshotWriter(failing_write, on_error=failed.append)
+        batch = writer.submit(SnapshotBatch({'a': {}}, set()))
+        self.assertFalse(batch.wait(2))
+        writer.stop()
+        self.assertEqual(failed, [batch])
+        self.assertEqual(writer.stats['errors'], 1)
+
+class TestGameManagerPersistence(unittest.TestCase):
+    """Test lưu và khôi phục phòng qua file"""
+
+    def setUp(self):
+        """Dùng file dữ liệu tạm cho mỗi test"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = Path(self.tmp_dir) / 'game_data.json'
+        self.game_manager = GameManager(persistence_file=self.data_file)
+
+    def tearDown(self):
+        """Dọn dẹp file tạm"""
+        self.game_manager.shutdown()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_mutations_do_not_write_synchronously(self):
+        """Test các sự kiện chỉ đánh dấu dirty, không ghi file ngay"""
+        self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.make_guess("test_room", "sid1", 1)
+
+        self.assertFalse(self.data_file.exists())
+        self.assertFalse(self.game_manager.journal.path.exists())
+        self.assertEqual(self.game_manager.saver.pending_count(), 1)
+
+    def test_flush_appends_journal_without_snapshot(self):
+        """Test flush chỉ nối thêm record vào journal, không ghi lại snapshot"""
+        self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.save_rooms_to_file()
+
+        self.assertFalse(self.data_file.exists())
+        with open(self.game_manager.journal.path, 'r', encoding='utf-8') as f:
+            ops = [json.loads(line)['op'] for line in f]
+        self.assertEqual(ops, ['room_created', 'player_joined'])
+
+    def test_recover_from_journal_after_crash(self):
+        """Test khôi phục điểm số chỉ từ journal khi server không tắt sạch"""
+        room = self.game_manager.create_room("test_room", "Test Room", max_players=5)
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.save_rooms_to_file()
+
+        # Không gọi shutdown: giả lập crash, snapshot chưa từng được ghi
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            loaded_room = reloaded.find_room_by_id("test_room")
+            self.assertIsNotNone(loaded_room)
+            self.assertEqual(loaded_room.max_players, 5)
+            self.assertEqual(loaded_room.round_number, room.round_number)
+            self.assertEqual(loaded_room.scores["Player"], room.scores["Player"])
+            self.assertEqual(len(loaded_room.game_history), 1)
+            self.assertEqual(loaded_room.current_round.number, room.current_round.number)
+        finally:
+            reloaded.saver.stop()
+
+    def test_player_stats_survive_restart(self):
+        """Test thống kê người chơi được lưu để khôi phục khi vào lại sau restart"""
+        room = self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.save_rooms_to_file()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            loaded_room = reloaded.find_room_by_id("test_room")
+            self.assertEqual(loaded_room.player_stats["Player"], room.player_stats["Player"])
+            reloaded.join_room("test_room", "Player", "sid2")
+            self.assertEqual(loaded_room.players["sid2"].streak, 1)
+            self.assertEqual(loaded_room.players["sid2"].correct_guesses, 1)
+        finally:
+            reloaded.saver.stop()
+
+    def test_global_leaderboard_survives_restart(self):
+        """Test điểm chung được khôi phục từ journal và từ snapshot sau compaction"""
+        room = self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.save_rooms_to_file()
+        expected = self.game_manager.global_leaderboard.player("Player")
+
+        # Chưa compaction: điểm chung chỉ nằm trong journal
+        reloaded = GameManager(persistence_file=self.data_file)
+        self.assertEqual(reloaded.global_leaderboard.player("Player"), expected)
+        reloaded.shutdown()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            self.assertEqual(reloaded.storage.load_global_scores(), {"Player": expected['score']})
+            self.assertEqual(reloaded.global_leaderboard.player("Player"), expected)
+        finally:
+            reloaded.saver.stop()
+
+    def test_compaction_writes_snapshot_and_truncates_journal(self):
+        """Test compaction ghi snapshot và xóa log đã gộp"""
+        self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.save_rooms_to_file()
+        self.game_manager.compact()
+
+        self.assertFalse(self.game_manager.journal.path.exists())
+        self.assertFalse(self.game_manager.journal.rotated_path.exists())
+        rooms_data, journal_seq = self.game_manager.storage.load_all()
+        self.assertIn("test_room", rooms_data)
+        self.assertEqual(journal_seq, self.game_manager.journal.seq)
+
+        # Thay đổi sau compaction nằm trong journal mới và được replay khi load
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.reset_room("test_room", "sid1")
+        self.game_manager.save_rooms_to_file()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            self.assertEqual(reloaded.find_room_by_id("test_room").round_number, 1)
+            self.assertEqual(reloaded.journal.seq, self.game_manager.journal.seq)
+        finally:
+            reloaded.saver.stop()
+
+    def test_deleted_room_not_persisted(self):
+        """Test phòng đã xóa không còn trong file"""
+        self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.save_rooms_to_file()
+        self.game_manager.delete_room("test_room")
+        self.game_manager.shutdown()
+
+        rooms_data, _ = self.game_manager.storage.load_all()
+        self.assertNotIn("test_room", rooms_data)
+        self.assertEqual(os.listdir(self.game_manager.storage.directory), ['manifest.json'])
+
+    def test_load_legacy_snapshot_format(self):
+        """Test vẫn đọc được game_data.json định dạng cũ {room_id: room}"""
+        self.game_manager.create_room("test_room", "Test Room")
+        legacy = {"test_room": self.game_manager._room_to_dict(self.game_manager.rooms["test_room"])}
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump(legacy, f)
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            self.assertIn("test_room", reloaded.rooms)
+            # Lần compaction đầu tiên chuyển toàn bộ sang shard
+            reloaded.compact()
+            self.assertTrue(reloaded.storage.manifest_path.exists())
+            self.assertIn("test_room", reloaded.storage.load_all()[0])
+        finally:
+            reloaded.saver.stop()
+
+    def test_compaction_rewrites_only_dirty_shards(self):
+        """Test compaction chỉ ghi lại shard của phòng đã thay đổi"""
+        self.game_manager.create_room("test_busy", "Busy Room")
+        self.game_manager.create_room("test_idle", "Idle Room")
+        self.game_manager.save_rooms_to_file()
+        self.game_manager.compact()
+
+        self.game_manager.join_room("test_busy", "Player", "sid1")
+        self.game_manager.save_rooms_to_file()
+
+        written = []
+        original_write = self.game_manager.storage.write
+        def spy_write(rooms_data, deleted_ids, *args):
+            written.append(set(rooms_data))
+            original_write(rooms_data, deleted_ids, *args)
+        self.game_manager.storage.write = spy_write
+        self.game_manager.compact()
+
+        self.assertEqual(written, [{"test_busy"}])
+        self.assertEqual(set(self.game_manager.storage.load_all()[0]), {"test_busy", "test_idle"})
+
+    def test_snapshot_uses_copy_captured_at_mutation(self):
+        """Test snapshot ghi bản chụp lúc thay đổi, không đọc Room đang bị sửa dở"""
+        room = self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        # Sửa trực tiếp không qua _record: giả lập handler khác đang sửa dở
+        room.name = "Half Written"
+        self.game_manager.compact()
+
+        rooms_data, _ = self.game_manager.storage.load_all()
+        self.assertEqual(rooms_data["test_room"]["name"], "Test Room")
+        self.assertEqual(self.game_manager.get_persistence_stats()['writer']['written'], 1)
+
+    def test_failed_snapshot_keeps_rotated_journal(self):
+        """Test snapshot ghi lỗi thì giữ đoạn journal đã tách và thử lại lần sau"""
+        self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.save_rooms_to_file()
+
+        original_write = self.game_manager.storage.write
+        def failing_write(rooms_data, deleted_ids, journal_seq=0):
+            raise IOError("disk full")
+        self.game_manager.storage.write = failing_write
+        self.game_manager.compact()
+        self.assertTrue(self.game_manager.journal.rotated_path.exists())
+
+        self.game_manager.storage.write = original_write
+        self.game_manager.compact()
+        self.assertFalse(self.game_manager.journal.rotated_path.exists())
+        self.assertIn("test_room", self.game_manager.storage.load_all()[0])
+
+    def test_restart_loads_index_and_hydrates_on_access(self):
+        """Test khởi động chỉ đọc index, phòng được dựng khi truy cập lần đầu"""
+        self.game_manager.create_room("room_a", "Room A")
+        self.game_manager.create_room("room_b", "Room B", max_players=4)
+        self.game_manager.create_room("room_secret", "Secret Room", is_private=True)
+        self.game_manager.shutdown()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            self.assertEqual(reloaded.rooms, {})
+            self.assertEqual(reloaded.room_count(), 3)
+            listed = {room['id']: room for room in reloaded.get_available_rooms()}
+            self.assertEqual(set(listed), {"room_a", "room_b"})
+            self.assertEqual(listed["room_b"]['max_players'], 4)
+
+            room = reloaded.find_room_by_id("ROOM_B")
+            self.assertIsNotNone(room)
+            self.assertEqual(room.max_players, 4)
+            self.assertEqual(set(reloaded.rooms), {"room_b"})
+            self.assertIs(reloaded.find_room_by_id("room_b"), room)
+            self.assertEqual(reloaded.room_count(), 3)
+
+            # Không tạo được phòng trùng với phòng chưa dựng
+            self.assertIsNone(reloaded.create_room("Room_A", "Room A again"))
+        finally:
+            reloaded.saver.stop()
+
+    def test_reaper_deletes_cold_rooms_without_hydrating(self):
+        """Test phòng chưa dựng quá hạn bị xóa thẳng từ index, không đọc dữ liệu phòng"""
+        self.game_manager.create_room("room_a", "Room A")
+        self.game_manager.shutdown()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            self.assertIn("room_a", reloaded.room_expiry)
+            with patch.object(reloaded.storage, 'load_room') as mock_load:
+                reaped = reloaded.reap_expired_rooms(now=time.time() + GAME_CONFIG['EMPTY_ROOM_TTL'] + 1)
+            self.assertEqual(reaped, 1)
+            mock_load.assert_not_called()
+            self.assertEqual(reloaded.room_count(), 0)
+            self.assertEqual(reloaded.get_cleanup_stats()['reaped_cold'], 1)
+            reloaded.save_rooms_to_file()
+            reloaded.compact()
+            self.assertEqual(reloaded.storage.load_all()[0], {})
+        finally:
+            reloaded.shutdown()
+
+    def test_replayed_changes_survive_next_compaction(self):
+        """Test thay đổi replay từ journal vẫn còn sau compaction của lần chạy sau"""
+        room = self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.create_room("test_gone", "Gone Room")
+        self.game_manager.save_rooms_to_file()
+        self.game_manager.compact()
+
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.delete_room("test_gone")
+        self.game_manager.save_rooms_to_file()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            # Phòng có record trong journal được dựng ngay
+            self.assertIn("test_room", reloaded.rooms)
+            self.assertEqual(reloaded.room_count(), 1)
+            reloaded.compact()
+            rooms_data, _ = reloaded.storage.load_all()
+            self.assertEqual(set(rooms_data), {"test_room"})
+            self.assertEqual(rooms_data["test_room"]["scores"]["Player"], room.scores["Player"])
+        finally:
+            reloaded.shutdown()
+
+    def test_shard_names_for_unicode_room_ids(self):
+        """Test room_id có dấu cách và tiếng Việt vẫn lưu/đọc được"""
+        self.game_manager.create_room("Phòng vui", "Phòng Vui Vẻ")
+        self.game_manager.shutdown()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            self.assertIsNotNone(reloaded.find_room_by_id("phòng vui"))
+        finally:
+            reloaded.saver.stop()
+
+    def test_save_reports_failed_snapshot_write(self):
+        """Test không có journal: save_rooms_to_file chờ lô snapshot và trả về False khi ghi lỗi"""
+        self.game_manager.shutdown()
+        with patch.dict(GAME_CONFIG, {'STORAGE_BACKEND': 'sqlite'}):
+            self.game_manager = GameManager(persistence_file=self.data_file)
+        self.assertIsNone(self.game_manager.journal)
+        self.game_manager.create_room("test_room", "Test Room")
+
+        with patch.object(self.game_manager.storage, 'write', side_effect=OSError(28, 'No space left on device')):
+            self.assertFalse(self.game_manager.save_rooms_to_file())
+        self.assertIn("test_room", self.game_manager._snapshot_dirty)
+
+        # Lô lỗi được ghi lại ngay ở lần lưu sau dù không có thay đổi mới
+        self.assertTrue(self.game_manager.save_rooms_to_file())
+        self.assertIsNotNone(self.game_manager.storage.load_room("test_room"))
+
+    def test_failed_shard_is_retried_alone(self):
+        """Test room_id CJK dài tối đa vẫn lưu được; phòng ghi lỗi được thử lại riêng, phòng khác không bị chặn"""
+        long_id = "数字猜谜游戏房间" * 3 + "欢迎光临大家"
+        self.assertEqual(len(long_id), GAME_CONFIG['MAX_ROOM_ID_LENGTH'])
+        self.game_manager.create_room(long_id, "Phòng dài")
+        self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.save_rooms_to_file()
+
+        original = storage._atomic_write_snapshot
+
+        def failing_write(path, data, snapshot_format, indent=None):
+            if path.name.startswith('test_room.'):
+                raise OSError(28, 'No space left on device')
+            original(path, data, snapshot_format, indent)
+
+        with patch.object(storage, '_atomic_write_snapshot', failing_write):
+            self.game_manager.compact()
+        self.assertEqual(self.game_manager._snapshot_dirty, {"test_room"})
+        self.assertTrue(self.game_manager.journal.rotated_path.exists())
+
+        self.game_manager.compact()
+        self.assertFalse(self.game_manager.journal.rotated_path.exists())
+        rooms_data, _ = self.game_manager.storage.load_all()
+        self.assertEqual(set(rooms_data), {long_id, "test_room"})
+
+class TestEventJournal(unittest.TestCase):
+    """Test journal append-only"""
+
+    def setUp(self):
+        """Tạo journal trong thư mục tạm"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal = EventJournal(Path(self.tmp_dir) / 'game_data.journal')
+
+    def tearDown(self):
+        """Dọn dẹp file tạm"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_replay_skips_corrupt_tail(self):
+        """Test dòng cuối ghi dở (crash) bị bỏ qua khi replay"""
+        self.journal.append({'op': 'room_deleted', 'room': 'a'})
+        self.journal.append({'op': 'room_deleted', 'room': 'b'})
+        self.journal.flush()
+        with open(self.journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"op": "room_del')
+
+        records = list(EventJournal(self.journal.path).replay())
+        self.assertEqual([r['room'] for r in records], ['a', 'b'])
+
+    def test_replay_after_seq_includes_rotated_segment(self):
+        """Test replay đọc cả đoạn log đã tách khi compaction chưa hoàn tất"""
+        self.journal.append({'op': 'room_deleted', 'room': 'a'})
+        rotated_seq = self.journal.rotate()
+        self.journal.append({'op': 'room_deleted', 'room': 'b'})
+        self.journal.flush()
+
+        reader = EventJournal(self.journal.path)
+        self.assertEqual([r['room'] for r in reader.replay()], ['a', 'b'])
+        self.assertEqual([r['room'] for r in reader.replay(after_seq=rotated_seq)], ['b'])
+        self.assertEqual(reader.seq, 2)
+
+    def test_apply_records_is_idempotent(self):
+        """Test áp dụng lại cùng record không làm sai dữ liệu"""
+        rooms_data = {'r': {'scores': {}, 'game_history': [], 'current_round': {'total_guesses': 0}}}
+        record = {'op': 'guess_made', 'room': 'r', 'player': 'P', 'correct': True, 'score': 25,
+                  'total_guesses': 3, 'history': {'round_number': 1, 'winner': 'P'}}
+        apply_journal_record(rooms_data, record)
+        apply_journal_record(rooms_data, record)
+
+        self.assertEqual(rooms_data['r']['scores'], {'P': 25})
+        self.assertEqual(len(rooms_data['r']['game_history']), 1)
+        self.assertEqual(rooms_data['r']['current_round']['winner'], 'P')
+
+if __name__ == '__main__':
+    unittest.main()
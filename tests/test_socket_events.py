@@ -52,7 +52,7 @@ class TestSocketEvents(unittest.TestCase):
             on_connect()
             
             # Kiểm tra emit đã được gọi
-            mock_emit.assert_called_once_with('connected', {'sid': 'test_sid_123'})
+            mock_emit.assert_called_once_with('connected', {'sid': 'test_sid_123', 'wire': 'json'})
     
     @patch('server.game_manager.leave_room')
     def test_disconnect_event(self, mock_leave_room):
@@ -173,6 +173,24 @@ class TestSocketEvents(unittest.TestCase):
             self.assertIn('message', call_args[1])
             self.assertIn('details', call_args[1])
     
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_correct_guess_scoreboard_keeps_scores(self, mock_socketio_emit, mock_emit):
+        """scoreboard_updated vẫn gửi top N 'scores' cho client cũ bên cạnh delta 'changes'"""
+        room = game_manager.create_room("test_room_scores", "Test Room")
+        game_manager.join_room("test_room_scores", "TestPlayer", "test_sid_123")
+
+        with patch('server.request') as mock_request:
+            mock_request.sid = "test_sid_123"
+            from server import on_make_guess
+            on_make_guess({'room_id': "test_room_scores", 'guess': room.current_round.number})
+
+        updates = [c.args[1] for c in mock_socketio_emit.call_args_list if c.args[0] == 'scoreboard_updated']
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0]['scores'], room.scores.as_dict(10))
+        self.assertIn('TestPlayer', updates[0]['scores'])
+        self.assertIn('changes', updates[0])
+
     @patch('server.emit')
     def test_make_guess_invalid_number(self, mock_emit):
         """Test đoán số với số không hợp lệ"""
@@ -223,6 +241,31 @@ class TestSocketEvents(unittest.TestCase):
             self.assertEqual(call_args[1]['message'], 'Hello World!')
             self.assertEqual(call_args[1]['player_name'], 'TestPlayer')
     
+    @patch('server.join_room')
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_chat_and_reset_with_other_casing(self, mock_socketio_emit, mock_emit, mock_join_room):
+        """Test chat/reset gửi room_id khác hoa thường vẫn tới Socket.IO room đã tham gia"""
+        game_manager.create_room("test_Case_Room", "Test Room")
+
+        with patch('server.request') as mock_request:
+            mock_request.sid = "test_sid_123"
+            from server import on_join_room, on_chat_legacy, on_reset_room
+            on_join_room({'room_id': 'TEST_CASE_ROOM', 'player_name': 'TestPlayer'})
+            mock_join_room.assert_any_call('test_Case_Room')
+
+            mock_socketio_emit.reset_mock()
+            on_chat_legacy({'room': 'TEST_CASE_ROOM', 'text': 'Hello World!'})
+            chat = mock_socketio_emit.call_args
+            self.assertEqual(chat.args[0], 'chat_message')
+            self.assertEqual(chat.args[1]['room_id'], 'test_Case_Room')
+            self.assertEqual(chat.kwargs['to'], 'test_Case_Room')
+
+            mock_socketio_emit.reset_mock()
+            on_reset_room({'room_id': 'test_case_room'})
+            resets = [c for c in mock_socketio_emit.call_args_list if c.args[0] == 'room_reset']
+            self.assertEqual([c.kwargs['to'] for c in resets], ['test_Case_Room'])
+
     @patch('server.emit')
     @patch('server.socketio.emit')
     def test_reset_room_success(self, mock_socketio_emit, mock_emit):
@@ -292,6 +335,27 @@ class TestSocketEvents(unittest.TestCase):
             self.assertEqual(call_args[1]['id'], room_id)
             self.assertEqual(call_args[1]['name'], 'Test Room')
     
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_get_room_info_since_seq_returns_deltas(self, mock_socketio_emit, mock_emit):
+        """Test client gửi since_seq chỉ nhận các delta còn thiếu"""
+        room_id = "test_room_123"
+        room = game_manager.create_room(room_id, "Test Room")
+        game_manager.join_room(room_id, "TestPlayer", "test_sid_123")
+        seq = room.state_seq
+        game_manager.join_room(room_id, "OtherPlayer", "test_sid_456")
+
+        with patch('server.request') as mock_request:
+            mock_request.sid = "test_sid_123"
+            from server import on_get_room_info
+            on_get_room_info({'room_id': room_id, 'since_seq': seq, 'epoch': room.state_epoch})
+
+            event, payload = mock_emit.call_args[0]
+            self.assertEqual(event, 'room_info')
+            self.assertEqual(payload['seq'], seq + 1)
+            self.assertEqual([c['joined'] for c in payload['changes']], [['OtherPlayer']])
+            self.assertNotIn('players', payload)
+
     @patch('server.emit')
     def test_get_room_info_not_exists(self, mock_emit):
         """Test lấy thông tin phòng không tồn tại"""
@@ -338,6 +402,87 @@ class TestSocketEvents(unittest.TestCase):
             self.assertIn("public_room", room_ids)
             self.assertNotIn("private_room", room_ids)
 
+    @patch('server.emit')
+    def test_get_available_rooms_not_modified(self, mock_emit):
+        """Test client đã có version mới nhất chỉ nhận lại version"""
+        game_manager.create_room("public_room", "Public Room")
+
+        from server import on_get_available_rooms
+        on_get_available_rooms()
+        version = mock_emit.call_args[0][1]['version']
+
+        on_get_available_rooms({'version': version})
+        mock_emit.assert_called_with('available_rooms', {'version': version, 'not_modified': True})
+
+        on_get_available_rooms({'version': version - 1})
+        self.assertIn('rooms', mock_emit.call_args[0][1])
+
+class TestLegacyProtocol(unittest.TestCase):
+    """Event cũ chỉ gửi tới client dùng giao thức cũ, qua nhóm legacy:<room>"""
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.request_context = app.test_request_context()
+        self.request_context.push()
+        game_manager.rooms.clear()
+        game_manager.player_rooms.clear()
+        self.room = game_manager.create_room("test_legacy", "Legacy Room")
+
+    def tearDown(self):
+        import server
+        server.legacy_clients.clear()
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+        self.request_context.pop()
+        self.app_context.pop()
+
+    @patch('server.join_room')
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_modern_client_gets_no_legacy_frames(self, mock_socketio_emit, mock_emit, mock_join_room):
+        from server import on_join_room, on_make_guess
+        with patch('server.request') as mock_request:
+            mock_request.sid = "modern_sid"
+            on_join_room({'room_id': 'test_legacy', 'player_name': 'Modern'})
+            on_make_guess({'room_id': 'test_legacy', 'guess': self.room.current_round.number})
+
+        mock_join_room.assert_called_once_with('test_legacy')
+        events = [(c.args[0], c.kwargs.get('to')) for c in mock_socketio_emit.call_args_list]
+        self.assertNotIn('message', [event for event, _ in events])
+        # Event 'round' của vòng mới: một emit tới nhóm legacy, không tới cả phòng
+        self.assertIn(('round', 'legacy:test_legacy'), events)
+        self.assertIn(('new_round', 'test_legacy'), events)
+
+    @patch('server.join_room')
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_legacy_client_joins_legacy_group(self, mock_socketio_emit, mock_emit, mock_join_room):
+        from server import on_join_legacy, on_guess_legacy
+        with patch('server.request') as mock_request:
+            mock_request.sid = "legacy_sid"
+            on_join_legacy({'room': 'test_legacy', 'name': 'Oldie'})
+            on_guess_legacy({'room': 'test_legacy', 'number': 1 if self.room.current_round.number != 1 else 2})
+
+        self.assertEqual([c.args[0] for c in mock_join_room.call_args_list],
+                         ['test_legacy', 'legacy:test_legacy'])
+        messages = [c for c in mock_socketio_emit.call_args_list if c.args[0] == 'message']
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].kwargs['to'], 'legacy_sid')
+
+    @patch('server.join_room')
+    @patch('server.emit')
+    def test_handshake_flag_marks_legacy_client(self, mock_emit, mock_join_room):
+        import server
+        with patch('server.request') as mock_request:
+            mock_request.sid = "handshake_sid"
+            server.on_connect({'protocol': 'legacy'})
+            self.assertIn("handshake_sid", server.legacy_clients)
+            server.on_disconnect()
+        self.assertNotIn("handshake_sid", server.legacy_clients)
+
+
 class TestAPIRoutes(unittest.TestCase):
     def setUp(self):
         """Khởi tạo test environment"""
@@ -409,6 +554,64 @@ class TestAPIRoutes(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(data['error'], 'Phòng không tồn tại')
     
+    def test_room_leaderboard_api(self):
+        """Test API bảng xếp hạng của phòng"""
+        room = game_manager.create_room("test_room_1", "Room 1")
+        room.scores.update({"A": 30, "B": 20, "C": 10})
+
+        response = self.app.get('/api/rooms/test_room_1/leaderboard?limit=1&player=C&radius=1')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['leaderboard'], [{'name': 'A', 'score': 30, 'rank': 1}])
+        self.assertEqual(data['player_rank']['rank'], 3)
+        self.assertEqual([entry['name'] for entry in data['around']], ["B", "C"])
+
+        response = self.app.get('/api/rooms/non_existent_room/leaderboard')
+        self.assertEqual(response.status_code, 404)
+
+    def test_global_leaderboard_api(self):
+        """Test API bảng xếp hạng chung"""
+        game_manager.global_leaderboard.load({"A": 50, "B": 20})
+
+        response = self.app.get('/api/leaderboard?limit=1&player=B')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['leaderboard'], [{'name': 'A', 'score': 50, 'rank': 1}])
+        self.assertEqual(data['total_players'], 2)
+        self.assertEqual(data['player'], {'name': 'B', 'score': 20, 'rank': 2, 'percentile': 50.0})
+        game_manager.global_leaderboard.load({})
+
+    def test_stats_api(self):
+        """Test API số liệu lớp lưu trữ"""
+        game_manager.create_room("test_room_1", "Room 1")
+
+        response = self.app.get('/api/stats')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['rooms'], 1)
+        self.assertIn('writer', data['persistence'])
+        self.assertIn('blocked_submits', data['persistence']['writer'])
+
+    def test_get_rooms_api_not_modified(self):
+        """Test API danh sách phòng trả 304 khi client đã có version hiện tại"""
+        game_manager.create_room("test_room_1", "Room 1")
+
+        response = self.app.get('/api/rooms')
+        etag = response.headers['ETag']
+        self.assertEqual(json.loads(response.data)['version'], game_manager.directory.version)
+
+        response = self.app.get('/api/rooms', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        game_manager.create_room("test_room_2", "Room 2")
+        response = self.app.get('/api/rooms', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data)['total'], 2)
+
     def test_create_room_api_success(self):
         """Test API tạo phòng thành công"""
         data = {
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Test các backend lưu trữ phòng cho Guess Number Game Server
+"""
+
+import unittest
+import sys
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+# Thêm server directory vào path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from server import GameManager, GAME_CONFIG
+from storage import (JsonFileStorage, PartialWriteError, ShardedJsonStorage, SQLiteStorage,
+                     create_storage_backend, convert_snapshot)
+import codec
+import storage
+
+def make_room_dict(room_id, scores=None, history=None):
+    """Tạo dict phòng tối thiểu như GameManager._room_to_dict"""
+    return {
+        'id': room_id,
+        'name': f"Room {room_id}",
+        'created_at': 1000.0,
+        'current_round': None,
+        'scores': scores or {},
+        'round_number': len(history or []) + 1,
+        'is_active': True,
+        'max_players': 10,
+        'password': None,
+        'is_private': False,
+        'game_history': history or [],
+        'last_activity': 1000.0
+    }
+
+def make_history(round_number, winner="Player"):
+    return {'round_number': round_number, 'number': 42, 'winner': winner,
+            'total_guesses': 3, 'duration': 5.0}
+
+class BackendContract:
+    """Các test chung mà mọi backend phải thỏa mãn"""
+
+    def create_backend(self, data_file):
+        raise NotImplementedError
+
+    def setUp(self):
+        """Tạo backend trong thư mục tạm"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = Path(self.tmp_dir) / 'game_data.json'
+        self.backend = self.create_backend(self.data_file)
+
+    def tearDown(self):
+        """Dọn dẹp file tạm"""
+        self.backend.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def reopen(self):
+        self.backend.close()
+        self.backend = self.create_backend(self.data_file)
+        return self.backend.load_all()
+
+    def test_empty_backend_loads_nothing(self):
+        """Test backend mới không có phòng nào"""
+        self.assertFalse(self.backend.exists())
+        self.assertEqual(self.backend.load_all(), ({}, 0))
+
+    def test_upsert_and_delete_roundtrip(self):
+        """Test ghi, cập nhật và xóa phòng qua commit"""
+        self.backend.load_all()
+        self.backend.upsert_room("a", make_room_dict("a", {"P": 10}))
+        self.backend.upsert_room("b", make_room_dict("b"))
+        self.backend.commit(journal_seq=5)
+
+        rooms_data, journal_seq = self.reopen()
+        self.assertEqual(set(rooms_data), {"a", "b"})
+        self.assertEqual(rooms_data["a"]["scores"], {"P": 10})
+        self.assertEqual(journal_seq, 5)
+
+        self.backend.upsert_room("a", make_room_dict("a", {"P": 35}))
+        self.backend.delete_room("b")
+        self.backend.commit()
+
+        rooms_data, _ = self.reopen()
+        self.assertEqual(set(rooms_data), {"a"})
+        self.assertEqual(self.backend.load_room("a")["scores"], {"P": 35})
+
+    def test_uncommitted_changes_are_not_visible(self):
+        """Test thay đổi chưa commit không được lưu"""
+        self.backend.load_all()
+        self.backend.upsert_room("a", make_room_dict("a"))
+        rooms_data, _ = self.reopen()
+        self.assertEqual(rooms_data, {})
+
+    def test_global_scores_roundtrip(self):
+        """Test điểm bảng xếp hạng chung được ghi cùng lô và chỉ cập nhật tên đã đổi"""
+        self.backend.load_all()
+        self.backend.write({"a": make_room_dict("a")}, [], global_scores={"P": 10, "Q": 3})
+        self.reopen()
+        self.assertEqual(self.backend.load_global_scores(), {"P": 10, "Q": 3})
+
+        self.backend.write({}, [], global_scores={"Q": 40})
+        self.reopen()
+        self.assertEqual(self.backend.load_global_scores(), {"P": 10, "Q": 40})
+
+    def test_migrates_legacy_game_data(self):
+        """Test đọc game_data.json định dạng cũ khi backend chưa có dữ liệu"""
+        self.backend.close()
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump({"a": make_room_dict("a", {"P": 5}, [make_history(1)])}, f)
+        self.backend = self.create_backend(self.data_file)
+
+        rooms_data, _ = self.backend.load_all()
+        self.assertEqual(rooms_data["a"]["scores"], {"P": 5})
+        self.assertEqual(len(rooms_data["a"]["game_history"]), 1)
+
+class IndexContract:
+    """Backend có index nhẹ cho lazy hydration"""
+
+    def test_load_index_without_room_data(self):
+        """Test index chứa tóm tắt phòng, load_room đọc dữ liệu đầy đủ"""
+        self.backend.load_all()
+        self.backend.write({"a": make_room_dict("a", {"P": 10}, [make_history(1)])}, [])
+
+        self.backend.close()
+        self.backend = self.create_backend(self.data_file)
+        index, _ = self.backend.load_index()
+        self.assertEqual(index["a"]["name"], "Room a")
+        self.assertNotIn("scores", index["a"])
+        self.assertEqual(self.backend.load_room("a")["scores"], {"P": 10})
+
+class TestJsonFileStorage(BackendContract, unittest.TestCase):
+    def create_backend(self, data_file):
+        return JsonFileStorage(data_file)
+
+class TestShardedJsonStorage(BackendContract, IndexContract, unittest.TestCase):
+    def create_backend(self, data_file):
+        return create_storage_backend('sharded', data_file)
+
+    def test_manifest_without_index_falls_back(self):
+        """Test manifest cũ (chưa có index) thì phải load đầy đủ, lần ghi sau bổ sung index"""
+        self.backend.write({"a": make_room_dict("a"), "b": make_room_dict("b")}, [])
+        manifest = json.loads(self.backend.manifest_path.read_text(encoding='utf-8'))
+        del manifest['index']
+        self.backend.manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+
+        self.backend = self.create_backend(self.data_file)
+        self.assertIsNone(self.backend.load_index())
+        self.backend.load_all()
+        self.backend.write({"a": make_room_dict("a", {"P": 1})}, [])
+        self.assertEqual(set(self.backend.load_index()[0]), {"a", "b"})
+
+    def test_commit_writes_only_changed_shards(self):
+        """Test commit chỉ ghi shard của phòng được upsert"""
+        self.backend.write({"a": make_room_dict("a"), "b": make_room_dict("b")}, [])
+        shard_b = self.backend.directory / ShardedJsonStorage.shard_name("b")
+        mtime_b = shard_b.stat().st_mtime_ns
+
+        self.backend.write({"a": make_room_dict("a", {"P": 1})}, [])
+        self.assertEqual(shard_b.stat().st_mtime_ns, mtime_b)
+
+    def test_long_unicode_room_ids_get_bounded_names(self):
+        """Test room_id tiếng Việt/CJK dài vẫn có tên file ngắn, id thật nằm trong manifest"""
+        long_ids = ["phòng " * 5, "数字猜谜游戏房间" * 4, "Phòng vui", "phòng vui"]
+        self.backend.write({room_id: make_room_dict(room_id) for room_id in long_ids}, [])
+
+        names = [name for name in os.listdir(self.backend.directory) if name != 'manifest.json']
+        self.assertEqual(len(set(names)), len(long_ids))
+        for name in names:
+            self.assertLessEqual(len(name.encode('utf-8')), 80)
+        self.assertTrue(ShardedJsonStorage.shard_name("Phòng vui").startswith("Phong_vui~"))
+        self.assertEqual(ShardedJsonStorage.shard_name("room-1"), "room-1.json")
+
+        rooms_data, _ = self.reopen()
+        self.assertEqual(set(rooms_data), set(long_ids))
+
+    def test_room_named_manifest_keeps_manifest(self):
+        """Test phòng tên 'manifest' không ghi đè manifest.json, xóa phòng không làm mất các phòng khác"""
+        self.backend.write({"manifest": make_room_dict("manifest", {"P": 3}), "Manifest": make_room_dict("Manifest"),
+                            "a": make_room_dict("a")}, [])
+        self.assertNotEqual(ShardedJsonStorage.shard_name("manifest"), "manifest.json")
+        self.assertNotEqual(ShardedJsonStorage.shard_name("Manifest").lower(), "manifest.json")
+
+        rooms_data, _ = self.reopen()
+        self.assertEqual(set(rooms_data), {"manifest", "Manifest", "a"})
+        self.assertEqual(self.backend.load_room("manifest")["scores"], {"P": 3})
+
+        self.backend.write({}, ["manifest", "Manifest"])
+        rooms_data, _ = self.reopen()
+        self.assertEqual(set(rooms_data), {"a"})
+
+    def test_failed_room_does_not_block_others(self):
+        """Test một shard ghi lỗi không chặn các phòng khác, manifest giữ journal_seq cũ"""
+        self.backend.write({"a": make_room_dict("a"), "b": make_room_dict("b")}, [], journal_seq=5)
+        original = storage._atomic_write_snapshot
+
+        def failing_write(path, data, snapshot_format, indent=None):
+            if path.name.startswith('a.'):
+                raise OSError(36, 'File name too long')
+            original(path, data, snapshot_format, indent)
+
+        with patch.object(storage, '_atomic_write_snapshot', failing_write):
+            with self.assertRaises(PartialWriteError) as ctx:
+                self.backend.write({"a": make_room_dict("a", {"P": 1}), "b": make_room_dict("b", {"P": 2})},
+                                   [], journal_seq=9)
+        self.assertEqual(ctx.exception.failed_rooms, {"a"})
+
+        rooms_data, journal_seq = self.reopen()
+        self.assertEqual(journal_seq, 5)
+        self.assertEqual(rooms_data["a"]["scores"], {})
+        self.assertEqual(rooms_data["b"]["scores"], {"P": 2})
+
+        # Lần ghi sau thành công thì manifest tiến tới journal_seq mới
+        self.backend.write({"a": make_room_dict("a", {"P": 1})}, [], journal_seq=9)
+        rooms_data, journal_seq = self.reopen()
+        self.assertEqual(journal_seq, 9)
+        self.assertEqual(rooms_data["a"]["scores"], {"P": 1})
+
+class TestJsonFileBinaryStorage(BackendContract, unittest.TestCase):
+    def create_backend(self, data_file):
+        return create_storage_backend('json', data_file, snapshot_format='binary')
+
+class TestShardedBinaryStorage(BackendContract, unittest.TestCase):
+    def create_backend(self, data_file):
+        return create_storage_backend('sharded', data_file, snapshot_format='binary')
+
+    def test_switching_format_replaces_old_shard(self):
+        """Test đổi định dạng thì shard cũ bị thay và vẫn đọc được shard chưa chuyển"""
+        json_backend = create_storage_backend('sharded', self.data_file)
+        json_backend.write({"a": make_room_dict("a"), "b": make_room_dict("b")}, [])
+
+        rooms_data, _ = self.backend.load_all()
+        self.assertEqual(set(rooms_data), {"a", "b"})
+        self.backend.write({"a": make_room_dict("a", {"P": 3})}, [])
+
+        self.assertEqual(sorted(os.listdir(self.backend.directory)), ['a.bin', 'b.json', 'manifest.json'])
+        rooms_data, _ = self.reopen()
+        self.assertEqual(rooms_data["a"]["scores"], {"P": 3})
+
+class TestSnapshotCodec(unittest.TestCase):
+    """Test định dạng snapshot nhị phân"""
+
+    def sample(self):
+        history = [make_history(i, winner="Người chơi") for i in range(1, 11)]
+        return {'version': 2, 'rooms': {"phòng vui": make_room_dict("phòng vui", {"An": 125, "Bình": -5}, history)},
+                'big': 2 ** 40, 'neg': -(2 ** 40), 'ratio': 0.25, 'items': list(range(40)), 'flag': False}
+
+    def test_pure_python_roundtrip(self):
+        """Test bộ mã hóa thuần Python (khi chưa cài msgpack)"""
+        with patch.object(codec, 'msgpack', None):
+            data = codec.encode_snapshot(self.sample())
+            self.assertTrue(codec.is_binary_snapshot(data))
+            self.assertEqual(codec.decode_snapshot(data), self.sample())
+
+    def test_uncompressed_roundtrip(self):
+        """Test snapshot không nén"""
+        data = codec.encode_snapshot(self.sample(), compress=False)
+        self.assertEqual(data[len(codec.MAGIC)], 0)
+        self.assertEqual(codec.decode_snapshot(data), self.sample())
+
+    def test_truncated_payload_rejected(self):
+        """Test snapshot bị cắt cụt báo lỗi rõ ràng"""
+        data = codec.encode_snapshot(self.sample(), compress=False)
+        with patch.object(codec, 'msgpack', None):
+            with self.assertRaises(codec.SnapshotFormatError):
+                codec.decode_snapshot(data[:-3])
+
+    def test_convert_snapshot_file_is_smaller(self):
+        """Test chuyển game_data.json sang nhị phân nhỏ hơn nhiều và đọc lại được"""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            data_file = Path(tmp_dir) / 'game_data.json'
+            backend = JsonFileStorage(data_file)
+            for i in range(50):
+                history = [make_history(r) for r in range(1, 11)]
+                backend.upsert_room(f"room_{i}", make_room_dict(f"room_{i}", {f"Player{j}": j * 10 for j in range(8)}, history))
+            backend.commit(journal_seq=7)
+
+            rooms, before, after = convert_snapshot(data_file, 'binary')
+            self.assertEqual(rooms, 50)
+            self.assertLess(after * 3, before)
+
+            rooms_data, journal_seq = JsonFileStorage(data_file).load_all()
+            self.assertEqual(len(rooms_data), 50)
+            self.assertEqual(journal_seq, 7)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+class TestSQLiteStorage(BackendContract, IndexContract, unittest.TestCase):
+    def create_backend(self, data_file):
+        return create_storage_backend('sqlite', data_file)
+
+    def test_uses_wal_mode(self):
+        """Test database chạy ở chế độ WAL"""
+        mode = self.backend._conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode.lower(), 'wal')
+
+    def test_history_keeps_more_than_ten_rounds(self):
+        """Test bảng game_history giữ toàn bộ lịch sử, room_dict chỉ nhận 10 vòng gần nhất"""
+        self.backend.upsert_room("a", make_room_dict("a", {"P": 1}, [make_history(1)]))
+        for round_number in range(1, 16):
+            self.backend.append_history("a", make_history(round_number))
+        self.backend.commit()
+
+        rooms_data, _ = self.reopen()
+        self.assertEqual(len(rooms_data["a"]["game_history"]), 10)
+        self.assertEqual(rooms_data["a"]["game_history"][-1]["round_number"], 15)
+
+        history = self.backend.load_history("a", limit=50)
+        self.assertEqual(len(history), 15)
+        self.assertEqual(history[0]["round_number"], 15)
+
+    def test_reset_room_clears_scores_and_history(self):
+        """Test upsert phòng đã reset xóa điểm và lịch sử cũ"""
+        self.backend.upsert_room("a", make_room_dict("a", {"P": 10, "Q": 5}, [make_history(1)]))
+        self.backend.append_history("a", make_history(1))
+        self.backend.commit()
+
+        self.backend.upsert_room("a", make_room_dict("a"))
+        self.backend.commit()
+
+        self.assertEqual(self.backend.top_scores("a"), [])
+        self.assertEqual(self.backend.load_history("a"), [])
+
+    def test_top_scores_ordered(self):
+        """Test truy vấn bảng xếp hạng theo index"""
+        self.backend.upsert_room("a", make_room_dict("a", {"P": 10, "Q": 30, "R": 20}))
+        self.backend.commit()
+        self.assertEqual(self.backend.top_scores("a", limit=2), [("Q", 30), ("R", 20)])
+
+    def test_legacy_history_imported_on_first_write(self):
+        """Test lần ghi đầu sau chuyển đổi đưa game_history cũ vào bảng"""
+        self.backend.close()
+        history = [make_history(1), make_history(2)]
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump({"a": make_room_dict("a", {"P": 5}, history)}, f)
+        self.backend = self.create_backend(self.data_file)
+
+        rooms_data, _ = self.backend.load_all()
+        self.assertTrue(self.backend.migrated)
+        self.backend.write(rooms_data, [])
+        self.assertFalse(self.backend.migrated)
+        self.assertEqual(len(self.backend.load_history("a")), 2)
+
+    def test_failed_batch_rolls_back_and_retry_does_not_duplicate_history(self):
+        """Test lô lỗi giữa chừng được ROLLBACK, ghi lại lô đó không nhân đôi lịch sử"""
+        self.backend.write({"a": make_room_dict("a", {"P": 1}, [make_history(1)])}, [])
+        room = make_room_dict("a", {"P": 2}, [make_history(1), make_history(2)])
+
+        self.backend.append_history("a", make_history(2))
+        with self.assertRaises(TypeError):
+            self.backend.write({"a": dict(room, bad=object())}, [])
+        self.assertFalse(self.backend._in_transaction)
+
+        # Lô được thử lại từ đầu (như _requeue_batch)
+        self.backend.append_history("a", make_history(2))
+        self.backend.write({"a": room}, [])
+        self.assertEqual([h["round_number"] for h in self.backend.load_history("a")], [2])
+        self.assertEqual(self.backend.top_scores("a"), [("P", 2)])
+
+        # Ghi lại cùng vòng một lần nữa cũng không thêm dòng
+        self.backend.append_history("a", make_history(2, winner="Q"))
+        self.backend.commit()
+        history = self.backend.load_history("a")
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["winner"], "Q")
+
+    def test_duplicate_history_rows_removed_on_open(self):
+        """Test database cũ có dòng lịch sử trùng (từ lô ghi lại trước đây) được dọn khi mở"""
+        self.backend.close()
+        conn = sqlite3.connect(str(self.backend.path))
+        conn.execute('DROP INDEX idx_history_round')
+        for _ in range(3):
+            conn.execute("INSERT INTO game_history (room_id, round_number, number, winner, total_guesses, "
+                         "duration, created_at) VALUES ('a', 1, 42, 'P', 3, 5.0, 0)")
+        conn.commit()
+        conn.close()
+
+        self.backend = self.create_backend(self.data_file)
+        self.assertEqual(len(self.backend.load_history("a")), 1)
+
+    def test_unknown_backend_rejected(self):
+        """Test tên backend không hợp lệ"""
+        with self.assertRaises(ValueError):
+            create_storage_backend('mongo', self.data_file)
+
+class TestGameManagerSQLiteBackend(unittest.TestCase):
+    """Test GameManager dùng backend SQLite"""
+
+    def setUp(self):
+        """Dùng database tạm cho mỗi test"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = Path(self.tmp_dir) / 'game_data.json'
+        self.config_patch = patch.dict(GAME_CONFIG, {'STORAGE_BACKEND': 'sqlite'})
+        self.config_patch.start()
+        self.game_manager = GameManager(persistence_file=self.data_file)
+
+    def tearDown(self):
+        """Dọn dẹp file tạm"""
+        self.game_manager.shutdown()
+        self.config_patch.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_sqlite_backend_skips_journal(self):
+        """Test SQLite ghi trực tiếp theo lô, không dùng journal"""
+        self.assertIsInstance(self.game_manager.storage, SQLiteStorage)
+        self.assertIsNone(self.game_manager.journal)
+
+    def test_rounds_persist_beyond_history_limit(self):
+        """Test lịch sử qua API vượt quá 10 vòng trong bộ nhớ"""
+        room = self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        for _ in range(12):
+            room.players["sid1"].last_guess_at = 0  # bỏ qua giới hạn tốc độ đoán
+            self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.save_rooms_to_file()
+
+        self.assertEqual(len(room.game_history), 10)
+        history = self.game_manager.get_room_history("test_room", limit=50)
+        self.assertEqual(len(history), 12)
+
+        conn = sqlite3.connect(str(self.game_manager.storage.path))
+        try:
+            score = conn.execute("SELECT score FROM scores WHERE room_id = 'test_room' AND player = 'Player'").fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(score, room.scores["Player"])
+
+    def test_reset_and_win_in_one_batch_replaces_history(self):
+        """Test reset rồi thắng vòng mới trong cùng một lô ghi không giữ lại lịch sử trước reset"""
+        room = self.game_manager.create_room("test_room", "Test Room")
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        for _ in range(3):
+            room.players["sid1"].last_guess_at = 0
+            self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.save_rooms_to_file()
+        self.assertEqual(len(self.game_manager.get_room_history("test_room", limit=50)), 3)
+
+        self.game_manager.reset_room("test_room", "sid1")
+        room.players["sid1"].last_guess_at = 0
+        self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.save_rooms_to_file()
+
+        history = self.game_manager.storage.load_history("test_room", limit=50)
+        self.assertEqual([entry["round_number"] for entry in history], [1])
+        self.assertEqual(self.game_manager.storage.top_scores("test_room"), [("Player", room.scores["Player"])])
+
+    def test_restart_restores_rooms(self):
+        """Test khởi động lại đọc phòng từ SQLite"""
+        room = self.game_manager.create_room("test_room", "Test Room", max_players=4)
+        self.game_manager.join_room("test_room", "Player", "sid1")
+        self.game_manager.make_guess("test_room", "sid1", room.current_round.number)
+        self.game_manager.shutdown()
+
+        reloaded = GameManager(persistence_file=self.data_file)
+        try:
+            loaded_room = reloaded.find_room_by_id("test_room")
+            self.assertIsNotNone(loaded_room)
+            self.assertEqual(loaded_room.max_players, 4)
+            self.assertEqual(loaded_room.scores["Player"], room.scores["Player"])
+            self.assertEqual(len(loaded_room.game_history), 1)
+        finally:
+            reloaded.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Thêm server directory vào path để import
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+import server
+from server import app, game_manager
+from codec import unpack
+from wire import WireClients
+
+
+class TestWireClients(unittest.TestCase):
+    def test_negotiate_and_forget(self):
+        clients = WireClients()
+        self.assertEqual(clients.negotiate('sid_a', {'wire': 'msgpack'}), 'msgpack')
+        self.assertEqual(clients.negotiate('sid_b', {'wire': 'protobuf'}), 'json')
+        self.assertEqual(clients.negotiate('sid_c', None), 'json')
+        self.assertTrue(clients.enter('sid_a', 'room_1'))
+        self.assertFalse(clients.enter('sid_b', 'room_1'))
+
+        self.assertEqual(clients.members('room_1'), {'sid_a'})
+        self.assertEqual(clients.members(None), {'sid_a'})
+        self.assertEqual(clients.members('sid_a'), {'sid_a'})
+        self.assertEqual(clients.members('sid_b'), set())
+
+        clients.forget('sid_a')
+        self.assertEqual(len(clients), 0)
+        self.assertEqual(clients.members('room_1'), set())
+
+
+class TestWireHandlers(unittest.TestCase):
+    """Client msgpack và client JSON trong cùng phòng, mỗi bên nhận đúng định dạng"""
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.request_context = app.test_request_context()
+        self.request_context.push()
+        game_manager.rooms.clear()
+        game_manager.player_rooms.clear()
+        self.wire_patch = patch('server.wire_clients', WireClients())
+        self.wire_patch.start()
+
+    def tearDown(self):
+        self.wire_patch.stop()
+        for room_id in list(game_manager.rooms.keys()):
+            if room_id.startswith('test_'):
+                game_manager.delete_room(room_id)
+        self.request_context.pop()
+        self.app_context.pop()
+
+    @patch('server.join_room')
+    @patch('server.emit')
+    @patch('server.socketio.emit')
+    def test_binary_client_gets_msgpack(self, mock_socketio_emit, mock_emit, mock_join_room):
+        room = game_manager.create_room('test_wire', 'Wire Room')
+        with patch('server.request') as mock_request:
+            mock_request.sid = 'sid_bin'
+            server.on_connect({'wire': 'msgpack'})
+            connected = mock_socketio_emit.call_args
+            self.assertEqual(connected.kwargs['to'], 'sid_bin')
+            self.assertEqual(unpack(connected.args[1]), {'sid': 'sid_bin', 'wire': 'msgpack'})
+
+            server.on_join_room({'room_id': 'test_wire', 'player_name': 'Alice'})
+            mock_request.sid = 'sid_json'
+            server.on_connect()
+            server.on_join_room({'room_id': 'test_wire', 'player_name': 'Bob'})
+            mock_emit.assert_any_call('connected', {'sid': 'sid_json', 'wire': 'json'})
+            self.assertIn('wire:test_wire', [c.args[0] for c in mock_join_room.call_args_list])
+
+            mock_socketio_emit.reset_mock()
+            mock_emit.reset_mock()
+            mock_request.sid = 'sid_bin'
+            server.on_make_guess({'room_id': 'test_wire', 'guess': room.current_round.number})
+            server.on_disconnect()
+        self.assertEqual(len(server.wire_clients), 0)
+
+        # guess_result cho người đoán (client nhị phân) đi qua socketio.emit dạng msgpack
+        self.assertNotIn('guess_result', [c.args[0] for c in mock_emit.call_args_list])
+        calls = {(c.args[0], c.kwargs['to']): c for c in mock_socketio_emit.call_args_list}
+        guess = calls[('guess_result', 'sid_bin')]
+        self.assertTrue(unpack(guess.args[1])['details']['correct'])
+
+        # Sự kiện phòng: JSON cho phòng trừ client nhị phân, msgpack cho nhóm wire của phòng
+        json_round = calls[('new_round', 'test_wire')]
+        self.assertEqual(json_round.kwargs['skip_sid'], ['sid_bin'])
+        binary_round = calls[('new_round', 'wire:test_wire')]
+        self.assertEqual(unpack(binary_round.args[1]), json_round.args[1])
+
+
+if __name__ == '__main__':
+    unittest.main()